@@ -0,0 +1,1473 @@
+"""Throughput benchmarks for the tulip http, wsgi and websocket servers.
+
+Usage: python bench.py [--json results.json] [--compare previous.json]
+
+Each scenario starts a server, runs a load against it from the main
+event loop and reports requests/sec, p50/p90/p99 latency and the
+resident set size. Results are printed (and optionally saved) as JSON
+so runs of different commits can be compared with --compare.
+"""
+
+import argparse
+import gc
+import io
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import tulip
+from tulip import test_utils
+
+
+SCENARIOS = {
+    'http': dict(kind='http'),
+    'http-close': dict(kind='http', keep_alive=False),
+    'http-pipeline': dict(kind='http', pipeline=16),
+    'wsgi': dict(kind='wsgi'),
+    'wsgi-pipeline': dict(kind='wsgi', pipeline=16),
+    'wsgi-threads': dict(kind='wsgi-threads'),
+    'wsgi-stream': dict(kind='wsgi_stream', writes=1000, size=64),
+    'wsgi-environ': dict(kind='environ', headers=20),
+    'upload-spool-256m': dict(kind='upload', server='wsgi-spool',
+                              file_size=256 * 2**20),
+    'upload-stream-256m': dict(kind='upload', server='wsgi-threads',
+                               file_size=256 * 2**20),
+    'filters-1': dict(kind='filters', filters=1),
+    'filters-2': dict(kind='filters', filters=2),
+    'filters-3': dict(kind='filters', filters=3),
+    'websocket': dict(kind='websocket'),
+    'routing-10': dict(kind='routing', rules=10),
+    'routing-100': dict(kind='routing', rules=100),
+    'routing-1000': dict(kind='routing', rules=1000),
+    'url-for-500': dict(kind='url_for', links=500),
+    'multipart-1g': dict(kind='multipart', file_size=2**30),
+    'multipart-fields': dict(kind='multipart', fields=5000),
+    'querystring-1000': dict(kind='querystring', params=1000),
+    'urlencoded-1000': dict(kind='querystring', params=1000, body=True),
+    'querystring-1000-lazy': dict(kind='querystring', params=1000, lazy=True),
+    'urlencoded-1000-lazy': dict(kind='querystring', params=1000, body=True,
+                                 lazy=True),
+    'headers-30': dict(kind='headers', headers=30, fields=200),
+    'negotiation': dict(kind='negotiation'),
+    'useragents': dict(kind='useragents'),
+    'http-utils': dict(kind='http_utils'),
+    'bundles-gzip': dict(kind='bundles'),
+    'static-files': dict(kind='static', files=200),
+    'static-304': dict(kind='static', files=200, conditional=True),
+    'video-seek': dict(kind='ranges', file_size=64 * 2**20,
+                       range_size=2**20),
+    'video-seek-multi': dict(kind='ranges', file_size=64 * 2**20,
+                             range_size=64 * 2**10, ranges=8),
+    'video-seek-mmap': dict(kind='ranges', file_size=64 * 2**20,
+                            range_size=64 * 2**10, ranges=8, map_cache=32),
+    'subprocess-cat-1g': dict(kind='subprocess', size=2**30),
+    'tls-handshake': dict(kind='tls', resume=False),
+    'tls-handshake-resume': dict(kind='tls'),
+    'tls-throughput': dict(kind='tls', size=16 * 2**20, keep_alive=True),
+    'client': dict(kind='client'),
+    'client-session': dict(kind='client', session=True, limit_per_host=10),
+    'client-upload-256m': dict(kind='client_upload', size=2**28),
+    'client-upload-256m-nodrain': dict(kind='client_upload', size=2**28,
+                                       drain=False),
+    'udp-recv-batch-1': dict(kind='datagram', batch_size=1),
+    'udp-recv-batch-64': dict(kind='datagram', batch_size=64),
+    'udp-recv-batch-64-proto': dict(kind='datagram', batch_size=64,
+                                    batch_protocol=True),
+    'udp-send': dict(kind='datagram', send=True),
+    'udp-send-many': dict(kind='datagram', send=True, many=True),
+    'client-small-responses': dict(kind='responses', size=256),
+    'client-huge-responses': dict(kind='responses', size=64 * 2**20),
+    'client-huge-chunks': dict(kind='responses', size=64 * 2**20,
+                               chunks=True),
+}
+
+
+class MultipartBody(object):
+    """A readable multipart body with `fields` small form fields and
+    a binary file of `file_size` bytes, generated while it is read."""
+
+    boundary = '---------------------------bench1234567890'
+
+    def __init__(self, fields=0, file_size=0):
+        head = ''.join(
+            '--{0}\r\nContent-Disposition: form-data; name="field{1}"'
+            '\r\n\r\nvalue {1}\r\n'.format(self.boundary, i)
+            for i in range(fields))
+        if file_size:
+            head += ('--{}\r\nContent-Disposition: form-data; name="file"; '
+                     'filename="data.bin"\r\n'
+                     'Content-Type: application/octet-stream\r\n\r\n'
+                     .format(self.boundary))
+        tail = '--{}--\r\n'.format(self.boundary)
+        if file_size:
+            tail = '\r\n' + tail
+
+        self._block = os.urandom(2**20)
+        self._chunks = [tail.encode('ascii'), head.encode('ascii')]
+        self._pending = self._chunks.pop()
+        self._pos = 0
+        self._file_size = file_size
+        self.length = len(head) + file_size + len(tail)
+
+    def read(self, size=2**16):
+        if self._pos == len(self._pending):
+            if self._file_size:
+                self._pending = self._block[:self._file_size]
+                self._file_size -= len(self._pending)
+            elif self._chunks:
+                self._pending = self._chunks.pop()
+            else:
+                return b''
+            self._pos = 0
+        if size is None or size < 0:
+            size = len(self._pending)
+        chunk = self._pending[self._pos:self._pos + size]
+        self._pos += len(chunk)
+        return chunk
+
+    readline = read
+
+
+def multipart_benchmark(name, fields=0, file_size=0, requests=1, **options):
+    """Parse multipart bodies with werkzeug's form parser."""
+    from werkzeug.formparser import MultiPartParser
+
+    latencies = []
+    started = time.time()
+    for i in range(max(requests // 1000, 1)):
+        body = MultipartBody(fields, file_size)
+        t0 = time.time()
+        form, files = MultiPartParser().parse(
+            body, MultipartBody.boundary.encode('ascii'), body.length)
+        for f in files.values():
+            f.close()
+        latencies.append(time.time() - t0)
+    duration = time.time() - started
+
+    result = test_utils.benchmark_result(name, latencies, 0, duration)
+    result['kind'] = 'multipart'
+    result['options'] = dict(options, fields=fields, file_size=file_size)
+    result['throughput'] = round(
+        body.length * len(latencies) / duration / 2**20, 1)
+    return result
+
+
+def routing_benchmark(name, rules, requests=10000, **options):
+    """Match urls against a werkzeug map of `rules` rules
+    spread over a few sections, half of them with converters."""
+    from werkzeug.routing import Map, Rule
+
+    url_map = Map()
+    paths = []
+    for i in range(rules):
+        section = 'section%d' % (i % 10)
+        if i % 2:
+            url_map.add(Rule('/%s/item%d/<int:id>' % (section, i),
+                             endpoint='item%d' % i))
+            paths.append('/%s/item%d/%d' % (section, i, i))
+        else:
+            url_map.add(Rule('/%s/page%d' % (section, i),
+                             endpoint='page%d' % i))
+            paths.append('/%s/page%d' % (section, i))
+    adapter = url_map.bind('localhost')
+    adapter.match(paths[0])
+
+    latencies = []
+    errors = 0
+    started = time.time()
+    for i in range(requests):
+        path = paths[i % len(paths)]
+        t0 = time.time()
+        try:
+            adapter.match(path)
+        except Exception:
+            errors += 1
+        else:
+            latencies.append(time.time() - t0)
+    duration = time.time() - started
+
+    result = test_utils.benchmark_result(name, latencies, errors, duration)
+    result['kind'] = 'routing'
+    result['options'] = dict(options, rules=rules, requests=requests)
+    return result
+
+
+def querystring_benchmark(name, params, body=False, lazy=False,
+                          requests=10000, **options):
+    """Parse a query string (or urlencoded body) of `params` parameters,
+    every third one quoted, and look up two of them per request.  lazy
+    enables the request's lazy_query_parsing."""
+    from werkzeug.test import EnvironBuilder
+    from werkzeug.urls import url_encode
+    from werkzeug.wrappers import Request
+
+    class BenchRequest(Request):
+        lazy_query_parsing = lazy
+
+    data = url_encode(
+        [('param%d' % i, 'value %d/%%' % i if i % 3 else 'value%d' % i)
+         for i in range(params)])
+    if body:
+        builder = EnvironBuilder(
+            method='POST', data=data.encode('ascii'),
+            content_type='application/x-www-form-urlencoded')
+    else:
+        builder = EnvironBuilder(query_string=data)
+    environ = builder.get_environ()
+    payload = environ['wsgi.input'].read()
+
+    requests = max(requests // 10, 10)
+    latencies = []
+    started = time.time()
+    for i in range(requests):
+        environ['wsgi.input'] = io.BytesIO(payload)
+        t0 = time.time()
+        request = BenchRequest(environ)
+        values = request.form if body else request.args
+        values.get('param1')
+        values.get('param%d' % (i % params))
+        latencies.append(time.time() - t0)
+    duration = time.time() - started
+
+    result = test_utils.benchmark_result(name, latencies, 0, duration)
+    result['kind'] = 'querystring'
+    result['options'] = dict(options, params=params, lazy=lazy,
+                             requests=requests)
+    result['throughput'] = round(
+        len(data) * requests / duration / 2**20, 1)
+    return result
+
+
+def headers_benchmark(name, headers, fields, requests=10000, **options):
+    """Build a request with `headers` headers and `fields` form fields
+    and a response with as many headers, look up a few of each.  The
+    memory taken by the headers of a thousand responses is reported as
+    `memory` in bytes per response."""
+    import tracemalloc
+    from werkzeug.datastructures import Headers
+    from werkzeug.test import EnvironBuilder
+    from werkzeug.wrappers import Request
+
+    header_list = [('X-Header-%d' % i, 'value %d' % i)
+                   for i in range(headers)]
+    environ = EnvironBuilder(
+        method='POST', headers=header_list,
+        data=dict(('field%d' % i, 'value %d' % i) for i in range(fields))
+    ).get_environ()
+    payload = environ['wsgi.input'].read()
+    lookups = ['x-header-%d' % i for i in range(0, headers, 3)]
+
+    requests = max(requests // 10, 10)
+    latencies = []
+    started = time.time()
+    for i in range(requests):
+        environ['wsgi.input'] = io.BytesIO(payload)
+        t0 = time.time()
+        request = Request(environ)
+        request.form.get('field%d' % (i % fields))
+        request.headers.get('X-Header-1')
+        response_headers = Headers(header_list)
+        response_headers.set('Content-Type', 'text/plain')
+        for key in lookups:
+            response_headers[key]
+        response_headers.getlist('Set-Cookie')
+        latencies.append(time.time() - t0)
+    duration = time.time() - started
+
+    tracemalloc.start()
+    snapshot = tracemalloc.take_snapshot()
+    kept = [Headers(header_list) for i in range(1000)]
+    for h in kept:
+        h.get('content-type')
+    memory = sum(stat.size_diff for stat in
+                 tracemalloc.take_snapshot().compare_to(snapshot, 'filename'))
+    tracemalloc.stop()
+
+    result = test_utils.benchmark_result(name, latencies, 0, duration)
+    result['kind'] = 'headers'
+    result['options'] = dict(options, headers=headers, fields=fields,
+                             requests=requests)
+    result['memory'] = memory // len(kept)
+    return result
+
+
+NEGOTIATION_HEADERS = [
+    ('Accept', 'text/html,application/xhtml+xml,application/xml;q=0.9,'
+               'image/webp,*/*;q=0.8'),
+    ('Accept-Language', 'en-US,en;q=0.8,de;q=0.6,fr;q=0.4'),
+    ('Accept-Encoding', 'gzip,deflate,sdch'),
+    ('Accept-Charset', 'ISO-8859-1,utf-8;q=0.7,*;q=0.3'),
+    ('Cache-Control', 'max-age=0'),
+    ('If-None-Match', '"abc123", W/"def456"'),
+    ('Range', 'bytes=0-1023'),
+    ('User-Agent', 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_8_4) '
+                   'AppleWebKit/537.36 (KHTML, like Gecko) '
+                   'Chrome/28.0.1500.95 Safari/537.36'),
+]
+
+
+def negotiation_benchmark(name, requests=10000, **options):
+    """Negotiate the content type, language and encoding of a request
+    with browser-like headers and look at its caching headers."""
+    from werkzeug import http
+    from werkzeug.test import EnvironBuilder
+    from werkzeug.wrappers import Request
+
+    environ = EnvironBuilder(headers=NEGOTIATION_HEADERS).get_environ()
+    cache_stats = getattr(http, 'parsed_header_cache', None)
+    if cache_stats is not None:
+        cache_stats.clear()
+
+    latencies = []
+    started = time.time()
+    for i in range(requests):
+        t0 = time.time()
+        request = Request(environ)
+        request.accept_mimetypes.best_match(['application/json',
+                                             'text/html'])
+        request.accept_languages.best_match(['de', 'en'])
+        request.accept_encodings['gzip']
+        request.accept_charsets.best
+        request.cache_control.max_age
+        request.if_none_match.contains('abc123')
+        request.range.range_for_length(4096)
+        request.user_agent.browser
+        latencies.append(time.time() - t0)
+    duration = time.time() - started
+
+    result = test_utils.benchmark_result(name, latencies, 0, duration)
+    result['kind'] = 'negotiation'
+    result['options'] = dict(options, requests=requests)
+    if cache_stats is not None:
+        result['cache'] = cache_stats.stats()
+    return result
+
+
+USER_AGENT_TEMPLATES = [
+    'Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/{0}.0.{1}.{2} Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_8_{2}) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/{0}.0.{1}.{2} Safari/537.36',
+    'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 '
+    '(KHTML, like Gecko) Chrome/{0}.0.{1}.{2} Safari/537.36',
+    'Mozilla/5.0 (Windows NT 6.1; rv:{0}.0) Gecko/20100101 Firefox/{0}.0',
+    'Mozilla/5.0 (X11; Ubuntu; Linux i686; rv:{0}.0) Gecko/20100101 '
+    'Firefox/{0}.{2}',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10.8; rv:{0}.0) '
+    'Gecko/20100101 Firefox/{0}.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_8_{2}) AppleWebKit/536.30.1 '
+    '(KHTML, like Gecko) Version/6.0.{2} Safari/536.30.1',
+    'Mozilla/5.0 (iPhone; CPU iPhone OS 6_1_{2} like Mac OS X) '
+    'AppleWebKit/536.26 (KHTML, like Gecko) Version/6.0 Mobile/10B{1} '
+    'Safari/8536.25',
+    'Mozilla/5.0 (iPad; CPU OS 6_1_{2} like Mac OS X) AppleWebKit/536.26 '
+    '(KHTML, like Gecko) Version/6.0 Mobile/10B{1} Safari/8536.25',
+    'Mozilla/5.0 (Linux; U; Android 4.{2}.1; en-us; Nexus S Build/JRO03E) '
+    'AppleWebKit/534.30 (KHTML, like Gecko) Version/4.0 Mobile '
+    'Safari/534.30',
+    'Mozilla/5.0 (compatible; MSIE {0}.0; Windows NT 6.1; Trident/{2}.0)',
+    'Mozilla/4.0 (compatible; MSIE 8.0; Windows NT 5.1; Trident/4.0; '
+    '.NET CLR 2.0.{1}; .NET CLR 3.{2}.30729)',
+    'Opera/9.80 (Windows NT 6.1; U; de) Presto/2.{2}.{1} Version/{0}.00',
+    'Mozilla/5.0 (compatible; Googlebot/2.{2}; '
+    '+http://www.google.com/bot.html)',
+    'msnbot/2.0b (+http://search.msn.com/msnbot.htm)',
+    'Mozilla/5.0 (compatible; Yahoo! Slurp; '
+    'http://help.yahoo.com/help/us/ysearch/slurp)',
+    'Mozilla/5.0 (X11; U; Linux i686; en-US; rv:1.9.{2}) Gecko/{1} '
+    'Iceweasel/3.0.{2} (Debian-3.0.{2}-1)',
+    'Mozilla/5.0 (compatible; Konqueror/4.{2}; Linux) KHTML/4.{2}.4 '
+    '(like Gecko)',
+    'Lynx/2.8.{2}rel.1 libwww-FM/2.14 SSL-MM/1.4.1 OpenSSL/0.9.8d',
+    'Mozilla/5.0 (X11; U; FreeBSD i386; en-US; rv:1.9.{2}) Gecko/{1} '
+    'SeaMonkey/2.{2}',
+    'curl/7.{0}.{2} (x86_64-pc-linux-gnu) libcurl/7.{0}.{2}',
+    'python-requests/1.{2}.{0} CPython/2.7.{2} Linux/3.{0}.0',
+]
+
+
+def user_agent_corpus(size):
+    """Return `size` different user agent strings built from common
+    browser, crawler and tool user agents."""
+    corpus = []
+    i = 0
+    while len(corpus) < size:
+        for template in USER_AGENT_TEMPLATES:
+            corpus.append(template.format(20 + i % 10, 1000 + i, i % 7))
+        i += 1
+    return corpus[:size]
+
+
+def useragents_benchmark(name, corpus=3000, requests=10000, **options):
+    """Parse a corpus of `corpus` user agent strings, each request
+    parses one of them.  The first pass over the corpus fills the
+    parsed header cache."""
+    from werkzeug.useragents import UserAgent
+
+    agents = user_agent_corpus(corpus)
+    requests = max(requests, corpus)
+    latencies = []
+    started = time.time()
+    for i in range(requests):
+        t0 = time.time()
+        UserAgent(agents[i % corpus]).browser
+        latencies.append(time.time() - t0)
+    duration = time.time() - started
+
+    result = test_utils.benchmark_result(name, latencies, 0, duration)
+    result['kind'] = 'useragents'
+    result['options'] = dict(options, corpus=corpus, requests=requests)
+    t0 = time.time()
+    parser = UserAgent._parser
+    for agent in agents:
+        parser(agent)
+    result['uncached'] = round(len(agents) / (time.time() - t0), 1)
+    return result
+
+
+def http_utils_benchmark(name, requests=10000, **options):
+    """Time the date and cookie helpers of werkzeug.http a response
+    typically goes through.  `per_call` has the microseconds per call of
+    each helper, a request calls each of them once."""
+    from werkzeug import http
+
+    cookie_header = '; '.join('cookie%d=value%d' % (i, i) for i in range(10))
+    calls = [
+        ('http_date', lambda: http.http_date()),
+        ('cookie_date', lambda: http.cookie_date(time.time() + 3600)),
+        ('parse_date', lambda: http.parse_date(
+            'Sun, 06 Nov 1994 08:49:37 GMT')),
+        ('parse_cookie', lambda: http.parse_cookie(cookie_header)),
+        ('dump_cookie', lambda: http.dump_cookie(
+            'session', 'abcdef0123456789', max_age=3600, httponly=True)),
+    ]
+
+    per_call = {}
+    latencies = []
+    started = time.time()
+    for call_name, call in calls:
+        t0 = time.time()
+        for i in range(requests):
+            call()
+        per_call[call_name] = round((time.time() - t0) / requests * 1e6, 2)
+    duration = time.time() - started
+    latencies = [duration / requests] * requests
+
+    result = test_utils.benchmark_result(name, latencies, 0, duration)
+    result['kind'] = 'http_utils'
+    result['options'] = dict(options, requests=requests)
+    result['per_call'] = per_call
+    return result
+
+
+def static_benchmark(name, files, conditional=False, requests=10000,
+                     **options):
+    """Serve `files` small static files through the SharedDataMiddleware,
+    with `conditional` every request revalidates the etag of an earlier
+    response and gets a 304."""
+    import shutil
+    import tempfile
+    from werkzeug.test import create_environ, run_wsgi_app
+    from werkzeug.wsgi import SharedDataMiddleware
+
+    directory = tempfile.mkdtemp()
+    try:
+        for i in range(files):
+            with open(os.path.join(directory, 'file%d.css' % i), 'wb') as fp:
+                fp.write(b'body { color: red }\n' * (i + 1))
+        app = SharedDataMiddleware(None, {'/static': directory})
+
+        etags = {}
+        for i in range(files):
+            path = '/static/file%d.css' % i
+            app_iter, status, headers = run_wsgi_app(app, create_environ(path))
+            b''.join(app_iter)
+            app_iter.close()
+            etags[path] = dict(headers)['Etag']
+
+        environs = []
+        for path, etag in etags.items():
+            environ = create_environ(path, headers={
+                'Accept-Encoding': 'gzip, deflate',
+                'If-None-Match': etag if conditional else ''})
+            environs.append(environ)
+
+        latencies = []
+        started = time.time()
+        for i in range(requests):
+            t0 = time.time()
+            app_iter, status, headers = run_wsgi_app(
+                app, dict(environs[i % files]))
+            b''.join(app_iter)
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+            latencies.append(time.time() - t0)
+        duration = time.time() - started
+    finally:
+        shutil.rmtree(directory)
+
+    result = test_utils.benchmark_result(name, latencies, 0, duration)
+    result['kind'] = 'static'
+    result['options'] = dict(options, files=files, conditional=conditional,
+                             requests=requests)
+    return result
+
+
+# stand-ins for the AngularJS / Polymer bundles of the chat client:
+# (name, content type, size), filled with real javascript
+BUNDLES = [
+    ('angular.js', 'application/javascript', 800 * 1024),
+    ('angular.min.js', 'application/javascript', 100 * 1024),
+    ('polymer.html', 'text/html', 300 * 1024),
+]
+
+
+def bundles_benchmark(loop, name, requests=10000, concurrency=50,
+                      **options):
+    """Serve the BUNDLES with 'wsgi.file_wrapper' from a server with
+    compress and a PrecompressedCache, to clients accepting gzip.
+
+    `cold_stall` is the largest latency of small requests sent one
+    after another while the cache is cold and one request for every
+    bundle waits for it to be filled; it is the time the server's
+    event loop is blocked.  The reported load then requests
+    angular.js from the warm cache."""
+    import shutil
+    import tempfile
+    import tulip.http
+
+    source = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'werkzeug', 'debug', 'shared', 'jquery.js')
+    with open(source, 'rb') as fp:
+        script = fp.read()
+
+    directory = tempfile.mkdtemp()
+    types = {}
+    for filename, content_type, size in BUNDLES:
+        with open(os.path.join(directory, filename), 'wb') as fp:
+            fp.write((script * (size // len(script) + 1))[:size])
+        types['/' + filename] = content_type
+
+    def app(environ, start_response):
+        path = environ['PATH_INFO']
+        if path not in types:
+            start_response('200 OK', [('Content-Type', 'text/plain'),
+                                      ('Content-Length', '4')])
+            return [b'pong']
+        fp = open(os.path.join(directory, path[1:]), 'rb')
+        start_response('200 OK', [
+            ('Content-Type', types[path]),
+            ('Content-Length', str(os.fstat(fp.fileno()).st_size))])
+        return environ['wsgi.file_wrapper'](fp)
+
+    accept = {'Accept-Encoding': 'gzip'}
+    try:
+        with test_utils.run_benchmark_server(
+                loop, 'wsgi-compress', process=True, app=app) as server:
+
+            @tulip.coroutine
+            def fetch(path):
+                resp = yield from tulip.http.request(
+                    'GET', server.url(path), headers=accept)
+                yield from resp.read()
+                resp.close()
+
+            @tulip.coroutine
+            def ping(done):
+                latencies = []
+                while not done.done():
+                    t0 = loop.time()
+                    yield from fetch('/ping')
+                    latencies.append(loop.time() - t0)
+                return latencies
+
+            fetches = tulip.Task(tulip.wait(
+                [tulip.Task(fetch('/' + filename))
+                 for filename, content_type, size in BUNDLES]))
+            pings = tulip.Task(ping(fetches))
+            loop.run_until_complete(fetches)
+            cold_stall = max(loop.run_until_complete(pings))
+
+            started = time.time()
+            latencies, errors = loop.run_until_complete(test_utils.http_load(
+                server.host, server.port, requests=requests // 10,
+                concurrency=concurrency, path='/angular.js',
+                headers=accept.items()))
+            duration = time.time() - started
+            result = test_utils.benchmark_result(
+                name, latencies, errors, duration, pid=server.pid)
+    finally:
+        shutil.rmtree(directory)
+
+    result['kind'] = 'bundles'
+    result['options'] = dict(options, requests=requests // 10,
+                             concurrency=concurrency)
+    result['cold_stall'] = round(cold_stall * 1000, 3)
+    return result
+
+
+def ranges_benchmark(name, file_size, range_size, ranges=1, map_cache=0,
+                     requests=10000, **options):
+    """Seek through a video of `file_size` bytes served by the
+    SharedDataMiddleware like a player does, every request asks for
+    `ranges` byte ranges of `range_size` bytes at random offsets.  With
+    `map_cache` the ranges are sliced from that many cached memory maps.
+    `mbps` is the number of megabytes sent per second."""
+    import random
+    import shutil
+    import tempfile
+    from werkzeug.test import create_environ, run_wsgi_app
+    from werkzeug.wsgi import SharedDataMiddleware, file_map_cache
+
+    directory = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(directory, 'video.mp4'), 'wb') as fp:
+            block = os.urandom(2**20)
+            for i in range(file_size // len(block)):
+                fp.write(block)
+        app = SharedDataMiddleware(None, {'/media': directory})
+        file_map_cache.maxsize = map_cache
+
+        rnd = random.Random(0)
+        environs = []
+        for i in range(100):
+            offsets = sorted(rnd.sample(
+                range(0, file_size - range_size, range_size), ranges))
+            header = 'bytes=' + ','.join(
+                '%d-%d' % (offset, offset + range_size - 1)
+                for offset in offsets)
+            environs.append(create_environ('/media/video.mp4', headers={
+                'Range': header}))
+
+        requests = max(requests // 100, 10)
+        sent = 0
+        latencies = []
+        started = time.time()
+        for i in range(requests):
+            t0 = time.time()
+            app_iter, status, headers = run_wsgi_app(
+                app, dict(environs[i % len(environs)]))
+            for chunk in app_iter:
+                sent += len(chunk)
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+            latencies.append(time.time() - t0)
+        duration = time.time() - started
+    finally:
+        file_map_cache.maxsize = 0
+        file_map_cache.clear()
+        shutil.rmtree(directory)
+
+    result = test_utils.benchmark_result(name, latencies, 0, duration)
+    result['kind'] = 'ranges'
+    result['options'] = dict(options, file_size=file_size,
+                             range_size=range_size, ranges=ranges,
+                             map_cache=map_cache, requests=requests)
+    result['mbps'] = round(sent / duration / 2**20, 1)
+    result['status'] = status
+    return result
+
+
+def subprocess_benchmark(loop, name, size, read_size=2**16,
+                         requests=1, **options):
+    """Pipe `size` bytes through /bin/cat with a subprocess transport,
+    writing with flow control and reading until the child exits.
+    `mbps` is the number of megabytes piped per second."""
+    from tulip.subprocess_transport import create_subprocess
+
+    block = os.urandom(2**20)
+
+    @tulip.coroutine
+    def write(proc):
+        remaining = size
+        while remaining > 0:
+            proc.write(block[:remaining])
+            remaining -= len(block)
+            yield from proc.drain()
+        proc.write_eof()
+
+    @tulip.coroutine
+    def pipe():
+        proc = create_subprocess(['/bin/cat'], read_size=read_size)
+        writer = tulip.Task(write(proc))
+        received = 0
+        while True:
+            data = yield from proc.stdout.read(read_size)
+            if not data:
+                break
+            received += len(data)
+        yield from writer
+        returncode = yield from proc.wait()
+        assert received == size and returncode == 0, (received, returncode)
+
+    latencies = []
+    started = time.time()
+    for i in range(max(requests // 10000, 1)):
+        t0 = time.time()
+        loop.run_until_complete(pipe())
+        latencies.append(time.time() - t0)
+    duration = time.time() - started
+
+    result = test_utils.benchmark_result(name, latencies, 0, duration)
+    result['kind'] = 'subprocess'
+    result['options'] = dict(options, size=size, read_size=read_size)
+    result['mbps'] = round(size * len(latencies) / duration / 2**20, 1)
+    return result
+
+
+class TlsClient(tulip.Protocol):
+    """Client of test_utils.BenchmarkTlsServer."""
+
+    transport = waiter = None
+    remaining = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.remaining -= len(data)
+        if self.remaining <= 0 and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    def connection_lost(self, exc):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_exception(exc or ConnectionError())
+
+    def request(self, size):
+        self.remaining = size
+        self.waiter = tulip.Future()
+        self.transport.write('{}\n'.format(size).encode('ascii'))
+        return self.waiter
+
+
+def tls_benchmark(loop, name, size=1, keep_alive=False, resume=True,
+                  requests=10000, concurrency=50, **options):
+    """Request `size` bytes from a local TLS server with a self-signed
+    certificate.  Without keep_alive each request makes a new connection,
+    which measures handshakes, resume allows session resumption.  With
+    keep_alive the connections are reused, which measures throughput."""
+    latencies = []
+    remaining = [requests // 10 if keep_alive else requests]
+    errors = [0]
+    if not resume:
+        cache_size = loop.ssl_session_cache_size
+        loop.ssl_session_cache_size = 0
+    if keep_alive:
+        remaining[0] = max(requests // 1000, concurrency)
+
+    with test_utils.run_benchmark_server(loop, 'tls') as server:
+
+        @tulip.coroutine
+        def worker():
+            transport = None
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                t0 = loop.time()
+                try:
+                    if transport is None:
+                        transport, proto = yield from loop.create_connection(
+                            TlsClient, server.host, server.port, ssl=True)
+                    yield from proto.request(size)
+                except Exception:
+                    errors[0] += 1
+                    transport = None
+                    continue
+                latencies.append(loop.time() - t0)
+                if not keep_alive:
+                    transport.close()
+                    transport = None
+            if transport is not None:
+                transport.close()
+
+        try:
+            started = time.time()
+            loop.run_until_complete(tulip.wait(
+                [tulip.Task(worker()) for i in range(concurrency)]))
+            duration = time.time() - started
+            # let the server see the connections close before it stops
+            loop.run_until_complete(tulip.sleep(0.1))
+        finally:
+            if not resume:
+                loop.ssl_session_cache_size = cache_size
+
+    result = test_utils.benchmark_result(name, latencies, errors[0], duration)
+    result['kind'] = 'tls'
+    result['options'] = dict(options, size=size, keep_alive=keep_alive,
+                             resume=resume, concurrency=concurrency)
+    result['mbps'] = round(size * len(latencies) / duration / 2**20, 1)
+    return result
+
+
+def client_benchmark(loop, name, session=False, limit_per_host=None,
+                     requests=10000, concurrency=50, **options):
+    """Send requests with tulip.http.request() from `concurrency` tasks,
+    with a new connection per request or through a Session that keeps
+    at most `limit_per_host` connections.  `connections` is the largest
+    number of connections the session had open."""
+    import tulip.http
+
+    if session:
+        session = tulip.http.Session(limit_per_host=limit_per_host)
+    else:
+        session = None
+    latencies = []
+    remaining = [requests // 10]
+    errors = [0]
+    connections = [0]
+
+    with test_utils.run_benchmark_server(loop, 'http') as server:
+        url = server.url()
+
+        @tulip.coroutine
+        def worker():
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                t0 = loop.time()
+                try:
+                    resp = yield from tulip.http.request(
+                        'GET', url, session=session)
+                    yield from resp.read()
+                    resp.close()
+                except Exception:
+                    errors[0] += 1
+                    continue
+                latencies.append(loop.time() - t0)
+                if session is not None:
+                    stats = session.stats()
+                    connections[0] = max(connections[0],
+                                         stats['acquired'] + stats['idle'])
+
+        started = time.time()
+        loop.run_until_complete(tulip.wait(
+            [tulip.Task(worker()) for i in range(concurrency)]))
+        duration = time.time() - started
+        if session is not None:
+            pool = session.stats()
+            session.close()
+            # let the server see the connections close before it stops
+            loop.run_until_complete(tulip.sleep(0.1))
+
+    result = test_utils.benchmark_result(name, latencies, errors[0], duration)
+    result['kind'] = 'client'
+    result['options'] = dict(options, session=bool(session),
+                             limit_per_host=limit_per_host,
+                             requests=requests, concurrency=concurrency)
+    if session is not None:
+        result['pool'] = pool
+        result['connections'] = connections[0]
+    return result
+
+
+def responses_benchmark(loop, name, size, chunks=False, requests=10000,
+                        concurrency=50, **options):
+    """Read responses of `size` bytes with tulip.http.request() while
+    tracemalloc traces the client.  The payload is read with read(), or
+    with read_chunk() and dropped if chunks is true.  `peak_memory` is
+    the largest traced memory during the run, `response_memory` the
+    memory kept alive by one read and closed HttpResponse.  The server
+    runs in a separate process so only the client is traced."""
+    import tulip.http
+
+    data = b'x' * size
+    huge = size > 2**20
+    requests = max(requests // 1000, 3) if huge else max(requests // 10, 1)
+    concurrency = 1 if huge else min(concurrency, requests)
+    latencies = []
+    remaining = [requests]
+    errors = [0]
+
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain'),
+                                  ('Content-Length', str(size))])
+        return [data]
+
+    @tulip.coroutine
+    def fetch(url):
+        resp = yield from tulip.http.request('GET', url)
+        if chunks:
+            while (yield from resp.read_chunk()):
+                pass
+        else:
+            yield from resp.read()
+        resp.close()
+        return resp
+
+    with test_utils.run_benchmark_server(
+            loop, 'wsgi', process=True, app=app) as server:
+        url = server.url()
+        del data
+        # import and warm up everything outside of the traced run
+        loop.run_until_complete(fetch(url))
+
+        @tulip.coroutine
+        def worker():
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                t0 = loop.time()
+                try:
+                    yield from fetch(url)
+                except Exception:
+                    errors[0] += 1
+                    continue
+                latencies.append(loop.time() - t0)
+
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            started = time.time()
+            loop.run_until_complete(tulip.wait(
+                [tulip.Task(worker()) for i in range(concurrency)]))
+            duration = time.time() - started
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+
+            kept = []
+            gc.collect()
+            before = tracemalloc.get_traced_memory()[0]
+            for i in range(min(requests, 100)):
+                kept.append(loop.run_until_complete(fetch(url)))
+            gc.collect()
+            response_memory = (
+                tracemalloc.get_traced_memory()[0] - before) // len(kept)
+            del kept
+        finally:
+            tracemalloc.stop()
+
+    result = test_utils.benchmark_result(name, latencies, errors[0], duration)
+    result['kind'] = 'responses'
+    result['options'] = dict(options, size=size, chunks=chunks,
+                             requests=requests, concurrency=concurrency)
+    result['peak_memory'] = peak
+    result['response_memory'] = response_memory
+    return result
+
+
+def wsgi_stream_benchmark(loop, name, writes, size, process=False,
+                          requests=10000, **options):
+    """Stream chunked WSGI responses made of `writes` yields of `size`
+    bytes each."""
+    data = b'x' * size
+
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        # not a generator, the server would run that as a coroutine
+        return itertools.repeat(data, writes)
+
+    result = test_utils.run_benchmark(
+        loop, name, 'wsgi', process=process, app=app,
+        requests=max(requests // 10, 1), **options)
+    result['kind'] = 'wsgi_stream'
+    result['options'] = dict(result['options'], writes=writes, size=size)
+    result['mbps'] = round(
+        result['rps'] * writes * size / 2**20, 1) if result['rps'] else None
+    return result
+
+
+class NullTransport(object):
+    """A transport that drops written data."""
+
+    def write(self, data):
+        pass
+
+    def writelines(self, list_of_data):
+        pass
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+
+def filters_benchmark(name, filters, writes=1000, size=64, requests=10000,
+                      **options):
+    """Write chunked responses of `writes` chunks of `size` bytes through
+    `filters` stacked chunking filters.  Their chunk size is the write
+    size, so every stage passes each chunk on and the time is the per
+    chunk overhead of the filter pipeline and the chunk writer."""
+    from tulip.http import protocol
+
+    data = b'x' * size
+    latencies = []
+    started = time.time()
+    for i in range(max(requests // 10, 1)):
+        t0 = time.time()
+        response = protocol.Response(NullTransport(), 200)
+        for j in range(filters):
+            response.add_chunking_filter(size)
+        response.send_headers()
+        for j in range(writes):
+            response.write(data)
+        response.write_eof()
+        latencies.append(time.time() - t0)
+    duration = time.time() - started
+
+    result = test_utils.benchmark_result(name, latencies, 0, duration)
+    result['kind'] = 'filters'
+    result['options'] = dict(options, filters=filters, writes=writes,
+                             size=size)
+    result['ns_per_chunk'] = round(
+        duration / len(latencies) / writes * 1e9)
+    return result
+
+
+BROWSER_HEADERS = [
+    ('HOST', 'example.com'),
+    ('USER-AGENT', 'Mozilla/5.0 (X11; Linux x86_64; rv:24.0) '
+                   'Gecko/20100101 Firefox/24.0'),
+    ('ACCEPT', 'text/html,application/xhtml+xml,application/xml;q=0.9,'
+               '*/*;q=0.8'),
+    ('ACCEPT-LANGUAGE', 'en-US,en;q=0.5'),
+    ('ACCEPT-ENCODING', 'gzip, deflate'),
+    ('ACCEPT-CHARSET', 'utf-8'),
+    ('REFERER', 'http://example.com/index.html'),
+    ('COOKIE', 'session=0123456789abcdef; theme=dark'),
+    ('CONNECTION', 'keep-alive'),
+    ('CACHE-CONTROL', 'max-age=0'),
+    ('IF-MODIFIED-SINCE', 'Sat, 01 Jun 2013 10:00:00 GMT'),
+    ('IF-NONE-MATCH', '"5f3a-4dd"'),
+    ('DNT', '1'),
+    ('X-REQUESTED-WITH', 'XMLHttpRequest'),
+    ('X-FORWARDED-FOR', '10.0.0.1, 10.0.0.2'),
+    ('X-FORWARDED-PROTO', 'http'),
+    ('X-REAL-IP', '10.0.0.1'),
+    ('ORIGIN', 'http://example.com'),
+    ('PRAGMA', 'no-cache'),
+    ('VIA', '1.1 proxy'),
+]
+
+
+def environ_benchmark(name, headers, requests=10000, **options):
+    """Create WSGI environs for GET requests with `headers` headers
+    typical of a browser behind a proxy."""
+    import tulip.http
+    from tulip.http import protocol
+
+    message = protocol.RawRequestMessage(
+        'GET', '/path/to/page?a=1&b=2', (1, 1),
+        BROWSER_HEADERS[:headers], False, None)
+    proto = tulip.http.WSGIServerHttpProtocol(None)
+    proto.transport = NullTransport()
+    proto.stream = None
+
+    latencies = []
+    started = time.time()
+    for i in range(requests):
+        t0 = time.time()
+        proto.create_wsgi_environ(message, None)
+        latencies.append(time.time() - t0)
+    duration = time.time() - started
+
+    result = test_utils.benchmark_result(name, latencies, 0, duration)
+    result['kind'] = 'environ'
+    result['options'] = dict(options, headers=headers, requests=requests)
+    return result
+
+
+def upload_app(environ, start_response):
+    from werkzeug.formparser import parse_form_data
+
+    stream, form, files = parse_form_data(environ)
+    for f in files.values():
+        f.close()
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+                              ('Content-Length', '2')])
+    return [b'ok']
+
+
+def upload_benchmark(loop, name, server, file_size, requests=10000,
+                     concurrency=50, **options):
+    """POST multipart uploads with a file of `file_size` bytes to a
+    `server` benchmark server that parses them with werkzeug's form
+    parser, from a spooled ('wsgi-spool') or a streamed
+    ('wsgi-threads') 'wsgi.input'.  The server runs in a separate
+    process, `peak_rss` is its largest resident set size."""
+    headers = [('Content-Type', 'multipart/form-data; boundary={}'.format(
+        MultipartBody.boundary))]
+    requests = max(requests // 1000, 1)
+    concurrency = min(concurrency, 2)
+
+    with test_utils.run_benchmark_server(
+            loop, server, process=True, app=upload_app) as srv:
+        # after the fork, the body is not part of the server's memory
+        body = MultipartBody(file_size=file_size)
+        data = b''.join(iter(lambda: body.read(-1), b''))
+        started = time.time()
+        latencies, errors = loop.run_until_complete(test_utils.http_load(
+            srv.host, srv.port, requests=requests, concurrency=concurrency,
+            method='POST', body=data, headers=headers))
+        duration = time.time() - started
+        result = test_utils.benchmark_result(
+            name, latencies, errors, duration, pid=srv.pid)
+        result['peak_rss'] = test_utils.get_rss(srv.pid, peak=True)
+
+    result['kind'] = 'upload'
+    result['options'] = dict(options, server=server, file_size=file_size,
+                             requests=requests, concurrency=concurrency)
+    result['throughput'] = round(
+        body.length * len(latencies) / duration / 2**20, 1)
+    return result
+
+
+def discard_app(environ, start_response):
+    body = environ['wsgi.input']
+    while body.read(2**16):
+        pass
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+                              ('Content-Length', '2')])
+    return [b'ok']
+
+
+def client_upload_benchmark(loop, name, size, drain=True, requests=10000,
+                            **options):
+    """POST a body of `size` bytes from a generator with
+    tulip.http.request() to a server in a separate process that reads
+    and drops it.  The request body writer waits for the transport to
+    drain, or never does without drain and the whole body ends up in
+    the transport's write buffer.  `peak_memory` is the largest memory
+    traced by tracemalloc in the client during the run."""
+    import tulip.http
+    from tulip.http import client
+
+    chunk_size = client.HttpRequest.chunk_size
+    requests = max(requests // 5000, 1)
+    latencies = []
+    errors = 0
+
+    def body():
+        for i in range(size // chunk_size):
+            # a new chunk each time, like reading a file
+            yield bytes(chunk_size)
+
+    if not drain:
+        buffer_limit = client.HttpRequest.buffer_limit
+        client.HttpRequest.buffer_limit = sys.maxsize
+
+    with test_utils.run_benchmark_server(
+            loop, 'wsgi-threads', process=True, app=discard_app) as server:
+        url = server.url()
+
+        @tulip.coroutine
+        def upload():
+            resp = yield from tulip.http.request('POST', url, data=body())
+            yield from resp.read()
+            resp.close()
+
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            started = time.time()
+            for i in range(requests):
+                t0 = time.time()
+                try:
+                    loop.run_until_complete(upload())
+                except Exception:
+                    errors += 1
+                    continue
+                latencies.append(time.time() - t0)
+            duration = time.time() - started
+            peak = tracemalloc.get_traced_memory()[1] - baseline
+        finally:
+            tracemalloc.stop()
+            if not drain:
+                client.HttpRequest.buffer_limit = buffer_limit
+
+    result = test_utils.benchmark_result(name, latencies, errors, duration)
+    result['kind'] = 'client_upload'
+    result['options'] = dict(options, size=size, drain=drain,
+                             requests=requests)
+    result['peak_memory'] = peak
+    result['throughput'] = round(
+        size * len(latencies) / duration / 2**20, 1) if duration else None
+    return result
+
+
+def udp_blast(address, count, size):
+    """Send `count` datagrams of `size` bytes as fast as possible."""
+    import socket
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    data = b'x' * size
+    for i in range(count):
+        sock.sendto(data, address)
+    sock.close()
+
+
+class DatagramCounter(tulip.DatagramProtocol):
+    """Counts received datagrams."""
+
+    received = 0
+    first = last = None
+
+    def datagram_received(self, data, addr):
+        self.last = time.time()
+        if self.first is None:
+            self.first = self.last
+        self.received += 1
+
+
+class BatchDatagramCounter(DatagramCounter, tulip.BatchDatagramProtocol):
+
+    def datagrams_received(self, datagrams):
+        self.last = time.time()
+        if self.first is None:
+            self.first = self.last
+        self.received += len(datagrams)
+
+
+def datagram_benchmark(loop, name, size=64, batch_size=64,
+                       batch_protocol=False, send=False, many=False,
+                       requests=10000, **options):
+    """Measure datagrams/sec of the selector datagram transport.
+
+    Receive: a separate process sends datagrams of `size` bytes as fast
+    as it can to a transport reading at most `batch_size` datagrams per
+    wakeup (1 reads one datagram per event loop iteration), delivered
+    one at a time or, with batch_protocol, in one datagrams_received()
+    call.  Datagrams the receiver is too slow for are dropped by the
+    kernel and reported as `dropped`.
+
+    Send: the transport sends datagrams to a socket nobody reads, in
+    bursts of 64 with sendto(), or with sendto_many() if many is true.
+    The kernel drops them on the receiving side, which is not measured.
+
+    The reported rps is datagrams per second."""
+    import multiprocessing
+    import socket
+
+    count = requests * 20
+    data = b'x' * size
+    wakeups = None
+
+    if send:
+        sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sink.bind(('127.0.0.1', 0))
+        transport, proto = loop.run_until_complete(
+            loop.create_datagram_endpoint(
+                tulip.DatagramProtocol, remote_addr=sink.getsockname()))
+        burst = [(data, None)] * 64
+
+        @tulip.coroutine
+        def sender():
+            for i in range(count // len(burst)):
+                if many:
+                    transport.sendto_many(burst)
+                else:
+                    for item, addr in burst:
+                        transport.sendto(item)
+                if transport.get_write_buffer_size():
+                    yield from transport.drain()
+
+        try:
+            started = time.time()
+            loop.run_until_complete(sender())
+            duration = time.time() - started
+            stats = transport.get_stats()
+        finally:
+            transport.close()
+            test_utils.run_briefly(loop)
+            sink.close()
+        done = stats['sent']
+        dropped = stats['dropped']
+    else:
+        factory = BatchDatagramCounter if batch_protocol else DatagramCounter
+        transport, proto = loop.run_until_complete(
+            loop.create_datagram_endpoint(
+                factory, local_addr=('127.0.0.1', 0)))
+        transport.batch_size = batch_size
+        proc = multiprocessing.Process(
+            target=udp_blast,
+            args=(transport.get_extra_info('addr'), count, size))
+        try:
+            proc.start()
+            # run until the sender is done and nothing more arrives
+            received = -1
+            while proc.is_alive() or proto.received != received:
+                received = proto.received
+                loop.run_until_complete(tulip.sleep(0.2))
+            proc.join()
+            stats = transport.get_stats()
+        finally:
+            transport.close()
+            test_utils.run_briefly(loop)
+        done = proto.received
+        dropped = count - done
+        duration = (proto.last - proto.first) if done > 1 else 0
+        wakeups = stats['wakeups']
+
+    # one latency entry per datagram, so rps is datagrams per second
+    latencies = [duration / done] * done if done else []
+    result = test_utils.benchmark_result(name, latencies, 0, duration)
+    result['kind'] = 'datagram'
+    result['options'] = dict(options, size=size, batch_size=batch_size,
+                             batch_protocol=batch_protocol, send=send,
+                             many=many, count=count)
+    result['dropped'] = dropped
+    result['wakeups'] = wakeups
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous, threshold):
+    """Return a list of regressions against previous results."""
+    previous = {r['name']: r for r in previous['results']}
+    regressions = []
+    for result in results:
+        old = previous.get(result['name'])
+        if old is None:
+            continue
+
+        if result['rps'] < old['rps'] * (1 - threshold):
+            regressions.append('{}: rps {} -> {}'.format(
+                result['name'], old['rps'], result['rps']))
+        if result['latency']['p99'] > old['latency']['p99'] * (1 + threshold):
+            regressions.append('{}: p99 {}ms -> {}ms'.format(
+                result['name'], old['latency']['p99'],
+                result['latency']['p99']))
+    return regressions
+
+
+def url_for_benchmark(name, links, requests=10000, **options):
+    """Render a flask template with `links` url_for() calls, each
+    request renders the page once."""
+    from flask import Flask, render_template_string
+
+    app = Flask(__name__)
+    for i in range(50):
+        app.add_url_rule('/section/%d/<int:id>' % i, 'item%d' % i,
+                         lambda id: '')
+    template = (
+        '{% for i in range(links) %}'
+        '<a href="{{ url_for("item%d" % (i % 50), id=i) }}">{{ i }}</a>'
+        '{% endfor %}')
+
+    requests = max(requests // links, 10)
+    latencies = []
+    with app.test_request_context('/'):
+        render_template_string(template, links=links)
+
+        started = time.time()
+        for i in range(requests):
+            t0 = time.time()
+            render_template_string(template, links=links)
+            latencies.append(time.time() - t0)
+        duration = time.time() - started
+
+    result = test_utils.benchmark_result(name, latencies, 0, duration)
+    result['kind'] = 'url_for'
+    result['options'] = dict(options, links=links, requests=requests)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        'scenarios', nargs='*', default=sorted(SCENARIOS),
+        help='scenarios to run: {}'.format(', '.join(sorted(SCENARIOS))))
+    parser.add_argument('-n', '--requests', type=int, default=10000)
+    parser.add_argument('-c', '--concurrency', type=int, default=50)
+    parser.add_argument('--process', action='store_true',
+                        help='run servers in a separate process')
+    parser.add_argument('--json', help='save results to this file')
+    parser.add_argument('--compare', help='previous results file')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='allowed relative regression (default: 0.1)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.CRITICAL)
+    loop = tulip.get_event_loop()
+
+    results = []
+    for name in args.scenarios:
+        options = dict(SCENARIOS[name])
+        kind = options.pop('kind')
+        if kind == 'websocket':
+            options['messages'] = args.requests
+        else:
+            options['requests'] = args.requests
+        options['concurrency'] = args.concurrency
+
+        if kind == 'routing':
+            result = routing_benchmark(name, **options)
+        elif kind == 'url_for':
+            result = url_for_benchmark(name, **options)
+        elif kind == 'multipart':
+            result = multipart_benchmark(name, **options)
+        elif kind == 'querystring':
+            result = querystring_benchmark(name, **options)
+        elif kind == 'headers':
+            result = headers_benchmark(name, **options)
+        elif kind == 'negotiation':
+            result = negotiation_benchmark(name, **options)
+        elif kind == 'useragents':
+            result = useragents_benchmark(name, **options)
+        elif kind == 'http_utils':
+            result = http_utils_benchmark(name, **options)
+        elif kind == 'static':
+            result = static_benchmark(name, **options)
+        elif kind == 'bundles':
+            result = bundles_benchmark(loop, name, **options)
+        elif kind == 'ranges':
+            result = ranges_benchmark(name, **options)
+        elif kind == 'subprocess':
+            result = subprocess_benchmark(loop, name, **options)
+        elif kind == 'client':
+            result = client_benchmark(loop, name, **options)
+        elif kind == 'tls':
+            result = tls_benchmark(loop, name, **options)
+        elif kind == 'client_upload':
+            result = client_upload_benchmark(loop, name, **options)
+        elif kind == 'datagram':
+            result = datagram_benchmark(loop, name, **options)
+        elif kind == 'responses':
+            result = responses_benchmark(loop, name, **options)
+        elif kind == 'upload':
+            result = upload_benchmark(loop, name, **options)
+        elif kind == 'environ':
+            result = environ_benchmark(name, **options)
+        elif kind == 'filters':
+            result = filters_benchmark(name, **options)
+        elif kind == 'wsgi_stream':
+            result = wsgi_stream_benchmark(
+                loop, name, process=args.process, **options)
+        else:
+            result = test_utils.run_benchmark(
+                loop, name, kind, process=args.process, **options)
+        results.append(result)
+        print('{name:15} {rps:>10} req/s  p50 {latency[p50]}ms  '
+              'p99 {latency[p99]}ms  errors {errors}'.format(**result),
+              file=sys.stderr)
+
+    report = {
+        'revision': git_revision(),
+        'python': sys.version.split()[0],
+        'results': results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.json:
+        with open(args.json, 'w') as fp:
+            fp.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as fp:
+            regressions = compare(results, json.load(fp), args.threshold)
+        for line in regressions:
+            print('regression: ' + line, file=sys.stderr)
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
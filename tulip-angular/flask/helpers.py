@@ -27,6 +27,8 @@ except ImportError:
 
 from werkzeug.datastructures import Headers
 from werkzeug.exceptions import NotFound
+from werkzeug.http import is_resource_modified, get_byte_ranges
+from werkzeug.utils import get_content_type
 
 # this was moved in 0.7
 try:
@@ -34,6 +36,9 @@ try:
 except ImportError:
     from werkzeug.utils import wrap_file
 
+from werkzeug.wsgi import StaticFile, StaticFileIndex, wrap_file_ranges, \
+     file_map_cache
+
 from jinja2 import FileSystemLoader
 
 from .signals import message_flashed
@@ -53,6 +58,11 @@ _os_alt_seps = list(sep for sep in [os.path.sep, os.path.altsep]
                     if sep not in (None, '/'))
 
 
+# the static file indexes of the static folders, keyed by path.
+_static_file_indexes = {}
+_static_file_indexes_lock = RLock()
+
+
 def _endpoint_from_view_func(view_func):
     """Internal helper that returns the default endpoint for a given
     function.  This always is the function name.
@@ -445,6 +455,12 @@ def send_file(filename_or_fp, mimetype=None, as_attachment=False,
     .. versionchanged:: 0.9
        cache_timeout pulls its default from application config, when None.
 
+    .. versionchanged:: 0.10
+       A :class:`~werkzeug.wsgi.StaticFile` can be passed, its mimetype,
+       size, modification time and content hash are used instead of
+       looking at the file and the file is not opened for a 304 response.
+       Conditional responses for such files answer byte range requests.
+
     :param filename_or_fp: the filename of the file to send.  This is
                            relative to the :attr:`~Flask.root_path` if a
                            relative path is specified.
@@ -453,6 +469,9 @@ def send_file(filename_or_fp, mimetype=None, as_attachment=False,
                            fall back to the traditional method.  Make sure
                            that the file pointer is positioned at the start
                            of data to send before calling :func:`send_file`.
+                           A :class:`~werkzeug.wsgi.StaticFile` from a
+                           :class:`~werkzeug.wsgi.StaticFileIndex` is
+                           accepted as well.
     :param mimetype: the mimetype of the file if provided, otherwise
                      auto detection happens.
     :param as_attachment: set to `True` if you want to send this file with
@@ -468,7 +487,15 @@ def send_file(filename_or_fp, mimetype=None, as_attachment=False,
                           :data:`~flask.current_app`.
     """
     mtime = None
-    if isinstance(filename_or_fp, string_types):
+    status = None
+    static_file = None
+    if isinstance(filename_or_fp, StaticFile):
+        static_file = filename_or_fp
+        filename = static_file.filename
+        file = None
+        if mimetype is None:
+            mimetype = static_file.mimetype
+    elif isinstance(filename_or_fp, string_types):
         filename = filename_or_fp
         file = None
     else:
@@ -509,7 +536,44 @@ def send_file(filename_or_fp, mimetype=None, as_attachment=False,
         headers.add('Content-Disposition', 'attachment',
                     filename=attachment_filename)
 
-    if current_app.use_x_sendfile and filename:
+    if static_file is not None:
+        mtime = static_file.mtime
+        headers['Content-Length'] = static_file.size
+        if current_app.use_x_sendfile:
+            headers['X-Sendfile'] = filename
+            data = None
+        elif conditional and add_etags and \
+             request.method in ('GET', 'HEAD') and \
+             not is_resource_modified(request.environ, static_file.etag,
+                                      last_modified=static_file.last_modified):
+            # the response is turned into a 304 below, no need to open
+            # the file for it.
+            data = None
+        else:
+            ranges = None
+            if conditional and add_etags:
+                headers['Accept-Ranges'] = 'bytes'
+                ranges = get_byte_ranges(request.environ, static_file.size,
+                                         static_file.etag,
+                                         static_file.last_modified)
+            if ranges == []:
+                status = 416
+                headers['Content-Range'] = 'bytes */%d' % static_file.size
+                headers['Content-Length'] = 0
+                data = None
+            elif ranges:
+                status = 206
+                data, range_headers = wrap_file_ranges(
+                    request.environ, open(filename, 'rb'), ranges,
+                    static_file.size, get_content_type(
+                        mimetype, current_app.response_class.charset),
+                    map=file_map_cache.get(static_file))
+                for key, value in range_headers:
+                    headers[key] = value
+                mimetype = None
+            else:
+                data = wrap_file(request.environ, open(filename, 'rb'))
+    elif current_app.use_x_sendfile and filename:
         if file is not None:
             file.close()
         headers['X-Sendfile'] = filename
@@ -522,8 +586,8 @@ def send_file(filename_or_fp, mimetype=None, as_attachment=False,
             headers['Content-Length'] = os.path.getsize(filename)
         data = wrap_file(request.environ, file)
 
-    rv = current_app.response_class(data, mimetype=mimetype, headers=headers,
-                                    direct_passthrough=True)
+    rv = current_app.response_class(data, status=status, mimetype=mimetype,
+                                    headers=headers, direct_passthrough=True)
 
     # if we know the file modification date, we can store it as the
     # the time of the last modification.
@@ -537,7 +601,9 @@ def send_file(filename_or_fp, mimetype=None, as_attachment=False,
         rv.cache_control.max_age = cache_timeout
         rv.expires = int(time() + cache_timeout)
 
-    if add_etags and filename is not None:
+    if add_etags and static_file is not None:
+        rv.set_etag(static_file.etag)
+    elif add_etags and filename is not None:
         rv.set_etag('flask-%s-%s-%s' % (
             os.path.getmtime(filename),
             os.path.getsize(filename),
@@ -546,6 +612,7 @@ def send_file(filename_or_fp, mimetype=None, as_attachment=False,
                 else filename
             ) & 0xffffffff
         ))
+    if add_etags and filename is not None:
         if conditional:
             rv = rv.make_conditional(request)
             # make sure we don't send x-sendfile for servers that
@@ -616,6 +683,22 @@ def send_from_directory(directory, filename, **options):
     return send_file(filename, **options)
 
 
+def _get_static_file_index(directory):
+    """Returns the :class:`~werkzeug.wsgi.StaticFileIndex` of a static
+    folder.  Files are indexed when they are requested for the first time.
+    """
+    index = _static_file_indexes.get(directory)
+    if index is None:
+        with _static_file_indexes_lock:
+            index = _static_file_indexes.get(directory)
+            if index is None:
+                index = StaticFileIndex(directory, fallback_mimetype=
+                                        'application/octet-stream',
+                                        scan=False)
+                _static_file_indexes[directory] = index
+    return index
+
+
 def get_root_path(import_name):
     """Returns the path to a package or cwd if that cannot be found.  This
     returns the path of a package or the folder that contains a module.
@@ -812,14 +895,23 @@ class _PackageBoundObject(object):
         folder to the browser.
 
         .. versionadded:: 0.5
+
+        .. versionchanged:: 0.10
+           The files are looked up in a
+           :class:`~werkzeug.wsgi.StaticFileIndex` of the static folder that
+           is kept for the lifetime of the process.
         """
         if not self.has_static_folder:
             raise RuntimeError('No static folder for this object')
         # Ensure get_send_file_max_age is called in all cases.
         # Here, we ensure get_send_file_max_age is called for Blueprints.
         cache_timeout = self.get_send_file_max_age(filename)
-        return send_from_directory(self.static_folder, filename,
-                                   cache_timeout=cache_timeout)
+        filename = posixpath.normpath(safe_join('', filename))
+        static_file = _get_static_file_index(self.static_folder).get(filename)
+        if static_file is None:
+            raise NotFound()
+        return send_file(static_file, cache_timeout=cache_timeout,
+                         conditional=True)
 
     def open_resource(self, resource, mode='rb'):
         """Opens a resource from the application's resource folder.  To see
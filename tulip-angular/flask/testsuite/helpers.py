@@ -15,6 +15,7 @@ import unittest
 from logging import StreamHandler
 from flask.testsuite import FlaskTestCase, catch_warnings, catch_stderr
 from werkzeug.http import parse_cache_control_header, parse_options_header
+from werkzeug.exceptions import NotFound
 from flask._compat import StringIO, text_type
 
 
@@ -349,6 +350,50 @@ class SendfileTestCase(FlaskTestCase):
             self.assert_equal(cc.max_age, 10)
             rv.close()
 
+    def test_static_file_conditional(self):
+        app = flask.Flask(__name__)
+        with app.test_request_context():
+            rv = app.send_static_file('index.html')
+            rv.direct_passthrough = False
+            with app.open_resource('static/index.html') as f:
+                self.assert_equal(rv.data, f.read())
+            self.assert_equal(rv.mimetype, 'text/html')
+            etag = rv.headers['ETag']
+            rv.close()
+            self.assert_raises(NotFound, app.send_static_file,
+                               'missing.html')
+        with app.test_request_context(headers={'If-None-Match': etag}):
+            rv = app.send_static_file('index.html')
+            self.assert_equal(rv.status_code, 304)
+            self.assert_equal(rv.headers['ETag'], etag)
+            rv.close()
+        with app.test_request_context(headers={'Range': 'bytes=0-9',
+                                               'If-Range': etag}):
+            rv = app.send_static_file('index.html')
+            rv.direct_passthrough = False
+            self.assert_equal(rv.status_code, 206)
+            self.assert_equal(rv.headers['Accept-Ranges'], 'bytes')
+            self.assert_equal(rv.mimetype, 'text/html')
+            with app.open_resource('static/index.html') as f:
+                self.assert_equal(rv.data, f.read(10))
+                f.seek(0, 2)
+                self.assert_equal(rv.headers['Content-Range'],
+                                  'bytes 0-9/%d' % f.tell())
+            rv.close()
+        with app.test_request_context(headers={'Range': 'bytes=100000-'}):
+            rv = app.send_static_file('index.html')
+            self.assert_equal(rv.status_code, 416)
+            rv.close()
+        # only GET and HEAD requests are conditional
+        with app.test_request_context(method='POST',
+                                      headers={'If-None-Match': etag}):
+            rv = app.send_static_file('index.html')
+            rv.direct_passthrough = False
+            self.assert_equal(rv.status_code, 200)
+            with app.open_resource('static/index.html') as f:
+                self.assert_equal(rv.data, f.read())
+            rv.close()
+
 
 class LoggingTestCase(FlaskTestCase):
 
@@ -0,0 +1,123 @@
+"""Tests for selector_events.py"""
+
+import os
+import socket
+import ssl
+import threading
+import unittest
+import unittest.mock
+
+import tulip
+from tulip import test_utils
+
+
+HERE = os.path.dirname(__file__)
+
+
+class SslTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = tulip.new_event_loop()
+        tulip.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_tls_server(self, handler):
+        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        context.load_cert_chain(os.path.join(HERE, 'sample.crt'),
+                                os.path.join(HERE, 'sample.key'))
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(1)
+
+        def serve():
+            conn, addr = sock.accept()
+            conn.settimeout(10)
+            try:
+                conn = context.wrap_socket(conn, server_side=True)
+                handler(conn)
+            finally:
+                conn.close()
+                sock.close()
+
+        thread = threading.Thread(target=serve)
+        thread.start()
+        self.addCleanup(thread.join)
+        return sock.getsockname()
+
+    def test_eof_from_peer(self):
+        def handler(conn):
+            conn.sendall(b'hello')
+            try:
+                conn.unwrap()
+            except (ssl.SSLError, OSError):
+                pass  # client closes without close_notify
+
+        host, port = self.run_tls_server(handler)
+        lost = tulip.Future(loop=self.loop)
+        calls = []
+
+        class Proto(tulip.Protocol):
+            data = b''
+            eof = False
+
+            def data_received(self, data):
+                self.data += data
+
+            def eof_received(self):
+                self.eof = True
+
+            def connection_lost(self, exc):
+                calls.append(exc)
+                if not lost.done():
+                    lost.set_result(None)
+
+        with unittest.mock.patch('tulip.events.tulip_log') as log:
+            transport, proto = self.loop.run_until_complete(
+                self.loop.create_connection(Proto, host, port, ssl=True))
+            self.loop.run_until_complete(lost, timeout=10)
+            test_utils.run_briefly(self.loop)
+
+        self.assertFalse(log.exception.called)
+
+        self.assertEqual(proto.data, b'hello')
+        self.assertTrue(proto.eof)
+        self.assertEqual(calls, [None])
+        self.assertIsNone(transport._sock)
+
+
+class SocketTransportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = tulip.new_event_loop()
+        tulip.set_event_loop(self.loop)
+        self.server = socket.socket()
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(1)
+
+    def tearDown(self):
+        self.server.close()
+        self.loop.close()
+
+    def get_nodelay(self):
+        transport, proto = self.loop.run_until_complete(
+            self.loop.create_connection(
+                tulip.Protocol, *self.server.getsockname()))
+        try:
+            return transport._sock.getsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        finally:
+            transport.close()
+            self.server.accept()[0].close()
+
+    def test_tcp_nodelay(self):
+        self.assertTrue(self.get_nodelay())
+
+    def test_tcp_nodelay_disabled(self):
+        self.loop.tcp_nodelay = False
+        self.assertFalse(self.get_nodelay())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Tests for http/wsgi.py"""
+
+import tempfile
+import unittest
+import unittest.mock
+import zlib
+
+import tulip
+from tulip.http import protocol, wsgi
+
+
+class WSGIServerHttpProtocolTests(unittest.TestCase):
+
+    def create_environ(self, path):
+        proto = wsgi.WSGIServerHttpProtocol(None)
+        proto.transport = unittest.mock.Mock()
+        proto.transport.get_extra_info.return_value = ('127.0.0.1', 1234)
+        proto.stream = None
+        message = protocol.RawRequestMessage(
+            'GET', path, (1, 1), [('HOST', 'python.org')], False, None)
+        return proto.create_wsgi_environ(message, None)
+
+    def test_environ_path(self):
+        environ = self.create_environ('/a/b?x=1&y=2')
+        self.assertEqual(environ['PATH_INFO'], '/a/b')
+        self.assertEqual(environ['QUERY_STRING'], 'x=1&y=2')
+
+    def test_environ_fragment(self):
+        environ = self.create_environ('/a#frag')
+        self.assertEqual(environ['PATH_INFO'], '/a')
+        self.assertEqual(environ['QUERY_STRING'], '')
+
+        environ = self.create_environ('/a?x=1#frag?y=2')
+        self.assertEqual(environ['PATH_INFO'], '/a')
+        self.assertEqual(environ['QUERY_STRING'], 'x=1')
+
+
+class PrecompressedCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = tulip.new_event_loop()
+        tulip.set_event_loop(self.loop)
+        self.fobj = tempfile.NamedTemporaryFile()
+        self.fobj.write(b'var x = 1;\n' * 1000)
+        self.fobj.flush()
+
+    def tearDown(self):
+        self.fobj.close()
+        self.loop.close()
+
+    def test_get(self):
+        cache = wsgi.PrecompressedCache()
+        compressobj = unittest.mock.Mock(wraps=protocol.compressobj)
+
+        with unittest.mock.patch(
+                'tulip.http.protocol.compressobj', compressobj):
+            done, pending = self.loop.run_until_complete(tulip.wait(
+                [tulip.Task(cache.get(self.fobj, 'gzip'))
+                 for i in range(3)]))
+            data = self.loop.run_until_complete(cache.get(self.fobj, 'gzip'))
+
+        self.assertEqual(compressobj.call_count, 1)
+        self.assertEqual([t.result() for t in done], [data] * 3)
+        self.assertEqual(zlib.decompress(data, 16 + zlib.MAX_WBITS),
+                         b'var x = 1;\n' * 1000)
+        self.assertEqual(cache.size, len(data))
+
+    def test_get_closed(self):
+        cache = wsgi.PrecompressedCache()
+        self.fobj.close()
+        self.assertIsNone(
+            self.loop.run_until_complete(cache.get(self.fobj, 'gzip')))
+
+
+if __name__ == '__main__':
+    unittest.main()
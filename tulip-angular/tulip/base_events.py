@@ -44,8 +44,25 @@ def _raise_stop_error(*args):
     raise _StopError
 
 
+def _set_nodelay(sock):
+    """Disable Nagle's algorithm on TCP sockets.
+
+    Transports write headers and bodies separately; with Nagle enabled
+    the second write waits for the delayed ACK of the first one, about
+    40ms on linux. See BaseEventLoop.tcp_nodelay."""
+    if (hasattr(socket, 'TCP_NODELAY') and
+            sock.family in (socket.AF_INET, socket.AF_INET6) and
+            # linux may add SOCK_NONBLOCK to the type
+            sock.type & socket.SOCK_STREAM == socket.SOCK_STREAM):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
 class BaseEventLoop(events.AbstractEventLoop):
 
+    # set TCP_NODELAY on the sockets of TCP and SSL transports, set to
+    # False to keep Nagle's algorithm (fewer packets for many tiny writes)
+    tcp_nodelay = True
+
     def __init__(self):
         self._ready = collections.deque()
         self._scheduled = []
@@ -59,7 +76,8 @@ class BaseEventLoop(events.AbstractEventLoop):
         raise NotImplementedError
 
     def _make_ssl_transport(self, rawsock, protocol, sslcontext, waiter, *,
-                            server_side=False, extra=None):
+                            server_side=False, extra=None,
+                            server_hostname=None):
         """Create SSL transport."""
         raise NotImplementedError
 
@@ -326,7 +344,8 @@ class BaseEventLoop(events.AbstractEventLoop):
         if ssl:
             sslcontext = None if isinstance(ssl, bool) else ssl
             transport = self._make_ssl_transport(
-                sock, protocol, sslcontext, waiter, server_side=False)
+                sock, protocol, sslcontext, waiter, server_side=False,
+                server_hostname=host)
         else:
             transport = self._make_socket_transport(sock, protocol, waiter)
 
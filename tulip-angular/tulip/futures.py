@@ -328,6 +328,10 @@ class Future:
         The other Future may be a concurrent.futures.Future.
         """
         assert other.done()
+        if self.cancelled():
+            # cancelled while the other future was running,
+            # e.g. a function running in an executor
+            return
         assert not self.done()
         if other.cancelled():
             self.cancel()
@@ -13,8 +13,10 @@ __all__ = ['request']
 
 import base64
 import email.message
+import functools
 import http.client
 import http.cookies
+import inspect
 import json
 import io
 import itertools
@@ -49,8 +51,9 @@ def request(method, url, *,
     url: request url
     params: (optional) Dictionary or bytes to be sent in the query string
       of the new request
-    data: (optional) Dictionary, bytes, or file-like object to
-      send in the body of the request
+    data: (optional) Dictionary, bytes, file-like object, generator
+      or tulip stream to send in the body of the request. Files,
+      generators and streams are sent without loading them in memory.
     headers: (optional) Dictionary of HTTP Headers to send with the request
     cookies: (optional) Dict object to send with the request
     files: (optional) Dictionary of 'name': file-like-objects
@@ -149,6 +152,19 @@ class HttpRequest:
 
     body = b''
 
+    # size of chunks read from file-like bodies
+    chunk_size = 2**16
+
+    # streamed bodies wait for the transport to drain
+    # when its write buffer grows over this limit
+    buffer_limit = 2**18
+
+    # upload statistics
+    bytes_sent = 0
+    upload_time = None
+
+    _writer = None  # body writer task
+
     def __init__(self, method, url, *,
                  params=None,
                  headers=None,
@@ -286,7 +302,21 @@ class HttpRequest:
         if isinstance(data, dict):
             data = list(data.items())
 
-        if data and not files:
+        # file-like objects, generators and streams
+        if is_stream(data) and not files:
+            self.body = data
+            if 'content-type' not in self.headers:
+                self.headers['content-type'] = 'application/octet-stream'
+
+            # an explicit Content-Length is kept as is
+            if 'content-length' not in self.headers:
+                size = body_size(data)
+                if size is None:
+                    chunked = chunked or True
+                elif not chunked:
+                    self.headers['content-length'] = str(size)
+
+        elif data and not files:
             if not isinstance(data, str):
                 data = urllib.parse.urlencode(data, doseq=True)
 
@@ -351,7 +381,8 @@ class HttpRequest:
                 chunked = 8196
             else:
                 chunked = None
-                self.headers['content-length'] = str(len(self.body))
+                if not is_stream(self.body):
+                    self.headers['content-length'] = str(len(self.body))
 
         self._chunked = chunked
         self._compress = compress
@@ -391,15 +422,74 @@ class HttpRequest:
         if isinstance(self.body, bytes):
             self.body = (self.body,)
 
-        for chunk in self.body:
-            request.write(chunk)
+        if isinstance(self.body, (tuple, list)):
+            for chunk in self.body:
+                request.write(chunk)
+                self.bytes_sent += len(chunk)
 
-        request.write_eof()
+            request.write_eof()
+        else:
+            self._writer = tulip.Task(self.write_bytes(request, transport))
 
-        return HttpResponse(self.method, self.path, self.host)
+        response = HttpResponse(self.method, self.path, self.host)
+        if self._writer is not None:
+            response._writer = self._writer
+            self._writer.add_done_callback(
+                functools.partial(response._writer_done, transport))
+        return response
 
+    @tulip.coroutine
+    def write_bytes(self, request, transport):
+        """Write streamed body, waits for the transport to drain
+        its write buffer, so memory usage stays bounded."""
+        loop = tulip.get_event_loop()
+        start = loop.time()
+        body = self.body
 
-class HttpResponse(http.client.HTTPMessage):
+        try:
+            if isinstance(body, (tulip.DataBuffer, tulip.StreamReader)):
+                if isinstance(body, tulip.StreamReader):
+                    read = functools.partial(body.read, self.chunk_size)
+                else:
+                    read = body.read
+
+                chunk = yield from read()
+                while chunk:
+                    yield from self._write_chunk(request, transport, chunk)
+                    chunk = yield from read()
+            else:
+                if not inspect.isgenerator(body):
+                    body = read_chunks(body, self.chunk_size)
+
+                for chunk in body:
+                    chunk = str_to_bytes(chunk, self.encoding)
+                    yield from self._write_chunk(request, transport, chunk)
+
+            request.write_eof()
+        finally:
+            self.upload_time = loop.time() - start
+
+    @tulip.coroutine
+    def _write_chunk(self, request, transport, chunk):
+        request.write(chunk)
+        self.bytes_sent += len(chunk)
+
+        if transport.get_write_buffer_size() > self.buffer_limit:
+            yield from transport.drain()
+
+
+class HttpResponse:
+    """Client response.
+
+    Headers are looked up in the parsed (NAME, value) pairs of the
+    response message, names are case insensitive:
+
+      >> resp['Content-Type']
+      >> resp.get_all('Set-Cookie')
+
+    Payload can be read completely with read() or in bounded
+    chunks with read_chunk() and readinto().
+    """
 
     message = None  # RawResponseMessage object
 
@@ -408,19 +498,22 @@ class HttpResponse(http.client.HTTPMessage):
     status = None   # Status-Code
     reason = None   # Reason-Phrase
 
+    headers = ()    # (NAME, value) pairs
     cookies = None  # Response cookies (Set-Cookie)
 
     content = None  # payload stream
     stream = None   # input stream
     transport = None  # current transport
 
-    def __init__(self, method, url, host=''):
-        super().__init__()
+    _writer = None  # request body writer task
+    writer_exception = None  # exception the body writer failed with
 
+    def __init__(self, method, url, host=''):
         self.method = method
         self.url = url
         self.host = host
         self._content = None
+        self._chunk = None  # unread part of the current payload chunk
 
     def __del__(self):
         self.close()
@@ -429,13 +522,46 @@ class HttpResponse(http.client.HTTPMessage):
         out = io.StringIO()
         print('<HttpResponse({}{}) [{} {}]>'.format(
             self.host, self.url, self.status, self.reason), file=out)
-        print(super().__str__(), file=out)
+        for name, value in self.headers:
+            print('{}: {}'.format(name, value), file=out)
         return out.getvalue()
 
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def __contains__(self, name):
+        name = name.upper()
+        return any(hdr == name for hdr, val in self.headers)
+
+    def get(self, name, default=None):
+        """Return the first value of the header, or default."""
+        name = name.upper()
+        for hdr, val in self.headers:
+            if hdr == name:
+                return val
+        return default
+
+    def get_all(self, name, default=None):
+        """Return a list of all the values of the header, or default."""
+        name = name.upper()
+        values = [val for hdr, val in self.headers if hdr == name]
+        return values or default
+
+    def keys(self):
+        return [hdr for hdr, val in self.headers]
+
+    def values(self):
+        return [val for hdr, val in self.headers]
+
+    def items(self):
+        return list(self.headers)
+
     def start(self, stream, transport):
         """Start response processing."""
         self.stream = stream
         self.transport = transport
+        if self.writer_exception is not None:
+            stream.set_exception(self.writer_exception)
 
         httpstream = stream.set_parser(tulip.http.http_response_parser())
 
@@ -448,8 +574,7 @@ class HttpResponse(http.client.HTTPMessage):
         self.reason = self.message.reason
 
         # headers
-        for hdr, val in self.message.headers:
-            self.add_header(hdr, val)
+        self.headers = self.message.headers
 
         # payload
         self.content = stream.set_parser(
@@ -457,9 +582,8 @@ class HttpResponse(http.client.HTTPMessage):
 
         # cookies
         self.cookies = http.cookies.SimpleCookie()
-        if 'Set-Cookie' in self:
-            for hdr in self.get_all('Set-Cookie'):
-                self.cookies.load(hdr)
+        for hdr in self.get_all('Set-Cookie', ()):
+            self.cookies.load(hdr)
 
         return self
 
@@ -468,26 +592,85 @@ class HttpResponse(http.client.HTTPMessage):
             self.transport.close()
             self.transport = None
 
+    def _writer_done(self, transport, fut):
+        # the request body could not be sent, the response and its
+        # payload fail with the same exception
+        if fut.cancelled():
+            exc = tulip.CancelledError()
+        else:
+            exc = fut.exception()
+        if exc is not None:
+            self.writer_exception = exc
+            if self.stream is not None:
+                self.stream.set_exception(exc)
+            transport.close()
+
     @tulip.coroutine
-    def read(self, decode=False):
-        """Read response payload. Decode known types of content."""
-        if self._content is None:
-            buf = []
-            total = 0
+    def read_chunk(self, size=2**16):
+        """Read at most size bytes of payload. Returns b'' at the end
+        of the payload."""
+        chunk = self._chunk
+        if not chunk:
             chunk = yield from self.content.read()
-            while chunk:
-                size = len(chunk)
-                buf.append((chunk, size))
-                total += size
-                chunk = yield from self.content.read()
+            if not chunk:
+                return b''
+
+        if len(chunk) > size:
+            self._chunk = chunk[size:]
+            return chunk[:size]
 
-            self._content = bytearray(total)
+        self._chunk = None
+        return chunk
 
-            idx = 0
-            content = memoryview(self._content)
-            for chunk, size in buf:
-                content[idx:idx+size] = chunk
-                idx += size
+    @tulip.coroutine
+    def readinto(self, buf):
+        """Read payload into a writable buffer. Returns number of bytes
+        read, 0 at the end of the payload."""
+        buf = memoryview(buf)
+        chunk = yield from self.read_chunk(len(buf))
+        size = len(chunk)
+        buf[:size] = chunk
+        return size
+
+    @tulip.coroutine
+    def read(self, decode=False, max_size=None):
+        """Read response payload. Decode known types of content.
+
+        max_size: (optional) maximum payload size, PayloadTooLarge is
+          raised if the payload exceeds it."""
+        if self._content is None:
+            length = self.get('content-length')
+            if length is not None and length.isdigit():
+                length = int(length)
+                if max_size is not None and length > max_size:
+                    raise tulip.http.PayloadTooLarge(
+                        'Payload exceeds {} bytes'.format(max_size))
+            else:
+                length = None
+
+            if length is not None and not self.message.compression:
+                # read directly into a buffer of the final size
+                content = bytearray(length)
+                view = memoryview(content)
+                idx = 0
+                while idx < length:
+                    size = yield from self.readinto(view[idx:])
+                    if not size:
+                        break
+                    idx += size
+                view.release()
+                del content[idx:]
+            else:
+                content = bytearray()
+                chunk = yield from self.read_chunk()
+                while chunk:
+                    content.extend(chunk)
+                    if max_size is not None and len(content) > max_size:
+                        raise tulip.http.PayloadTooLarge(
+                            'Payload exceeds {} bytes'.format(max_size))
+                    chunk = yield from self.read_chunk()
+
+            self._content = content
 
         data = self._content
 
@@ -505,6 +688,29 @@ def str_to_bytes(s, encoding='utf-8'):
     return s
 
 
+def is_stream(data):
+    """Check if data is sent as a stream (file-like objects,
+    generators, tulip streams)."""
+    return hasattr(data, 'read') or inspect.isgenerator(data)
+
+
+def body_size(data):
+    """Size of the remaining data of a file, None if unknown."""
+    try:
+        size = os.fstat(data.fileno()).st_size
+        return max(0, size - data.tell())
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def read_chunks(fp, chunk_size):
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
 def guess_filename(obj, default=None):
     name = getattr(obj, 'name', None)
     if name and name[0] != '<' and name[-1] != '>':
@@ -512,7 +718,8 @@ def guess_filename(obj, default=None):
     return default
 
 
-def encode_multipart_data(fields, boundary, encoding='utf-8', chunk_size=8196):
+def encode_multipart_data(fields, boundary, encoding='utf-8',
+                          chunk_size=2**16):
     """
     Encode a list of fields using the multipart/form-data MIME format.
 
@@ -549,10 +756,7 @@ def encode_multipart_data(fields, boundary, encoding='utf-8', chunk_size=8196):
             if isinstance(fp, bytes):
                 fp = io.BytesIO(fp)
 
-            while True:
-                chunk = fp.read(chunk_size)
-                if not chunk:
-                    break
+            for chunk in read_chunks(fp, chunk_size):
                 yield str_to_bytes(chunk)
 
             yield b'\r\n'
@@ -1,7 +1,8 @@
 """http related errors."""
 
 __all__ = ['HttpException', 'HttpStatusException',
-           'IncompleteRead', 'BadStatusLine', 'LineTooLong', 'InvalidHeader']
+           'IncompleteRead', 'BadStatusLine', 'LineTooLong', 'InvalidHeader',
+           'PayloadTooLarge']
 
 import http.client
 
@@ -42,3 +43,8 @@ class InvalidHeader(BadRequestException):
     def __init__(self, hdr):
         super().__init__('Invalid HTTP Header: {}'.format(hdr))
         self.hdr = hdr
+
+
+class PayloadTooLarge(HttpException):
+
+    code = 413
@@ -3,10 +3,10 @@
 __all__ = ['HttpMessage', 'Request', 'Response',
            'RawRequestMessage', 'RawResponseMessage',
            'http_request_parser', 'http_response_parser',
-           'http_payload_parser']
+           'http_payload_parser', 'negotiate_encoding',
+           'PayloadFilter', 'ChunkingFilter', 'CompressionFilter']
 
 import collections
-import functools
 import http.server
 import itertools
 import re
@@ -22,7 +22,6 @@ VERSRE = re.compile('HTTP/(\d+).(\d+)')
 HDRRE = re.compile('[\x00-\x1F\x7F()<>@,;:\[\]={} \t\\\\\"]')
 CONTINUATION = (' ', '\t')
 EOF_MARKER = object()
-EOL_MARKER = object()
 
 RESPONSES = http.server.BaseHTTPRequestHandler.responses
 
@@ -331,11 +330,12 @@ class DeflateBuffer:
         self.out.feed_eof()
 
 
-def wrap_payload_filter(func):
-    """Wraps payload filter and piped filters.
+class PayloadFilter:
+    """Payload filter, modifies stream of data written to a message.
 
-    Filter is a generatator that accepts arbitrary chunks of data,
-    modify data and emit new stream of data.
+    process() receives a chunk of data and returns a list of chunks
+    for the next filter, flush() returns remaining (buffered) data at
+    the end of the payload.
 
     For example we have stream of chunks: ['1', '2', '3', '4', '5'],
     we can apply chunking filter to this stream:
@@ -346,75 +346,116 @@ def wrap_payload_filter(func):
       |
     ['12', '34', '5']
 
-    It is possible to use different filters at the same time.
-
-    For a example to compress incoming stream with 'deflate' encoding
-    and then split data and emit chunks of 8196 bytes size chunks:
+    It is possible to use different filters at the same time, filters
+    are applied in the order they are added. For a example to compress
+    incoming stream with 'deflate' encoding and then split data and emit
+    chunks of 8196 bytes size chunks:
 
       >> response.add_compression_filter('deflate')
       >> response.add_chunking_filter(8196)
 
     Filters do not alter transfer encoding.
+    """
 
-    Filter can receive types types of data, bytes object or EOF_MARKER.
+    def process(self, chunk):
+        return [chunk]
 
-      1. If filter receives bytes object, it should process data
-         and yield processed data then yield EOL_MARKER object.
-      2. If Filter recevied EOF_MARKER, it should yield remaining
-         data (buffered) and then yield EOF_MARKER.
-    """
-    @functools.wraps(func)
-    def wrapper(self, *args, **kw):
-        new_filter = func(self, *args, **kw)
-
-        filter = self.filter
-        if filter is not None:
-            next(new_filter)
-            self.filter = filter_pipe(filter, new_filter)
-        else:
-            self.filter = new_filter
+    def flush(self):
+        return []
 
-        next(self.filter)
 
-    return wrapper
+class ChunkingFilter(PayloadFilter):
+    """Split incoming stream into chunks.
 
+    Chunks are memoryviews of the incoming data, only data
+    smaller than chunk_size is buffered."""
 
-def filter_pipe(filter, filter2):
-    """Creates pipe between two filters.
+    def __init__(self, chunk_size=16*1024):
+        self.chunk_size = chunk_size
+        self.buf = bytearray()
 
-    filter_pipe() feeds first filter with incoming data and then
-    send yielded from first filter data into filter2, results of
-    filter2 are being emitted.
+    def process(self, chunk):
+        chunk_size = self.chunk_size
+        chunk = memoryview(chunk)
+        chunks = []
 
-      1. If filter_pipe receives bytes object, it sends it to the first filter.
-      2. Reads yielded values from the first filter until it receives
-         EOF_MARKER or EOL_MARKER.
-      3. Each of this values is being send to second filter.
-      4. Reads yielded values from second filter until it recives EOF_MARKER or
-         EOL_MARKER. Each of this values yields to writer.
-    """
-    chunk = yield
+        if self.buf:
+            size = chunk_size - len(self.buf)
+            self.buf.extend(chunk[:size])
+            chunk = chunk[size:]
 
-    while True:
-        eof = chunk is EOF_MARKER
-        chunk = filter.send(chunk)
+            if len(self.buf) < chunk_size:
+                return chunks
 
-        while chunk is not EOL_MARKER:
-            chunk = filter2.send(chunk)
+            # buffer is not modified after it is returned
+            chunks.append(self.buf)
+            self.buf = bytearray()
 
-            while chunk not in (EOF_MARKER, EOL_MARKER):
-                yield chunk
-                chunk = next(filter2)
+        pos = 0
+        while len(chunk) - pos >= chunk_size:
+            chunks.append(chunk[pos:pos+chunk_size])
+            pos += chunk_size
 
-            if chunk is not EOF_MARKER:
-                if eof:
-                    chunk = EOF_MARKER
-                else:
-                    chunk = next(filter)
-            else:
-                break
+        self.buf.extend(chunk[pos:])
+        return chunks
+
+    def flush(self):
+        if not self.buf:
+            return []
+
+        chunks = [self.buf]
+        self.buf = bytearray()
+        return chunks
+
+
+class CompressionFilter(PayloadFilter):
+    """Compress incoming stream with deflate or gzip encoding."""
+
+    def __init__(self, encoding='deflate', level=zlib.Z_DEFAULT_COMPRESSION):
+        self.zcomp = compressobj(encoding, level)
+
+    def process(self, chunk):
+        chunk = self.zcomp.compress(chunk)
+        return [chunk] if chunk else []
+
+    def flush(self):
+        return [self.zcomp.flush()]
+
+
+def compressobj(encoding='deflate', level=zlib.Z_DEFAULT_COMPRESSION):
+    """Return zlib compression object for gzip or deflate encoding."""
+    zlib_mode = (16 + zlib.MAX_WBITS
+                 if encoding == 'gzip' else -zlib.MAX_WBITS)
+    return zlib.compressobj(level, wbits=zlib_mode)
+
+
+def negotiate_encoding(accept_encoding, encodings=('gzip', 'deflate')):
+    """Select content encoding from Accept-Encoding header value.
+
+    encodings are supported encodings in order of preference.
+    Returns None if none of them is acceptable."""
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            qualities[coding] = quality
 
-        chunk = yield EOL_MARKER
+    default = qualities.get('*', 0.0)
+    best, best_quality = None, 0.0
+    for coding in encodings:
+        quality = qualities.get(coding, default)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+
+    return best
 
 
 class HttpMessage:
@@ -457,11 +498,6 @@ class HttpMessage:
 
     writer = None
 
-    # 'filter' is being used for altering write() bahaviour,
-    # add_chunking_filter adds deflate/gzip compression and
-    # add_compression_filter splits incoming data into a chunks.
-    filter = None
-
     HOP_HEADERS = None  # Must be set by subclass.
 
     SERVER_SOFTWARE = 'Python/{0[0]}.{0[1]} tulip/0.0'.format(sys.version_info)
@@ -485,6 +521,11 @@ class HttpMessage:
         self.headers = collections.deque()
         self.headers_sent = False
 
+        # 'filters' are being used for altering write() behaviour,
+        # add_compression_filter adds deflate/gzip compression and
+        # add_chunking_filter splits incoming data into a chunks.
+        self.filters = []
+
     def force_close(self):
         self.closing = True
         self.keepalive = False
@@ -591,7 +632,7 @@ class HttpMessage:
         writer uses filter to modify chunk of data. write_eof() indicates
         end of stream. writer can't be used after write_eof() method
         being called."""
-        assert (isinstance(chunk, (bytes, bytearray)) or
+        assert (isinstance(chunk, (bytes, bytearray, memoryview)) or
                 chunk is EOF_MARKER), chunk
 
         if self._send_headers and not self.headers_sent:
@@ -599,14 +640,20 @@ class HttpMessage:
 
         assert self.writer is not None, 'send_headers() is not called.'
 
-        if self.filter:
-            chunk = self.filter.send(chunk)
-            while chunk not in (EOF_MARKER, EOL_MARKER):
-                self.writer.send(chunk)
-                chunk = next(self.filter)
-        else:
-            if chunk is not EOF_MARKER:
-                self.writer.send(chunk)
+        eof = chunk is EOF_MARKER
+        chunks = [] if eof else [chunk]
+
+        for filter in self.filters:
+            if len(chunks) == 1:
+                chunks = filter.process(chunks[0])
+            elif chunks:
+                chunks = [data for chunk in chunks
+                          for data in filter.process(chunk)]
+            if eof:
+                chunks.extend(filter.flush())
+
+        for chunk in chunks:
+            self.writer.send(chunk)
 
     def write_eof(self):
         self.write(EOF_MARKER)
@@ -616,7 +663,10 @@ class HttpMessage:
             pass
 
     def _write_chunked_payload(self):
-        """Write data in chunked transfer encoding."""
+        """Write data in chunked transfer encoding.
+
+        Each chunk is framed with a single writelines() call,
+        payload is not copied."""
         while True:
             try:
                 chunk = yield
@@ -624,9 +674,13 @@ class HttpMessage:
                 self.transport.write(b'0\r\n\r\n')
                 break
 
-            self.transport.write('{:x}\r\n'.format(len(chunk)).encode('ascii'))
-            self.transport.write(bytes(chunk))
-            self.transport.write(b'\r\n')
+            # empty chunk terminates chunked payload
+            if not len(chunk):
+                continue
+
+            self.transport.writelines(
+                ('{:x}\r\n'.format(len(chunk)).encode('ascii'),
+                 chunk, b'\r\n'))
 
     def _write_length_payload(self, length):
         """Write specified number of bytes to a stream."""
@@ -639,9 +693,9 @@ class HttpMessage:
             if length:
                 l = len(chunk)
                 if length >= l:
-                    self.transport.write(chunk)
+                    self.transport.writelines((chunk,))
                 else:
-                    self.transport.write(chunk[:length])
+                    self.transport.writelines((chunk[:length],))
 
                 length = max(0, length-l)
 
@@ -652,47 +706,20 @@ class HttpMessage:
             except tulip.EofStream:
                 break
 
-            self.transport.write(chunk)
+            self.transport.writelines((chunk,))
+
+    def add_filter(self, filter):
+        """Add payload filter, see PayloadFilter."""
+        self.filters.append(filter)
 
-    @wrap_payload_filter
     def add_chunking_filter(self, chunk_size=16*1024):
         """Split incoming stream into chunks."""
-        buf = bytearray()
-        chunk = yield
-
-        while True:
-            if chunk is EOF_MARKER:
-                if buf:
-                    yield buf
+        self.add_filter(ChunkingFilter(chunk_size))
 
-                yield EOF_MARKER
-
-            else:
-                buf.extend(chunk)
-
-                while len(buf) >= chunk_size:
-                    chunk = bytes(buf[:chunk_size])
-                    del buf[:chunk_size]
-                    yield chunk
-
-                chunk = yield EOL_MARKER
-
-    @wrap_payload_filter
-    def add_compression_filter(self, encoding='deflate'):
+    def add_compression_filter(self, encoding='deflate',
+                               level=zlib.Z_DEFAULT_COMPRESSION):
         """Compress incoming stream with deflate or gzip encoding."""
-        zlib_mode = (16 + zlib.MAX_WBITS
-                     if encoding == 'gzip' else -zlib.MAX_WBITS)
-        zcomp = zlib.compressobj(wbits=zlib_mode)
-
-        chunk = yield
-        while True:
-            if chunk is EOF_MARKER:
-                yield zcomp.flush()
-                chunk = yield EOF_MARKER
-
-            else:
-                yield zcomp.compress(chunk)
-                chunk = yield EOL_MARKER
+        self.add_filter(CompressionFilter(encoding, level))
 
 
 class Response(HttpMessage):
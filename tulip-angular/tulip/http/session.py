@@ -2,14 +2,41 @@
 
 __all__ = ['Session']
 
+import collections
 import tulip
 import http.cookies
 
 
 class Session:
+    """Client session, keeps cookies and a pool of keep-alive connections.
 
-    def __init__(self):
+    limit: (optional) maximum number of connections, in use or idle.
+    limit_per_host: (optional) maximum number of connections, in use
+       or idle, per (host, port, ssl) key.
+    idle_timeout: (optional) number of seconds an idle connection
+       is kept in the pool.
+    max_lifetime: (optional) number of seconds after which a connection
+       is not reused anymore.
+
+    When a limit is reached, start() waits until a connection
+    is released back to the pool.
+    """
+
+    def __init__(self, *, limit=None, limit_per_host=None,
+                 idle_timeout=None, max_lifetime=None):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+
+        # key -> [(transport, proto, created, released), ...]
         self._conns = {}
+        self._idle = 0
+        self._acquired = collections.Counter()
+        self._waiters = collections.deque()
+        self._cleanup_handle = None
+        self._loop = None
+        self._stats = collections.Counter()
         self.cookies = http.cookies.SimpleCookie()
 
     def __del__(self):
@@ -18,10 +45,28 @@ class Session:
     def close(self):
         """Close all opened transports."""
         for key, data in self._conns.items():
-            for transport, proto in data:
+            for transport, proto, created, released in data:
                 transport.close()
 
         self._conns.clear()
+        self._idle = 0
+
+        if self._cleanup_handle is not None:
+            self._cleanup_handle.cancel()
+            self._cleanup_handle = None
+
+    def stats(self):
+        """Return pool statistics.
+
+        created: connections opened, reused: connections taken from the pool,
+        evicted: idle connections closed because they expired or were
+        unusable, waited: number of times start() had to wait for a free
+        connection, acquired and idle: current number of connections."""
+        stats = dict.fromkeys(('created', 'reused', 'evicted', 'waited'), 0)
+        stats.update(self._stats)
+        stats['acquired'] = sum(self._acquired.values())
+        stats['idle'] = self._idle
+        return stats
 
     def update_cookies(self, cookies):
         if isinstance(cookies, dict):
@@ -41,47 +86,208 @@ class Session:
         if set_cookies and self.cookies:
             req.update_cookies(self.cookies.items())
 
-        if not new_conn:
-            transport, proto = self._get(key)
-
-        if new_conn or transport is None:
-            new = True
-            transport, proto = yield from loop.create_connection(
-                tulip.StreamProtocol, req.host, req.port, ssl=req.ssl)
-        else:
-            new = False
+        conn, new = yield from self._acquire(req, key, loop, new_conn)
+        transport, proto, created = conn
 
+        resp = None
         try:
             resp = req.send(transport)
             yield from resp.start(
-                proto, TransportWrapper(
-                    self._release, key, transport, proto, resp))
+                proto, TransportWrapper(self._release, key, conn, resp))
         except:
-            if new:
-                transport.close()
+            if resp is not None:
+                resp.transport = None
+            transport.close()
+            self._release_slot(key)
+            # a streamed body can not be sent again
+            if new or req._writer is not None:
                 raise
 
             return (yield from self.start(req, loop, set_cookies=False))
 
         return resp
 
+    @tulip.coroutine
+    def _acquire(self, req, key, loop, new_conn):
+        """Return a connection for the key and whether it is a new one.
+
+        Waits for a released connection if the pool limits are reached."""
+        self._loop = loop
+
+        while True:
+            if not new_conn:
+                conn = self._get(key)
+                if conn is not None:
+                    self._acquired[key] += 1
+                    self._stats['reused'] += 1
+                    return conn, False
+
+            if self._reserve(key, new_conn):
+                try:
+                    transport, proto = yield from loop.create_connection(
+                        tulip.StreamProtocol, req.host, req.port, ssl=req.ssl)
+                except:
+                    self._release_slot(key)
+                    raise
+
+                self._stats['created'] += 1
+                return (transport, proto, loop.time()), True
+
+            waiter = tulip.Future()
+            item = (key, new_conn, waiter)
+            self._waiters.append(item)
+            self._stats['waited'] += 1
+            try:
+                yield from waiter
+            finally:
+                if not waiter.done():
+                    self._waiters.remove(item)
+
+    def _available(self, key, new_conn=False):
+        """Check if a connection for the key can be reused or opened,
+        new_conn excludes reusing an idle connection."""
+        if not new_conn and self._conns.get(key):
+            return True
+
+        if self.limit_per_host is not None:
+            # idle connections of the key can be evicted
+            if self._acquired[key] >= self.limit_per_host:
+                return False
+
+        if self.limit is not None:
+            # idle connections of other hosts can be evicted
+            if sum(self._acquired.values()) >= self.limit:
+                return False
+
+        return True
+
+    def _reserve(self, key, new_conn=False):
+        """Reserve a slot for a new connection if limits allow it."""
+        if not self._available(key, new_conn):
+            return False
+
+        if self.limit_per_host is not None:
+            conns = self._conns.get(key)
+            while conns and (self._acquired[key] + len(conns) >=
+                             self.limit_per_host):
+                self._evict(conns)
+
+        if self.limit is not None:
+            while sum(self._acquired.values()) + self._idle >= self.limit:
+                # close the oldest idle connection
+                self._evict_oldest()
+
+        self._acquired[key] += 1
+        return True
+
+    def _usable(self, conn, now):
+        transport, proto, created, released = conn
+
+        if proto.transport is None or proto._eof or proto.exception():
+            return False
+        if (self.idle_timeout is not None and
+                now - released >= self.idle_timeout):
+            return False
+        if (self.max_lifetime is not None and
+                now - created >= self.max_lifetime):
+            return False
+        return True
+
     def _get(self, key):
         conns = self._conns.get(key)
-        if conns:
-            return conns.pop()
+        now = self._loop.time()
+
+        # most recently released connections first
+        while conns:
+            conn = conns.pop()
+            self._idle -= 1
+            if self._usable(conn, now):
+                return conn[:3]
+
+            conn[0].close()
+            self._stats['evicted'] += 1
+
+        return None
+
+    def _evict_oldest(self):
+        oldest = None
+        for conns in self._conns.values():
+            if conns and (oldest is None or conns[0][3] < oldest[0][3]):
+                oldest = conns
 
-        return None, None
+        self._evict(oldest)
+
+    def _evict(self, conns):
+        """Close the oldest idle connection of the list."""
+        conn = conns.pop(0)
+        conn[0].close()
+        self._idle -= 1
+        self._stats['evicted'] += 1
+
+    def _cleanup(self):
+        """Close expired idle connections."""
+        self._cleanup_handle = None
+        now = self._loop.time()
+
+        for key, conns in self._conns.items():
+            alive = []
+            for conn in conns:
+                if self._usable(conn, now):
+                    alive.append(conn)
+                else:
+                    conn[0].close()
+                    self._idle -= 1
+                    self._stats['evicted'] += 1
+            conns[:] = alive
+
+        self._schedule_cleanup()
+
+    def _schedule_cleanup(self):
+        if (self._cleanup_handle is None and self._idle and
+                self.idle_timeout is not None):
+            # lists are ordered by release time
+            released = min(conns[0][3] for conns in self._conns.values()
+                           if conns)
+            self._cleanup_handle = self._loop.call_at(
+                released + self.idle_timeout, self._cleanup)
+
+    def _release_slot(self, key):
+        self._acquired[key] -= 1
+        if not self._acquired[key]:
+            del self._acquired[key]
+
+        # wake up the first waiter that can make progress
+        for item in self._waiters:
+            key, new_conn, waiter = item
+            if not waiter.done() and self._available(key, new_conn):
+                self._waiters.remove(item)
+                waiter.set_result(None)
+                break
 
     def _release(self, resp, key, conn):
+        transport, proto, created = conn
         msg = resp.message
-        if msg.should_close:
-            conn[0].close()
+
+        if (msg is None or msg.should_close or
+                resp.content is None or not resp.content._eof or
+                (resp._writer is not None and not resp._writer.done()) or
+                resp.writer_exception is not None or
+                (self.max_lifetime is not None and
+                 self._loop.time() - created > self.max_lifetime)):
+            # the connection can not be reused if the payload
+            # has not been read or the request body has not been
+            # sent completely
+            transport.close()
         else:
             conns = self._conns.get(key)
             if conns is None:
                 conns = self._conns[key] = []
-            conns.append(conn)
-            conn[1].unset_parser()
+            conns.append((transport, proto, created, self._loop.time()))
+            self._idle += 1
+            proto.unset_parser()
+            self._schedule_cleanup()
+
+        self._release_slot(key)
 
         if resp.cookies:
             self.update_cookies(resp.cookies.items())
@@ -89,13 +295,12 @@ class Session:
 
 class TransportWrapper:
 
-    def __init__(self, release, key, transport, protocol, response):
+    def __init__(self, release, key, conn, response):
         self.release = release
         self.key = key
-        self.transport = transport
-        self.protocol = protocol
+        self.conn = conn
+        self.transport, self.protocol = conn[:2]
         self.response = response
 
     def close(self):
-        self.release(self.response, self.key,
-                     (self.transport, self.protocol))
+        self.release(self.response, self.key, self.conn)
@@ -2,10 +2,13 @@
 
 __all__ = ['WebSocketParser', 'WebSocketWriter', 'do_handshake',
            'Message', 'WebSocketError',
-           'MSG_TEXT', 'MSG_BINARY', 'MSG_CLOSE', 'MSG_PING', 'MSG_PONG']
+           'MSG_TEXT', 'MSG_BINARY', 'MSG_CLOSE', 'MSG_PING', 'MSG_PONG',
+           'CLOSE_OK', 'CLOSE_PROTOCOL_ERROR', 'CLOSE_INVALID_TEXT',
+           'CLOSE_MESSAGE_TOO_BIG']
 
 import base64
 import binascii
+import codecs
 import collections
 import hashlib
 import struct
@@ -19,6 +22,12 @@ MSG_CLOSE = OPCODE_CLOSE = 0x8
 MSG_PING = OPCODE_PING = 0x9
 MSG_PONG = OPCODE_PONG = 0xa
 
+# Close codes defined in the spec.
+CLOSE_OK = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_INVALID_TEXT = 1007
+CLOSE_MESSAGE_TOO_BIG = 1009
+
 WS_KEY = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
 WS_HDRS = ('UPGRADE', 'CONNECTION',
            'SEC-WEBSOCKET-VERSION', 'SEC-WEBSOCKET-KEY')
@@ -27,14 +36,29 @@ Message = collections.namedtuple('Message', ['tp', 'data', 'extra'])
 
 
 class WebSocketError(Exception):
-    """WebSocket protocol parser error."""
+    """WebSocket protocol parser error.
+
+    code is the close code to send to the peer."""
+
+    def __init__(self, message, code=CLOSE_PROTOCOL_ERROR):
+        super().__init__(message)
+        self.code = code
 
 
-def WebSocketParser():
+def WebSocketParser(max_size=None, writer=None):
+    """WebSocket messages parser.
+
+    On a protocol error the close frame with its code is sent through
+    writer (a WebSocketWriter) before the error is raised."""
     out, buf = yield
 
     while True:
-        message = yield from parse_message(buf)
+        try:
+            message = yield from parse_message(buf, max_size)
+        except WebSocketError as exc:
+            if writer is not None:
+                writer.close(exc.code)
+            raise
         out.feed_data(message)
 
         if message.tp == MSG_CLOSE:
@@ -42,8 +66,11 @@ def WebSocketParser():
             break
 
 
-def parse_frame(buf):
-    """Return the next frame from the socket."""
+def parse_frame(buf, max_size=None):
+    """Return the next frame from the socket.
+
+    If max_size is not None, data frames with a longer payload are
+    rejected before the payload is read."""
     # read header
     data = yield from buf.read(2)
     first_byte, second_byte = struct.unpack('!BB', data)
@@ -65,10 +92,6 @@ def parse_frame(buf):
     if opcode > 0x7 and fin == 0:
         raise WebSocketError('Received fragmented control frame')
 
-    if fin == 0 and opcode == OPCODE_CONTINUATION:
-        raise WebSocketError(
-            'Received new fragment frame with non-zero opcode')
-
     has_mask = (second_byte >> 7) & 1
     length = (second_byte) & 0x7f
 
@@ -85,6 +108,11 @@ def parse_frame(buf):
         data = yield from buf.read(8)
         length = struct.unpack_from('!Q', data)[0]
 
+    if max_size is not None and length > max_size and opcode <= 0x7:
+        raise WebSocketError(
+            'Message size exceeds limit of {} bytes'.format(max_size),
+            CLOSE_MESSAGE_TOO_BIG)
+
     if has_mask:
         mask = yield from buf.read(4)
 
@@ -99,8 +127,8 @@ def parse_frame(buf):
     return fin, opcode, payload
 
 
-def parse_message(buf):
-    fin, opcode, payload = yield from parse_frame(buf)
+def parse_message(buf, max_size=None):
+    fin, opcode, payload = yield from parse_frame(buf, max_size)
 
     if opcode == OPCODE_CLOSE:
         if len(payload) >= 2:
@@ -121,22 +149,48 @@ def parse_message(buf):
     elif opcode not in (OPCODE_TEXT, OPCODE_BINARY):
         raise WebSocketError("Unexpected opcode={!r}".format(opcode))
 
-    # load text/binary
-    data = [payload]
+    # load text/binary, text is validated as fragments arrive
+    if opcode == OPCODE_TEXT:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='strict')
+        data = [decode_text(decoder, payload, fin)]
+    else:
+        data = [payload]
+    size = len(payload)
 
     while not fin:
-        fin, _opcode, payload = yield from parse_frame(buf)
+        fin, _opcode, payload = yield from parse_frame(
+            buf, None if max_size is None else max_size - size)
         if _opcode != OPCODE_CONTINUATION:
             raise WebSocketError(
                 'The opcode in non-fin frame is expected '
                 'to be zero, got {!r}'.format(opcode))
+        elif opcode == OPCODE_TEXT:
+            data.append(decode_text(decoder, payload, fin))
         else:
             data.append(payload)
+        size += len(payload)
+
+    if len(data) == 1:
+        data = data[0]
+    elif opcode == OPCODE_TEXT:
+        data = ''.join(data)
+    else:
+        data = b''.join(data)
 
     if opcode == OPCODE_TEXT:
-        return Message(OPCODE_TEXT, b''.join(data).decode('utf-8'), '')
+        return Message(OPCODE_TEXT, data, '')
     else:
-        return Message(OPCODE_BINARY, b''.join(data), '')
+        return Message(OPCODE_BINARY, bytes(data), '')
+
+
+def decode_text(decoder, data, final):
+    """Decode a fragment of a text message, fail on invalid UTF-8."""
+    try:
+        return decoder.decode(data, final)
+    except UnicodeDecodeError as exc:
+        raise WebSocketError(
+            'Invalid UTF-8 text: {}'.format(exc),
+            CLOSE_INVALID_TEXT) from None
 
 
 class WebSocketWriter:
@@ -144,9 +198,9 @@ class WebSocketWriter:
     def __init__(self, transport):
         self.transport = transport
 
-    def _send_frame(self, message, opcode):
+    def _send_frame(self, message, opcode, fin=True):
         """Send a frame over the websocket with message as its payload."""
-        header = bytes([0x80 | opcode])
+        header = bytes([(0x80 if fin else 0) | opcode])
         msg_length = len(message)
 
         if msg_length < 126:
@@ -175,6 +229,22 @@ class WebSocketWriter:
         else:
             self._send_frame(message, OPCODE_TEXT)
 
+    def send_fragments(self, fragments, binary=False):
+        """Send a message over the websocket as a sequence of frames.
+
+        fragments is an iterable of str or bytes, each item is sent as a
+        separate frame without assembling the whole message in memory."""
+        opcode = OPCODE_BINARY if binary else OPCODE_TEXT
+        pending = None
+        for fragment in fragments:
+            if isinstance(fragment, str):
+                fragment = fragment.encode('utf-8')
+            if pending is not None:
+                self._send_frame(pending, opcode, fin=False)
+                opcode = OPCODE_CONTINUATION
+            pending = fragment
+        self._send_frame(b'' if pending is None else pending, opcode)
+
     def close(self, code=1000, message=b''):
         """Close the websocket, sending the specified code and message."""
         if isinstance(message, str):
@@ -184,10 +254,10 @@ class WebSocketWriter:
             opcode=OPCODE_CLOSE)
 
 
-def do_handshake(message, transport):
+def do_handshake(message, transport, max_size=None):
     """Prepare WebSocket handshake. It return http response code,
     response headers, websocket parser, websocket writer. It does not
-    do any IO."""
+    do any IO. max_size limits the size of incoming messages."""
     headers = dict(((hdr, val)
                     for hdr, val in message.headers if hdr in WS_HDRS))
 
@@ -217,11 +287,12 @@ def do_handshake(message, transport):
             'Handshake error: {!r}'.format(key)) from None
 
     # response code, headers, parser, writer
+    writer = WebSocketWriter(transport)
     return (101,
             (('UPGRADE', 'websocket'),
              ('CONNECTION', 'upgrade'),
              ('TRANSFER-ENCODING', 'chunked'),
              ('SEC-WEBSOCKET-ACCEPT', base64.b64encode(
                  hashlib.sha1(key.encode() + WS_KEY).digest()).decode())),
-            WebSocketParser(),
-            WebSocketWriter(transport))
+            WebSocketParser(max_size, writer),
+            writer)
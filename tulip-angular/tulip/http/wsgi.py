@@ -6,17 +6,26 @@ TODO:
   * wsgi file support (os.sendfile)
 """
 
-__all__ = ['WSGIServerHttpProtocol']
+__all__ = ['WSGIServerHttpProtocol', 'PrecompressedCache', 'WSGIThreadPool']
 
+import collections
+import concurrent.futures
+import functools
+import hashlib
 import inspect
-import io
+import mmap
 import os
+import re
 import sys
+import tempfile
+import threading
+import time
+import zlib
 from urllib.parse import unquote, urlsplit
 
 import tulip
 import tulip.http
-from tulip.http import server
+from tulip.http import errors, protocol, server
 
 
 class WSGIServerHttpProtocol(server.ServerHttpProtocol):
@@ -24,30 +33,55 @@ class WSGIServerHttpProtocol(server.ServerHttpProtocol):
 
     It uses 'wsgi.async' of 'True'. 'wsgi.input' can behave differently
     depends on 'readpayload' constructor parameter. If readpayload is set to
-    True, wsgi server reads all incoming data into BytesIO object and
-    sends it as 'wsgi.input' environ var. If readpayload is set to false
-    'wsgi.input' is a StreamReader and application should read incoming
-    data with "yield from environ['wsgi.input'].read()". It defaults to False.
+    True, wsgi server reads all incoming data into a spooled temporary file
+    (kept in memory up to SPOOL_MAX_SIZE bytes, mapped with mmap if
+    SPOOL_MMAP is set and the data is on disk) and sends it as 'wsgi.input'
+    environ var. If readpayload is set to false 'wsgi.input' is a
+    StreamReader and application should read incoming data with
+    "yield from environ['wsgi.input'].read()". It defaults to False.
+
+    If compress is True, responses are compressed with the encoding
+    negotiated from the Accept-Encoding request header, if their content
+    type is listed in COMPRESS_TYPES and they are not smaller than
+    COMPRESS_MIN_SIZE. Files returned with 'wsgi.file_wrapper' are
+    compressed once and kept in compress_cache (a PrecompressedCache).
+
+    If thread_pool (a WSGIThreadPool) is set, the application is a
+    regular blocking WSGI application and runs in the thread pool, so it
+    does not block the event loop. With readpayload set to False,
+    'wsgi.input' is then a blocking file-like object that reads incoming
+    data from the stream as the application consumes it.
     """
 
     SCRIPT_NAME = os.environ.get('SCRIPT_NAME', '')
 
-    def __init__(self, app, readpayload=False, is_ssl=False, *args, **kw):
+    SPOOL_MAX_SIZE = 1024 * 1024
+    SPOOL_MMAP = False
+
+    COMPRESS_LEVEL = 6
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_TYPES = frozenset((
+        'text/html', 'text/css', 'text/plain', 'text/xml',
+        'text/javascript', 'application/javascript',
+        'application/x-javascript', 'application/json',
+        'application/xml', 'image/svg+xml'))
+
+    def __init__(self, app, readpayload=False, is_ssl=False, *args,
+                 compress=False, compress_cache=None, thread_pool=None,
+                 **kw):
         super().__init__(*args, **kw)
 
         self.wsgi = app
         self.is_ssl = is_ssl
         self.readpayload = readpayload
-
-    def create_wsgi_response(self, message):
-        return WsgiResponse(self.transport, message)
-
-    def create_wsgi_environ(self, message, payload):
-        uri_parts = urlsplit(message.path)
-        url_scheme = 'https' if self.is_ssl else 'http'
-
-        environ = {
-            'wsgi.input': payload,
+        self.compress = compress
+        self.compress_cache = compress_cache
+        self.thread_pool = thread_pool
+
+        # static part of the environ, copied for each request
+        url_scheme = 'https' if is_ssl else 'http'
+        self._default_port = '443' if is_ssl else '80'
+        self._environ_template = {
             'wsgi.errors': sys.stderr,
             'wsgi.version': (1, 0),
             'wsgi.async': True,
@@ -57,18 +91,34 @@ class WSGIServerHttpProtocol(server.ServerHttpProtocol):
             'wsgi.file_wrapper': FileWrapper,
             'wsgi.url_scheme': url_scheme,
             'SERVER_SOFTWARE': tulip.http.HttpMessage.SERVER_SOFTWARE,
-            'REQUEST_METHOD': message.method,
-            'QUERY_STRING': uri_parts.query or '',
-            'RAW_URI': message.path,
-            'SERVER_PROTOCOL': 'HTTP/%s.%s' % message.version
         }
+        if readpayload or thread_pool is not None:
+            # file-like wsgi.input returns b'' at the end of the payload,
+            # even for chunked requests
+            self._environ_template['wsgi.input_terminated'] = True
+        self._remote_addr = None
+
+    def create_wsgi_response(self, message):
+        return WsgiResponse(self.transport, message, self)
+
+    def create_wsgi_environ(self, message, payload):
+        if message.path.startswith('/'):
+            path_info, _, query = (
+                message.path.partition('#')[0].partition('?'))
+        else:
+            # absolute uri
+            uri_parts = urlsplit(message.path)
+            path_info, query = uri_parts.path, uri_parts.query
+
+        environ = self._environ_template.copy()
+        environ['wsgi.input'] = payload
+        environ['REQUEST_METHOD'] = message.method
+        environ['QUERY_STRING'] = query
+        environ['RAW_URI'] = message.path
+        environ['SERVER_PROTOCOL'] = 'HTTP/%s.%s' % message.version
 
-        # authors should be aware that REMOTE_HOST and REMOTE_ADDR
-        # may not qualify the remote addr:
-        # http://www.ietf.org/rfc/rfc3875
-        forward = self.transport.get_extra_info('addr', '127.0.0.1')
         script_name = self.SCRIPT_NAME
-        server = forward
+        server = None
 
         for hdr_name, hdr_value in message.headers:
             if hdr_name == 'EXPECT':
@@ -79,19 +129,59 @@ class WSGIServerHttpProtocol(server.ServerHttpProtocol):
                 server = hdr_value
             elif hdr_name == 'SCRIPT_NAME':
                 script_name = hdr_value
-            elif hdr_name == 'CONTENT-TYPE':
-                environ['CONTENT_TYPE'] = hdr_value
-                continue
-            elif hdr_name == 'CONTENT-LENGTH':
-                environ['CONTENT_LENGTH'] = hdr_value
-                continue
 
-            key = 'HTTP_%s' % hdr_name.replace('-', '_')
-            if key in environ:
+            key = _ENVIRON_KEYS.get(hdr_name)
+            if key is None:
+                key = environ_key(hdr_name)
+
+            if key in environ and key not in _SINGLE_HEADERS:
                 hdr_value = '%s,%s' % (environ[key], hdr_value)
 
             environ[key] = hdr_value
 
+        # remote address does not change for the connection
+        if self._remote_addr is None:
+            self._remote_addr = self.get_remote_addr()
+
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = self._remote_addr
+
+        if server is None:
+            server_name, server_port = self._remote_addr
+        else:
+            server_name, sep, server_port = server.rpartition(':')
+            if not sep or ']' in server_port:
+                server_name, server_port = server, self._default_port
+
+        environ['SERVER_NAME'] = server_name
+        environ['SERVER_PORT'] = server_port
+
+        if script_name:
+            path_info = path_info.split(script_name, 1)[-1]
+
+        environ['PATH_INFO'] = (
+            unquote(path_info) if '%' in path_info else path_info)
+        environ['SCRIPT_NAME'] = script_name
+
+        if self.compress and 'HTTP_IF_NONE_MATCH' in environ:
+            # the application knows the entity tags of its uncompressed
+            # representations only. If-Range is left alone, so a range
+            # of a compressed representation is answered with the whole
+            # (compressed) resource instead of a range of the wrong bytes.
+            environ['HTTP_IF_NONE_MATCH'] = _ETAG_ENCODING_RE.sub(
+                '"', environ['HTTP_IF_NONE_MATCH'])
+
+        environ['tulip.reader'] = self.stream
+        environ['tulip.writer'] = self.transport
+
+        return environ
+
+    def get_remote_addr(self):
+        """Return (host, port) strings of the remote peer."""
+        # authors should be aware that REMOTE_HOST and REMOTE_ADDR
+        # may not qualify the remote addr:
+        # http://www.ietf.org/rfc/rfc3875
+        forward = self.transport.get_extra_info('addr', '127.0.0.1')
+
         if isinstance(forward, str):
             # we only took the last one
             # http://en.wikipedia.org/wiki/X-Forwarded-For
@@ -116,41 +206,60 @@ class WSGIServerHttpProtocol(server.ServerHttpProtocol):
         else:
             remote = forward
 
-        environ['REMOTE_ADDR'] = remote[0]
-        environ['REMOTE_PORT'] = str(remote[1])
-
-        if isinstance(server, str):
-            server = server.split(':')
-            if len(server) == 1:
-                server.append('80' if url_scheme == 'http' else '443')
-
-        environ['SERVER_NAME'] = server[0]
-        environ['SERVER_PORT'] = str(server[1])
-
-        path_info = uri_parts.path
-        if script_name:
-            path_info = path_info.split(script_name, 1)[-1]
-
-        environ['PATH_INFO'] = unquote(path_info)
-        environ['SCRIPT_NAME'] = script_name
-
-        environ['tulip.reader'] = self.stream
-        environ['tulip.writer'] = self.transport
-
-        return environ
+        return remote[0], str(remote[1])
 
     @tulip.coroutine
     def handle_request(self, message, payload):
         """Handle a single HTTP request"""
 
+        cleanup = None
         if self.readpayload:
-            wsgiinput = io.BytesIO()
+            spool, size = yield from self.read_payload(payload)
+            payload = spool
+            if self.SPOOL_MMAP and size > self.SPOOL_MAX_SIZE:
+                # data is on disk, let the application map it
+                payload = mmap.mmap(
+                    spool.fileno(), 0, access=mmap.ACCESS_READ)
+            cleanup = functools.partial(close_payload, spool, payload)
+
+        if self.thread_pool is not None:
+            # the application thread can outlive this request handler,
+            # thread pool closes the payload
+            response = self.create_wsgi_response(message)
+            yield from self.thread_pool.run(
+                self.wsgi, self.create_wsgi_environ(message, payload),
+                response, cleanup)
+            if response.response.keep_alive():
+                self.keep_alive(True)
+            return
+
+        try:
+            yield from self._handle_request(message, payload)
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+    @tulip.coroutine
+    def read_payload(self, payload):
+        """Read payload into a spooled temporary file, data is kept
+        in memory up to SPOOL_MAX_SIZE bytes. Returns file and size."""
+        spool = tempfile.SpooledTemporaryFile(self.SPOOL_MAX_SIZE)
+        size = 0
+        try:
             chunk = yield from payload.read()
             while chunk:
-                wsgiinput.write(chunk)
+                spool.write(chunk)
+                size += len(chunk)
                 chunk = yield from payload.read()
-            payload = wsgiinput
+        except:
+            spool.close()
+            raise
 
+        spool.seek(0)
+        return spool, size
+
+    @tulip.coroutine
+    def _handle_request(self, message, payload):
         environ = self.create_wsgi_environ(message, payload)
         response = self.create_wsgi_response(message)
 
@@ -159,6 +268,17 @@ class WSGIServerHttpProtocol(server.ServerHttpProtocol):
             riter = yield from riter
 
         resp = response.response
+        if (response.encoding is not None and
+                self.compress_cache is not None and
+                isinstance(riter, FileWrapper) and not resp.headers_sent):
+            data = yield from self.compress_cache.get(
+                riter.fobj, response.encoding, self.COMPRESS_LEVEL)
+            if data is not None:
+                riter.close()
+                riter = (data,)
+                resp.filters = []
+                resp.add_header('CONTENT-LENGTH', str(len(data)))
+
         try:
             for item in riter:
                 if isinstance(item, tulip.Future):
@@ -174,6 +294,287 @@ class WSGIServerHttpProtocol(server.ServerHttpProtocol):
             self.keep_alive(True)
 
 
+class WSGIThreadPool:
+    """Runs blocking WSGI applications in a pool of threads.
+
+    At most max_workers applications run at the same time and at most
+    max_pending requests wait for a free thread, other requests are
+    answered with '503 Service Unavailable'. Response data is written
+    by the event loop; the application thread waits while the transport
+    write buffer is over write_buffer_limit bytes. An application thread
+    waits at most timeout seconds for the event loop to write response
+    data or to read request payload, then the operation is cancelled and
+    concurrent.futures.TimeoutError is raised in the application.
+
+    One pool is usually shared by all protocol instances of a server:
+
+      >> pool = WSGIThreadPool(max_workers=10)
+      >> loop.start_serving(
+      ..     lambda: WSGIServerHttpProtocol(app, thread_pool=pool), host, port)
+    """
+
+    def __init__(self, max_workers=10, max_pending=100,
+                 write_buffer_limit=2**16, timeout=60.0):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.write_buffer_limit = write_buffer_limit
+        self.timeout = timeout
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers)
+
+        # pool can be shared by servers running in different threads
+        self._lock = threading.Lock()
+        self.active = 0  # running and waiting requests
+        self._stats = collections.Counter()
+
+    def stats(self):
+        """Return pool statistics.
+
+        requests: handled requests, rejected: requests answered with 503,
+        active and pending: current number of requests, queue_time and
+        latency: average seconds spent waiting for a thread and
+        handling a request."""
+        with self._lock:
+            stats = self._stats.copy()
+            active = self.active
+
+        requests = stats['requests']
+        return {
+            'requests': requests,
+            'rejected': stats['rejected'],
+            'active': active,
+            'pending': max(0, active - self.max_workers),
+            'queue_time': stats['queue_time'] / requests
+            if requests else 0.0,
+            'latency': stats['latency'] / requests
+            if requests else 0.0,
+        }
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait)
+
+    @tulip.coroutine
+    def run(self, app, environ, response, cleanup=None):
+        """Run application in a thread and send its response.
+
+        cleanup is called once the application is done."""
+        with self._lock:
+            rejected = self.active >= self.max_workers + self.max_pending
+            if rejected:
+                self._stats['rejected'] += 1
+            else:
+                # 'active' is decreased by the thread, request handler
+                # can be cancelled while the application is running
+                self.active += 1
+
+        if rejected:
+            if cleanup is not None:
+                cleanup()
+            raise errors.HttpStatusException(503)
+
+        loop = tulip.get_event_loop()
+        if not hasattr(environ['wsgi.input'], 'readline'):
+            environ['wsgi.input'] = BlockingReader(
+                loop, environ['wsgi.input'], self.timeout)
+        environ['wsgi.async'] = False
+        environ['wsgi.multithread'] = True
+
+        yield from loop.run_in_executor(
+            self.executor, self._run, loop, app, environ, response,
+            cleanup, time.monotonic())
+
+    def _finished(self, queue_time, latency):
+        with self._lock:
+            self.active -= 1
+            self._stats['requests'] += 1
+            self._stats['queue_time'] += queue_time
+            self._stats['latency'] += latency
+
+    def _run(self, loop, app, environ, response, cleanup, submitted):
+        # runs in a thread of the pool
+        queue_time = time.monotonic() - submitted
+        try:
+            self._run_app(loop, app, environ, response)
+        finally:
+            if cleanup is not None:
+                cleanup()
+            # not through the loop, it can be closed by now
+            self._finished(queue_time, time.monotonic() - submitted)
+
+    def _run_app(self, loop, app, environ, response):
+
+        def write(data):
+            if data:
+                run_in_loop(loop, self._write(response.response, data),
+                            self.timeout)
+
+        def start_response(status, headers, exc_info=None):
+            response.start_response(status, headers, exc_info)
+            return write
+
+        result = app(environ, start_response)
+        try:
+            for data in result:
+                write(data)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+
+        run_in_loop(loop, self._write_eof(response.response), self.timeout)
+
+    @tulip.coroutine
+    def _write(self, resp, data):
+        resp.write(data)
+
+        transport = resp.transport
+        if transport.get_write_buffer_size() > self.write_buffer_limit:
+            yield from transport.drain()
+
+    @tulip.coroutine
+    def _write_eof(self, resp):
+        resp.write_eof()
+
+
+def run_in_loop(loop, coro, timeout=None):
+    """Run coroutine in the event loop from another thread,
+    wait for its result.
+
+    If the coroutine does not finish in timeout seconds it is cancelled
+    and concurrent.futures.TimeoutError is raised. RuntimeError is
+    raised if the event loop is closed."""
+    future = concurrent.futures.Future()
+    task = None
+
+    def done(task):
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def start():
+        nonlocal task
+        if not future.set_running_or_notify_cancel():
+            coro.close()  # timed out before the loop got to it
+            return
+        task = tulip.Task(coro, loop=loop)
+        task.add_done_callback(done)
+
+    def cancel():
+        if task is not None:
+            task.cancel()
+
+    loop.call_soon_threadsafe(start)
+    try:
+        return future.result(timeout)
+    except concurrent.futures.TimeoutError:
+        if not future.cancel():
+            try:
+                loop.call_soon_threadsafe(cancel)
+            except RuntimeError:
+                pass  # loop is closed, task never runs again
+        raise
+
+
+class BlockingReader:
+    """Blocking file-like reader of the request payload, 'wsgi.input'
+    of applications running in a WSGIThreadPool."""
+
+    def __init__(self, loop, payload, timeout=None):
+        self._loop = loop
+        self._payload = payload
+        self._timeout = timeout
+        self._buffer = bytearray()
+        self._eof = False
+
+    def _fill(self):
+        chunk = run_in_loop(
+            self._loop, self._payload.read(), self._timeout)
+        if chunk:
+            self._buffer.extend(chunk)
+        else:
+            self._eof = True
+
+    def _take(self, size):
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def read(self, size=-1):
+        if size is None:
+            size = -1
+
+        while not self._eof and (size < 0 or len(self._buffer) < size):
+            self._fill()
+
+        return self._take(len(self._buffer) if size < 0 else size)
+
+    def readline(self, size=-1):
+        if size is None:
+            size = -1
+
+        start = 0
+        while True:
+            pos = self._buffer.find(b'\n', start)
+            if pos >= 0:
+                end = pos + 1
+                break
+            if self._eof or 0 <= size <= len(self._buffer):
+                end = len(self._buffer)
+                break
+            start = len(self._buffer)
+            self._fill()
+
+        if size >= 0:
+            end = min(end, size)
+        return self._take(end)
+
+    def readlines(self, hint=-1):
+        lines = []
+        total = 0
+        for line in self:
+            lines.append(line)
+            total += len(line)
+            if 0 < hint <= total:
+                break
+        return lines
+
+    def __iter__(self):
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+
+
+def close_payload(spool, payload):
+    if payload is not spool:
+        payload.close()
+    spool.close()
+
+
+# header name -> environ key
+_ENVIRON_KEYS = {
+    'CONTENT-TYPE': 'CONTENT_TYPE',
+    'CONTENT-LENGTH': 'CONTENT_LENGTH',
+}
+_ENVIRON_KEYS_MAX = 1024
+
+# headers that are not joined if repeated
+_SINGLE_HEADERS = frozenset(('CONTENT_TYPE', 'CONTENT_LENGTH'))
+
+# encoding suffix of the entity tags of compressed representations
+_ETAG_ENCODING_RE = re.compile(r'-(?:gzip|deflate)"')
+
+
+def environ_key(name):
+    """Return environ key of a (upper case) header name."""
+    key = 'HTTP_%s' % name.replace('-', '_')
+    # header names are sent by clients, keep the mapping bounded
+    if len(_ENVIRON_KEYS) < _ENVIRON_KEYS_MAX:
+        _ENVIRON_KEYS[name] = key
+    return key
+
+
 class FileWrapper:
     """Custom file wrapper."""
 
@@ -193,14 +594,168 @@ class FileWrapper:
         raise StopIteration
 
 
+class PrecompressedCache:
+    """Cache of compressed file contents.
+
+    Entries are keyed by file path, modification time, size and
+    encoding, so a modified file is compressed again. Entries are kept
+    in memory up to max_size bytes (least recently used entries are
+    dropped) and also written to directory if it is set. The oldest
+    files in directory are removed when it holds more than
+    max_disk_size bytes. Files larger than max_size are not cached,
+    they are compressed while they are sent.
+
+    Files are compressed, and cache files read and written, in the
+    event loop's default executor, so a cache miss for a large file
+    does not block the loop. Concurrent misses for the same entry wait
+    for a single compression.
+    """
+
+    def __init__(self, max_size=32*1024*1024, directory=None,
+                 max_disk_size=256*1024*1024):
+        self.max_size = max_size
+        self.directory = directory
+        self.max_disk_size = max_disk_size
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        self._pending = {}  # key -> list of waiters
+
+    @tulip.coroutine
+    def get(self, fobj, encoding, level=zlib.Z_DEFAULT_COMPRESSION):
+        """Return compressed content of file object,
+        None if it is not a regular file or larger than max_size."""
+        try:
+            path = os.path.abspath(fobj.name)
+            stat = os.fstat(fobj.fileno())
+        except (AttributeError, TypeError, OSError, ValueError):
+            return None
+
+        if stat.st_size > self.max_size:
+            return None
+
+        key = (path, stat.st_mtime, stat.st_size, encoding, level)
+        data = self._entries.get(key)
+        if data is not None:
+            self._entries.move_to_end(key)
+            return data
+
+        waiters = self._pending.get(key)
+        if waiters is None:
+            waiters = self._pending[key] = []
+            loop = tulip.get_event_loop()
+            fut = loop.run_in_executor(
+                None, self._load, fobj, key, encoding, level)
+            fut.add_done_callback(functools.partial(self._loaded, key))
+
+        waiter = tulip.Future()
+        waiters.append(waiter)
+        return (yield from waiter)
+
+    def _load(self, fobj, key, encoding, level):
+        # runs in the executor
+        filename = None
+        if self.directory is not None:
+            filename = os.path.join(
+                self.directory,
+                hashlib.sha1(repr(key).encode('utf-8')).hexdigest())
+            try:
+                with open(filename, 'rb') as fp:
+                    return fp.read()
+            except OSError:
+                pass
+
+        try:
+            fobj.seek(0)
+            zcomp = protocol.compressobj(encoding, level)
+            data = zcomp.compress(fobj.read()) + zcomp.flush()
+        except (OSError, ValueError):
+            # file was closed, the response compresses it while sending
+            return None
+
+        if filename is not None:
+            self._store(filename, data)
+        return data
+
+    def _loaded(self, key, fut):
+        waiters = self._pending.pop(key)
+        data = None
+        if not fut.cancelled() and fut.exception() is None:
+            data = fut.result()
+
+        if data is not None and len(data) <= self.max_size:
+            self._entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_size:
+                _, old = self._entries.popitem(last=False)
+                self.size -= len(old)
+
+        for waiter in waiters:
+            if not waiter.cancelled():
+                waiter.set_result(data)
+
+    def _store(self, filename, data):
+        """Write compressed data to the cache directory, errors are
+        ignored because the data is in memory already."""
+        tmp = '%s.%s' % (filename, os.getpid())
+        try:
+            with open(tmp, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmp, filename)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+
+        self._prune()
+
+    def _prune(self):
+        """Remove the oldest cache files until the directory holds
+        at most max_disk_size bytes."""
+        files = []
+        total = 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            # only files named by _store(), sha1 hex digests
+            if len(name) != 40:
+                continue
+            filename = os.path.join(self.directory, name)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, filename))
+            total += st.st_size
+
+        files.sort()
+        for mtime, size, filename in files:
+            if total <= self.max_disk_size:
+                break
+            try:
+                os.unlink(filename)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+
 class WsgiResponse:
     """Implementation of start_response() callable as specified by PEP 3333"""
 
     status = None
+    encoding = None  # negotiated content encoding
 
-    def __init__(self, transport, message):
+    def __init__(self, transport, message, server=None):
         self.transport = transport
         self.message = message
+        self.server = server
 
     def start_response(self, status, headers, exc_info=None):
         if exc_info:
@@ -216,6 +771,109 @@ class WsgiResponse:
         self.response = tulip.http.Response(
             self.transport, status_code,
             self.message.version, self.message.should_close)
+
+        if self.server is not None and self.server.compress:
+            headers = self.negotiate_compression(status_code, headers)
+
         self.response.add_headers(*headers)
         self.response._send_headers = True
         return self.response.write
+
+    def negotiate_compression(self, status_code, headers):
+        """Enable response compression if the client accepts it.
+        Returns updated headers."""
+        settings = self.server
+        content_type = length = None
+        for name, value in headers:
+            name = name.lower()
+            if name == 'content-encoding':
+                return headers
+            elif name == 'content-type':
+                content_type = value.split(';', 1)[0].strip().lower()
+            elif name == 'content-length':
+                try:
+                    length = int(value)
+                except ValueError:
+                    # let the response writer deal with it
+                    return headers
+
+        if status_code == 304:
+            return self.not_modified_headers(headers)
+
+        # a compressed partial response would not match its content-range
+        if (status_code in (204, 206) or
+                content_type not in settings.COMPRESS_TYPES):
+            return headers
+
+        headers = add_vary(headers, 'Accept-Encoding')
+
+        if length is not None and length < settings.COMPRESS_MIN_SIZE:
+            return headers
+
+        self.encoding = self.accepted_encoding()
+        if self.encoding is None:
+            return headers
+
+        result = []
+        for name, value in headers:
+            lname = name.lower()
+            if lname == 'content-length':
+                continue
+            elif lname == 'etag':
+                # compressed representation has its own entity tag
+                value = etag_with_encoding(value, self.encoding)
+            result.append((name, value))
+
+        result.append(('Content-Encoding', self.encoding))
+        self.response.add_compression_filter(
+            self.encoding, settings.COMPRESS_LEVEL)
+        return result
+
+    def accepted_encoding(self):
+        accept = ','.join(value for name, value in self.message.headers
+                          if name == 'ACCEPT-ENCODING')
+        return protocol.negotiate_encoding(accept)
+
+    def not_modified_headers(self, headers):
+        """A 304 response carries the entity tag the client has, which
+        is the one of the compressed representation if the client asked
+        with it."""
+        encoding = self.accepted_encoding()
+        if encoding is None:
+            return headers
+
+        suffix = '-%s"' % encoding
+        if not any(name == 'IF-NONE-MATCH' and suffix in value
+                   for name, value in self.message.headers):
+            return headers
+
+        headers = add_vary(headers, 'Accept-Encoding')
+        return [(name, etag_with_encoding(value, encoding)
+                 if name.lower() == 'etag' else value)
+                for name, value in headers]
+
+
+def etag_with_encoding(etag, encoding):
+    """Return the entity tag of the representation compressed with
+    encoding."""
+    etag = etag.strip()
+    if etag.endswith('"'):
+        etag = '%s-%s"' % (etag[:-1], encoding)
+    return etag
+
+
+def add_vary(headers, field):
+    """Return headers with field added to the Vary header."""
+    result = []
+    found = False
+    for name, value in headers:
+        if name.lower() == 'vary':
+            found = True
+            fields = [f.strip().lower() for f in value.split(',')]
+            if field.lower() not in fields and '*' not in fields:
+                value = '%s, %s' % (value, field)
+        result.append((name, value))
+
+    if not found:
+        result.append(('Vary', field))
+    return result
@@ -19,8 +19,11 @@ class _ProactorSocketTransport(transports.Transport):
         self._extra['socket'] = sock
         self._loop = loop
         self._sock = sock
+        if loop.tcp_nodelay:
+            base_events._set_nodelay(sock)
         self._protocol = protocol
         self._buffer = []
+        self._drain_waiters = []
         self._read_fut = None
         self._write_fut = None
         self._conn_lost = 0
@@ -83,6 +86,23 @@ class _ProactorSocketTransport(transports.Transport):
         if not self._write_fut:
             self._loop_writing()
 
+    def get_write_buffer_size(self):
+        return sum(len(data) for data in self._buffer)
+
+    def drain(self):
+        waiter = futures.Future(loop=self._loop)
+        if (self._buffer or self._write_fut) and not self._conn_lost:
+            self._drain_waiters.append(waiter)
+        else:
+            waiter.set_result(None)
+        return waiter
+
+    def _wakeup_drain_waiters(self):
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for waiter in waiters:
+            if not waiter.cancelled():
+                waiter.set_result(None)
+
     def _loop_writing(self, f=None):
         try:
             assert f is self._write_fut
@@ -92,6 +112,7 @@ class _ProactorSocketTransport(transports.Transport):
             self._buffer = []
             if not data:
                 self._write_fut = None
+                self._wakeup_drain_waiters()
                 if self._closing:
                     self._loop.call_soon(self._call_connection_lost, None)
                 return
@@ -129,6 +150,7 @@ class _ProactorSocketTransport(transports.Transport):
             self._read_fut.cancel()
         self._write_fut = self._read_fut = None
         self._buffer = []
+        self._wakeup_drain_waiters()
         self._loop.call_soon(self._call_connection_lost, exc)
 
     def _call_connection_lost(self, exc):
@@ -208,6 +230,8 @@ class BaseProactorEventLoop(base_events.BaseEventLoop):
             f.add_done_callback(self._loop_self_reading)
 
     def _write_to_self(self):
+        if self._csock is None:
+            raise RuntimeError('Event loop is closed')
         self._csock.send(b'x')
 
     def _start_serving(self, protocol_factory, sock, ssl=None):
@@ -1,6 +1,6 @@
 """Abstract Protocol class."""
 
-__all__ = ['Protocol', 'DatagramProtocol']
+__all__ = ['Protocol', 'DatagramProtocol', 'BatchDatagramProtocol']
 
 
 class BaseProtocol:
@@ -76,3 +76,20 @@ class DatagramProtocol(BaseProtocol):
 
     def connection_refused(self, exc):
         """Connection is refused."""
+
+
+class BatchDatagramProtocol(DatagramProtocol):
+    """Datagram protocol that receives datagrams in batches.
+
+    Transport reads all datagrams available in one event loop
+    iteration (up to its batch_size) and passes them together.
+    """
+
+    def datagrams_received(self, datagrams):
+        """Called with a list of (data, addr) tuples.
+
+        The default implementation calls datagram_received()
+        for each datagram.
+        """
+        for data, addr in datagrams:
+            self.datagram_received(data, addr)
@@ -15,6 +15,7 @@ from . import base_events
 from . import constants
 from . import events
 from . import futures
+from . import protocols
 from . import selectors
 from . import transports
 from .log import tulip_log
@@ -39,6 +40,9 @@ class BaseSelectorEventLoop(base_events.BaseEventLoop):
     See events.EventLoop for API specification.
     """
 
+    # number of client TLS sessions kept for resumption
+    ssl_session_cache_size = 256
+
     def __init__(self, selector=None):
         super().__init__()
 
@@ -47,15 +51,19 @@ class BaseSelectorEventLoop(base_events.BaseEventLoop):
         tulip_log.debug('Using selector: %s', selector.__class__.__name__)
         self._selector = selector
         self._make_self_pipe()
+        # (sslcontext, host, port) -> ssl.SSLSession
+        self._ssl_sessions = collections.OrderedDict()
 
     def _make_socket_transport(self, sock, protocol, waiter=None, *,
                                extra=None):
         return _SelectorSocketTransport(self, sock, protocol, waiter, extra)
 
     def _make_ssl_transport(self, rawsock, protocol, sslcontext, waiter, *,
-                            server_side=False, extra=None):
+                            server_side=False, extra=None,
+                            server_hostname=None):
         return _SelectorSslTransport(
-            self, rawsock, protocol, sslcontext, waiter, server_side, extra)
+            self, rawsock, protocol, sslcontext, waiter, server_side, extra,
+            server_hostname)
 
     def _make_datagram_transport(self, sock, protocol,
                                  address=None, extra=None):
@@ -93,6 +101,8 @@ class BaseSelectorEventLoop(base_events.BaseEventLoop):
             pass
 
     def _write_to_self(self):
+        if self._csock is None:
+            raise RuntimeError('Event loop is closed')
         try:
             self._csock.send(b'x')
         except (BlockingIOError, InterruptedError):
@@ -335,10 +345,28 @@ class _SelectorTransport(transports.Transport):
         self._sock_fd = sock.fileno()
         self._protocol = protocol
         self._buffer = []
+        self._drain_waiters = []
         self._conn_lost = 0
         self._writing = True
         self._closing = False  # Set when close() called.
 
+    def get_write_buffer_size(self):
+        return sum(len(data) for data in self._buffer)
+
+    def drain(self):
+        waiter = futures.Future(loop=self._loop)
+        if self._buffer and not self._conn_lost:
+            self._drain_waiters.append(waiter)
+        else:
+            waiter.set_result(None)
+        return waiter
+
+    def _wakeup_drain_waiters(self):
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for waiter in waiters:
+            if not waiter.cancelled():
+                waiter.set_result(None)
+
     def abort(self):
         self._force_close(None)
 
@@ -364,6 +392,7 @@ class _SelectorTransport(transports.Transport):
         self._loop.remove_writer(self._sock_fd)
         self._loop.remove_reader(self._sock_fd)
         self._buffer.clear()
+        self._wakeup_drain_waiters()
         self._loop.call_soon(self._call_connection_lost, exc)
 
     def _call_connection_lost(self, exc):
@@ -378,6 +407,8 @@ class _SelectorSocketTransport(_SelectorTransport):
 
     def __init__(self, loop, sock, protocol, waiter=None, extra=None):
         super().__init__(loop, sock, protocol, extra)
+        if loop.tcp_nodelay:
+            base_events._set_nodelay(self._sock)
 
         self._loop.add_reader(self._sock_fd, self._read_ready)
         self._loop.call_soon(self._protocol.connection_made, self)
@@ -402,6 +433,14 @@ class _SelectorSocketTransport(_SelectorTransport):
                 finally:
                     self.close()
 
+    def pause(self):
+        if not self._closing:
+            self._loop.remove_reader(self._sock_fd)
+
+    def resume(self):
+        if not self._closing:
+            self._loop.add_reader(self._sock_fd, self._read_ready)
+
     def write(self, data):
         assert isinstance(data, bytes), repr(data)
         if not data:
@@ -431,6 +470,34 @@ class _SelectorSocketTransport(_SelectorTransport):
 
         self._buffer.append(data)
 
+    def writelines(self, list_of_data):
+        """Write a list of data with a single sendmsg() call.
+
+        Data that can not be sent right away is copied
+        to the write buffer."""
+        list_of_data = [data for data in list_of_data if len(data)]
+        if not list_of_data:
+            return
+
+        if (self._conn_lost or self._buffer or not self._writing or
+                not hasattr(self._sock, 'sendmsg')):
+            self.write(b''.join(list_of_data))
+            return
+
+        try:
+            n = self._sock.sendmsg(list_of_data)
+        except (BlockingIOError, InterruptedError):
+            n = 0
+        except socket.error as exc:
+            self._fatal_error(exc)
+            return
+
+        if n == sum(len(data) for data in list_of_data):
+            return
+
+        self._loop.add_writer(self._sock_fd, self._write_ready)
+        self._buffer.append(b''.join(list_of_data)[n:])
+
     def _write_ready(self):
         if not self._writing:
             return  # transmission off
@@ -448,6 +515,7 @@ class _SelectorSocketTransport(_SelectorTransport):
         else:
             if n == len(data):
                 self._loop.remove_writer(self._sock_fd)
+                self._wakeup_drain_waiters()
                 if self._closing:
                     self._call_connection_lost(None)
                 return
@@ -476,22 +544,48 @@ class _SelectorSocketTransport(_SelectorTransport):
 
 class _SelectorSslTransport(_SelectorTransport):
 
+    # plaintext size of the largest TLS record
+    record_size = 16 * 1024
+
+    # max bytes read or written in one event loop iteration
+    max_size = 256 * 1024
+
     def __init__(self, loop, rawsock, protocol, sslcontext, waiter=None,
-                 server_side=False, extra=None):
+                 server_side=False, extra=None, server_hostname=None):
         if server_side:
             assert isinstance(
                 sslcontext, ssl.SSLContext), 'Must pass an SSLContext'
         else:
             # Client-side may pass ssl=True to use a default context.
-            sslcontext = sslcontext or ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+            sslcontext = sslcontext or _default_ssl_context()
+
+        # resume the previous session with the same server
+        self._session_key = None
+        wrap_args = {}
+        if not server_side and server_hostname is not None:
+            if ssl.HAS_SNI:
+                wrap_args['server_hostname'] = server_hostname
+            if hasattr(ssl, 'SSLSession'):
+                self._session_key = (
+                    sslcontext, server_hostname, rawsock.getpeername()[1])
+                session = loop._ssl_sessions.get(self._session_key)
+                if session is not None:
+                    wrap_args['session'] = session
+
+        if loop.tcp_nodelay:
+            base_events._set_nodelay(rawsock)
         sslsock = sslcontext.wrap_socket(rawsock, server_side=server_side,
-                                         do_handshake_on_connect=False)
+                                         do_handshake_on_connect=False,
+                                         **wrap_args)
 
         super().__init__(loop, sslsock, protocol, extra)
 
         self._waiter = waiter
         self._rawsock = rawsock
         self._sslcontext = sslcontext
+        self._handshaking = True
+        # set while a read waits for the socket to become writable
+        self._read_wants_write = False
 
         self._on_handshake()
 
@@ -516,57 +610,122 @@ class _SelectorSslTransport(_SelectorTransport):
             raise
         self._loop.remove_reader(self._sock_fd)
         self._loop.remove_writer(self._sock_fd)
+        self._handshaking = False
+
+        self._save_session()
+
+        # writer is registered only while there is data to send
         self._loop.add_reader(self._sock_fd, self._on_ready)
-        self._loop.add_writer(self._sock_fd, self._on_ready)
+        if self._buffer:
+            self._loop.add_writer(self._sock_fd, self._on_ready)
         self._loop.call_soon(self._protocol.connection_made, self)
         if self._waiter is not None:
             self._loop.call_soon(self._waiter.set_result, None)
 
+    def _save_session(self):
+        if self._session_key is None:
+            return
+
+        session = self._sock.session
+        if session is not None:
+            sessions = self._loop._ssl_sessions
+            sessions[self._session_key] = session
+            sessions.move_to_end(self._session_key)
+            if len(sessions) > self._loop.ssl_session_cache_size:
+                sessions.popitem(last=False)
+
+    def _call_connection_lost(self, exc):
+        if self._sock is None:
+            # already called, close() schedules it and _on_ready()
+            # calls it once the buffer is flushed
+            return
+        # TLS 1.3 session tickets arrive after the handshake
+        if not self._handshaking:
+            self._save_session()
+        super()._call_connection_lost(exc)
+
     def _on_ready(self):
         # Because of renegotiations (?), there's no difference between
         # readable and writable.  We just try both.  XXX This may be
         # incorrect; we probably need to keep state about what we
         # should do next.
 
-        # First try reading.
+        # First try reading, up to max_size bytes, one record at a time.
+        self._read_wants_write = False
         if not self._closing:
-            try:
-                data = self._sock.recv(8192)
-            except (BlockingIOError, InterruptedError,
-                    ssl.SSLWantReadError, ssl.SSLWantWriteError):
-                pass
-            except ConnectionResetError as exc:
-                self._force_close(exc)
-            except Exception as exc:
-                self._fatal_error(exc)
-            else:
-                if data:
-                    self._protocol.data_received(data)
-                else:
-                    try:
-                        self._protocol.eof_received()
-                    finally:
-                        self.close()
+            chunks = []
+            size = 0
+            eof = False
+            while size < self.max_size:
+                try:
+                    data = self._sock.recv(self.record_size)
+                except (BlockingIOError, InterruptedError,
+                        ssl.SSLWantReadError):
+                    break
+                except ssl.SSLWantWriteError:
+                    # renegotiation, wait until socket is writable
+                    self._read_wants_write = True
+                    self._loop.add_writer(self._sock_fd, self._on_ready)
+                    break
+                except Exception as exc:
+                    # pass data received so far before the error
+                    if chunks:
+                        self._protocol.data_received(b''.join(chunks))
+                    if isinstance(exc, ConnectionResetError):
+                        self._force_close(exc)
+                    else:
+                        self._fatal_error(exc)
+                    return
+
+                if not data:
+                    eof = True
+                    break
+                chunks.append(data)
+                size += len(data)
+
+            if chunks:
+                self._protocol.data_received(
+                    chunks[0] if len(chunks) == 1 else b''.join(chunks))
+            if eof:
+                try:
+                    self._protocol.eof_received()
+                finally:
+                    self.close()
 
-        # Now try writing, if there's anything to write.
+        # Now try writing, if there's anything to write. Small writes
+        # made since the last iteration are coalesced into full records.
         if self._buffer:
-            data = b''.join(self._buffer)
-            self._buffer = []
-            try:
-                n = self._sock.send(data)
-            except (BlockingIOError, InterruptedError,
-                    ssl.SSLWantReadError, ssl.SSLWantWriteError):
-                n = 0
-            except Exception as exc:
-                self._fatal_error(exc)
-                return
+            # send at most max_size bytes, do not join the whole buffer
+            buffer = self._buffer
+            count = size = 0
+            while count < len(buffer) and size < self.max_size:
+                size += len(buffer[count])
+                count += 1
+            data = buffer[0] if count == 1 else b''.join(buffer[:count])
+            del buffer[:count]
+
+            view = memoryview(data)
+            pos = 0
+            while pos < len(data):
+                try:
+                    pos += self._sock.send(view[pos:pos+self.record_size])
+                except (BlockingIOError, InterruptedError,
+                        ssl.SSLWantReadError, ssl.SSLWantWriteError):
+                    break
+                except Exception as exc:
+                    self._fatal_error(exc)
+                    return
 
-            if n < len(data):
-                self._buffer.append(data[n:])
+            if pos < len(data):
+                buffer.insert(0, data[pos:])
+            elif not buffer:
+                self._wakeup_drain_waiters()
 
-        if self._closing and not self._buffer:
-            self._loop.remove_writer(self._sock_fd)
-            self._call_connection_lost(None)
+        if not self._buffer:
+            if not self._read_wants_write:
+                self._loop.remove_writer(self._sock_fd)
+            if self._closing:
+                self._call_connection_lost(None)
 
     def write(self, data):
         assert isinstance(data, bytes), repr(data)
@@ -579,8 +738,11 @@ class _SelectorSslTransport(_SelectorTransport):
             self._conn_lost += 1
             return
 
+        # data is sent by the callback, writes made in the same
+        # event loop iteration are sent together
+        if not self._buffer and not self._handshaking:
+            self._loop.add_writer(self._sock_fd, self._on_ready)
         self._buffer.append(data)
-        # We could optimize, but the callback can do this for now.
 
     def close(self):
         if self._closing:
@@ -588,31 +750,86 @@ class _SelectorSslTransport(_SelectorTransport):
         self._closing = True
         self._conn_lost += 1
         self._loop.remove_reader(self._sock_fd)
+        if not self._buffer:
+            self._loop.call_soon(self._call_connection_lost, None)
 
     # TODO: write_eof(), can_write_eof().
 
 
+def _default_ssl_context():
+    """Shared client context, sessions can only be resumed
+    with the context that created them."""
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    return _ssl_context
+
+_ssl_context = None
+
+
 class _SelectorDatagramTransport(_SelectorTransport):
 
     max_size = 256 * 1024  # max bytes we read in one eventloop iteration
 
+    batch_size = 64  # max datagrams we read in one eventloop iteration
+
+    # max datagrams buffered for sending, extra datagrams are dropped,
+    # None for no limit
+    max_buffer_size = None
+
     def __init__(self, loop, sock, protocol, address=None, extra=None):
         super().__init__(loop, sock, protocol, extra)
 
         self._address = address
         self._buffer = collections.deque()
+        self._batch = isinstance(protocol, protocols.BatchDatagramProtocol)
+        self._stats = collections.Counter()
         self._loop.add_reader(self._sock_fd, self._read_ready)
         self._loop.call_soon(self._protocol.connection_made, self)
 
+    def get_write_buffer_size(self):
+        return sum(len(data) for data, addr in self._buffer)
+
+    def get_stats(self):
+        """Return datagram statistics.
+
+        received, sent: number of datagrams, wakeups: number of read
+        events, dropped: datagrams not sent because the buffer was full
+        or the peer refused them, buffered and buffer_size: number of
+        datagrams and bytes waiting to be sent."""
+        stats = dict.fromkeys(('received', 'sent', 'wakeups', 'dropped'), 0)
+        stats.update(self._stats)
+        stats['buffered'] = len(self._buffer)
+        stats['buffer_size'] = self.get_write_buffer_size()
+        return stats
+
     def _read_ready(self):
+        datagrams = []
         try:
-            data, addr = self._sock.recvfrom(self.max_size)
+            while len(datagrams) < self.batch_size:
+                datagrams.append(self._sock.recvfrom(self.max_size))
         except (BlockingIOError, InterruptedError):
             pass
         except Exception as exc:
+            # pass datagrams received so far before the error
+            self._deliver(datagrams)
             self._fatal_error(exc)
+            return
+        finally:
+            self._stats['wakeups'] += 1
+            self._stats['received'] += len(datagrams)
+
+        self._deliver(datagrams)
+
+    def _deliver(self, datagrams):
+        if self._batch:
+            if datagrams:
+                self._protocol.datagrams_received(datagrams)
         else:
-            self._protocol.datagram_received(data, addr)
+            for data, addr in datagrams:
+                self._protocol.datagram_received(data, addr)
+                if self._closing:
+                    break
 
     def sendto(self, data, addr=None):
         assert isinstance(data, bytes), repr(data)
@@ -635,8 +852,10 @@ class _SelectorDatagramTransport(_SelectorTransport):
                     self._sock.send(data)
                 else:
                     self._sock.sendto(data, addr)
+                self._stats['sent'] += 1
                 return
             except ConnectionRefusedError as exc:
+                self._stats['dropped'] += 1
                 if self._address:
                     self._fatal_error(exc)
                 return
@@ -646,8 +865,46 @@ class _SelectorDatagramTransport(_SelectorTransport):
                 self._fatal_error(exc)
                 return
 
+        if (self.max_buffer_size is not None and
+                len(self._buffer) >= self.max_buffer_size):
+            self._stats['dropped'] += 1
+            return
+
         self._buffer.append((data, addr))
 
+    def sendto_many(self, datagrams):
+        """Send an iterable of (data, addr) tuples, datagrams are
+        buffered once the socket would block."""
+        datagrams = iter(datagrams)
+        if not self._buffer and not self._conn_lost:
+            send, sendto = self._sock.send, self._sock.sendto
+            for data, addr in datagrams:
+                if not data:
+                    continue
+                if self._address:
+                    assert addr in (None, self._address)
+                try:
+                    if self._address:
+                        send(data)
+                    else:
+                        sendto(data, addr)
+                    self._stats['sent'] += 1
+                except ConnectionRefusedError as exc:
+                    self._stats['dropped'] += 1
+                    if self._address:
+                        self._fatal_error(exc)
+                        return
+                except (BlockingIOError, InterruptedError):
+                    self._loop.add_writer(self._sock_fd, self._sendto_ready)
+                    self._buffer.append((data, addr))
+                    break
+                except Exception as exc:
+                    self._fatal_error(exc)
+                    return
+
+        for data, addr in datagrams:
+            self.sendto(data, addr)
+
     def _sendto_ready(self):
         while self._buffer:
             data, addr = self._buffer.popleft()
@@ -656,7 +913,9 @@ class _SelectorDatagramTransport(_SelectorTransport):
                     self._sock.send(data)
                 else:
                     self._sock.sendto(data, addr)
+                self._stats['sent'] += 1
             except ConnectionRefusedError as exc:
+                self._stats['dropped'] += 1
                 if self._address:
                     self._fatal_error(exc)
                 return
@@ -669,6 +928,7 @@ class _SelectorDatagramTransport(_SelectorTransport):
 
         if not self._buffer:
             self._loop.remove_writer(self._sock_fd)
+            self._wakeup_drain_waiters()
             if self._closing:
                 self._call_connection_lost(None)
 
@@ -2,30 +2,68 @@
 # subprocess management transport for use with
 # connect_{read,write}_pipe().
 
+import collections
 import fcntl
 import os
+import signal
 import traceback
 
-from . import transports
 from . import events
+from . import futures
+from . import locks
+from . import protocols
+from . import streams
+from . import tasks
+from . import transports
 from .log import tulip_log
 
 
+# Delay bounds (in seconds) of polling for the exit of a child.
+_MIN_POLL_DELAY = 0.001
+_MAX_POLL_DELAY = 0.1
+
+
 class UnixSubprocessTransport(transports.Transport):
     """Transport class managing a subprocess.
 
+    read_size is the maximum size of data read from output pipes.
+    If stderr is True, standard error of the child is read from its own
+    pipe and passed to protocol's stderr_received() and
+    stderr_eof_received() methods.
+
+    Writes are buffered; drain() returns a future that is done when
+    the write buffer is at or below the low water mark, callers should
+    wait for it once get_write_buffer_size() is over the high water mark.
+
     TODO: Separate this into something that just handles pipe I/O,
     and something else that handles pipe setup, fork, and exec.
     """
 
-    def __init__(self, protocol, args):
+    def __init__(self, protocol, args, *, read_size=2**16, stderr=False,
+                 write_high_water=2**18, write_low_water=2**16):
         self._protocol = protocol  # Not a factory! :-)
         self._args = args  # args[0] must be full path of binary.
         self._event_loop = events.get_event_loop()
+        self._read_size = read_size
         self._buffer = []
+        self._buffer_size = 0
+        self._drain_waiters = []
         self._eof = False
+        self._returncode = None
+        self.set_write_buffer_limits(write_high_water, write_low_water)
+
         rstdin, self._wstdin = os.pipe()
         self._rstdout, wstdout = os.pipe()
+        if stderr:
+            self._rstderr, wstderr = os.pipe()
+        else:
+            self._rstderr = wstderr = -1
+
+        # parent ends of pipes must not leak into other children,
+        # child would keep them open and never see eof
+        for fd in (self._wstdin, self._rstdout, self._rstderr):
+            if fd >= 0:
+                _setcloexec(fd)
 
         # TODO: This is incredibly naive.  Should look at
         # subprocess.py for all the precautions around fork/exec.
@@ -35,21 +73,88 @@ class UnixSubprocessTransport(transports.Transport):
             try:
                 os.dup2(rstdin, 0)
                 os.dup2(wstdout, 1)
-                # TODO: What to do with stderr?
+                if wstderr >= 0:
+                    os.dup2(wstderr, 2)
                 os.execv(args[0], args)
             except:
                 try:
-                    traceback.print_traceback()
+                    traceback.print_exc()
                 finally:
                     os._exit(127)
 
         # Parent.
+        self._pid = pid
         os.close(rstdin)
         os.close(wstdout)
         _setnonblocking(self._wstdin)
         _setnonblocking(self._rstdout)
         self._event_loop.call_soon(self._protocol.connection_made, self)
         self._event_loop.add_reader(self._rstdout, self._stdout_callback)
+        if wstderr >= 0:
+            os.close(wstderr)
+            _setnonblocking(self._rstderr)
+            self._event_loop.add_reader(self._rstderr, self._stderr_callback)
+
+    def get_pid(self):
+        return self._pid
+
+    def get_returncode(self):
+        """Exit status of the child, None if it is still running."""
+        return self._returncode
+
+    def send_signal(self, sig):
+        if self._returncode is None:
+            os.kill(self._pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+    def pause(self):
+        """Stop reading output of the child."""
+        self._event_loop.remove_reader(self._rstdout)
+        if self._rstderr >= 0:
+            self._event_loop.remove_reader(self._rstderr)
+
+    def resume(self):
+        """Resume reading output of the child."""
+        if self._rstdout >= 0:
+            self._event_loop.add_reader(self._rstdout, self._stdout_callback)
+        if self._rstderr >= 0:
+            self._event_loop.add_reader(self._rstderr, self._stderr_callback)
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        if high is None:
+            high = 4 * low if low is not None else 2**18
+        if low is None:
+            low = high // 4
+        assert 0 <= low <= high, (low, high)
+        self._high_water = high
+        self._low_water = low
+
+    def get_write_buffer_limits(self):
+        return self._high_water, self._low_water
+
+    def get_write_buffer_size(self):
+        return self._buffer_size
+
+    def drain(self):
+        """Return a future that is done when the write buffer size is
+        at or below the low water mark."""
+        waiter = futures.Future(loop=self._event_loop)
+        if self._buffer_size <= self._low_water:
+            waiter.set_result(None)
+        else:
+            self._drain_waiters.append(waiter)
+        return waiter
+
+    def _wakeup_drain_waiters(self):
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
 
     def write(self, data):
         assert not self._eof
@@ -73,6 +178,7 @@ class UnixSubprocessTransport(transports.Transport):
                     data = data[n:]
             self._event_loop.add_writer(self._wstdin, self._stdin_callback)
         self._buffer.append(data)
+        self._buffer_size += len(data)
 
     def write_eof(self):
         assert not self._eof
@@ -91,24 +197,67 @@ class UnixSubprocessTransport(transports.Transport):
 
     def _fatal_error(self, exc):
         tulip_log.error('Fatal error: %r', exc)
-        if self._rstdout >= 0:
-            os.close(self._rstdout)
-            self._rstdout = -1
+        for name in ('_rstdout', '_rstderr'):
+            fd = getattr(self, name)
+            if fd >= 0:
+                self._event_loop.remove_reader(fd)
+                os.close(fd)
+                setattr(self, name, -1)
         if self._wstdin >= 0:
+            self._event_loop.remove_writer(self._wstdin)
             os.close(self._wstdin)
             self._wstdin = -1
         self._eof = True
-        self._buffer = None
+        self._buffer = []
+        self._buffer_size = 0
+        self._wakeup_drain_waiters()
         self._maybe_cleanup(exc)
 
     _conn_lost_called = False
 
     def _maybe_cleanup(self, exc=None):
-        if (self._wstdin < 0 and
-            self._rstdout < 0 and
+        # child closed its output, it is exiting
+        if (self._rstdout < 0 and
+            self._rstderr < 0 and
             not self._conn_lost_called):
             self._conn_lost_called = True
-            self._event_loop.call_soon(self._protocol.connection_lost, exc)
+            # reap the child, connection_lost() is called once it exited
+            self._event_loop.call_soon(
+                self._poll_child, exc, _MIN_POLL_DELAY)
+
+    def _poll_child(self, exc, delay):
+        # waitpid() with WNOHANG does not block the event loop or tie
+        # up an executor thread until the child exits, poll it with
+        # a growing delay instead.
+        try:
+            pid, status = os.waitpid(self._pid, os.WNOHANG)
+        except ChildProcessError:
+            # somebody else reaped the child, its status is lost
+            pid, status = self._pid, None
+        if not pid:
+            self._event_loop.call_later(
+                delay, self._poll_child, exc,
+                min(delay * 2, _MAX_POLL_DELAY))
+        else:
+            self._child_exited(status, exc)
+
+    def _child_exited(self, status, exc):
+        if status is not None:
+            if os.WIFSIGNALED(status):
+                self._returncode = -os.WTERMSIG(status)
+            else:
+                self._returncode = os.WEXITSTATUS(status)
+
+        if self._wstdin >= 0:
+            self._event_loop.remove_writer(self._wstdin)
+            os.close(self._wstdin)
+            self._wstdin = -1
+        self._eof = True
+        self._buffer = []
+        self._buffer_size = 0
+        self._wakeup_drain_waiters()
+
+        self._protocol.connection_lost(exc)
 
     def _stdin_callback(self):
         data = b''.join(self._buffer)
@@ -123,6 +272,8 @@ class UnixSubprocessTransport(transports.Transport):
             self._fatal_error(exc)
         else:
             if n >= len(data):
+                self._buffer_size = 0
+                self._wakeup_drain_waiters()
                 self._event_loop.remove_writer(self._wstdin)
                 if self._eof:
                     os.close(self._wstdin)
@@ -132,25 +283,215 @@ class UnixSubprocessTransport(transports.Transport):
 
             elif n > 0:
                 data = data[n:]
+                self._buffer_size = len(data)
+                if self._buffer_size <= self._low_water:
+                    self._wakeup_drain_waiters()
 
             self._buffer.append(data)  # Try again later.
 
     def _stdout_callback(self):
         try:
-            data = os.read(self._rstdout, 1024)
+            data = os.read(self._rstdout, self._read_size)
         except BlockingIOError:
             pass
         else:
             if data:
-                self._event_loop.call_soon(self._protocol.data_received, data)
+                self._protocol.data_received(data)
             else:
                 self._event_loop.remove_reader(self._rstdout)
                 os.close(self._rstdout)
                 self._rstdout = -1
-                self._event_loop.call_soon(self._protocol.eof_received)
+                self._protocol.eof_received()
+                self._maybe_cleanup()
+
+    def _stderr_callback(self):
+        try:
+            data = os.read(self._rstderr, self._read_size)
+        except BlockingIOError:
+            pass
+        else:
+            if data:
+                self._protocol.stderr_received(data)
+            else:
+                self._event_loop.remove_reader(self._rstderr)
+                os.close(self._rstderr)
+                self._rstderr = -1
+                self._protocol.stderr_eof_received()
                 self._maybe_cleanup()
 
 
+class SubprocessStreamProtocol(protocols.Protocol):
+    """Protocol that feeds output of a subprocess into StreamReaders."""
+
+    transport = None
+
+    def __init__(self, limit=2**16):
+        self.stdout = streams.StreamReader(limit=limit)
+        self.stderr = streams.StreamReader(limit=limit)
+        self.exited = futures.Future()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.stdout.feed_data(data)
+
+    def eof_received(self):
+        self.stdout.feed_eof()
+
+    def stderr_received(self, data):
+        self.stderr.feed_data(data)
+
+    def stderr_eof_received(self):
+        self.stderr.feed_eof()
+
+    def connection_lost(self, exc):
+        if exc is not None:
+            self.stdout.set_exception(exc)
+            self.stderr.set_exception(exc)
+        else:
+            self.stdout.feed_eof()
+            self.stderr.feed_eof()
+
+        if not self.exited.done():
+            self.exited.set_result(self.transport.get_returncode())
+
+
+class Process:
+    """Running subprocess, created by create_subprocess().
+
+    Output is read from the stdout and stderr StreamReaders:
+
+      >> proc = create_subprocess(['/bin/cat'])
+      >> proc.write(b'data')
+      >> yield from proc.drain()
+      >> proc.write_eof()
+      >> data = yield from proc.stdout.read()
+      >> returncode = yield from proc.wait()
+    """
+
+    def __init__(self, transport, protocol):
+        self.transport = transport
+        self.protocol = protocol
+        self.stdout = protocol.stdout
+        self.stderr = protocol.stderr
+
+    def __repr__(self):
+        return '<Process {} returncode={}>'.format(self.pid, self.returncode)
+
+    @property
+    def pid(self):
+        return self.transport.get_pid()
+
+    @property
+    def returncode(self):
+        return self.transport.get_returncode()
+
+    def write(self, data):
+        self.transport.write(data)
+
+    @tasks.coroutine
+    def drain(self):
+        """Wait until the write buffer is below the low water mark,
+        if it is over the high water mark."""
+        high, low = self.transport.get_write_buffer_limits()
+        if self.transport.get_write_buffer_size() > high:
+            yield from self.transport.drain()
+
+    def write_eof(self):
+        self.transport.write_eof()
+
+    @tasks.coroutine
+    def wait(self):
+        """Wait for the child to exit, return its exit status."""
+        return (yield from self.protocol.exited)
+
+    def send_signal(self, sig):
+        self.transport.send_signal(sig)
+
+    def terminate(self):
+        self.transport.terminate()
+
+    def kill(self):
+        self.transport.kill()
+
+    def close(self):
+        self.transport.close()
+
+
+def create_subprocess(args, *, limit=2**16, **kwargs):
+    """Start a subprocess, returns a Process.
+
+    Keyword arguments are passed to UnixSubprocessTransport."""
+    protocol = SubprocessStreamProtocol(limit)
+    transport = UnixSubprocessTransport(protocol, args, **kwargs)
+    protocol.transport = transport
+    return Process(transport, protocol)
+
+
+class ProcessPool:
+    """Pool of long-lived worker processes that talk over pipes.
+
+    At most size workers are running. acquire() returns an idle
+    worker or starts a new one, workers are given back to the pool
+    with release(). Workers that exited are replaced.
+
+      >> pool = ProcessPool(['/path/to/worker'], size=4)
+      >> proc = yield from pool.acquire()
+      >> try:
+      ..     proc.write(request)
+      ..     response = yield from proc.stdout.readline()
+      .. finally:
+      ..     pool.release(proc)
+    """
+
+    def __init__(self, args, size=4, **kwargs):
+        self.args = args
+        self.size = size
+        self.kwargs = kwargs
+        self._idle = collections.deque()
+        self._semaphore = locks.Semaphore(size)
+
+    def __len__(self):
+        return len(self._idle)
+
+    @tasks.coroutine
+    def acquire(self):
+        yield from self._semaphore.acquire()
+
+        try:
+            while self._idle:
+                proc = self._idle.pop()
+                if proc.returncode is None and not proc.stdout.eof:
+                    return proc
+                proc.close()
+
+            return create_subprocess(self.args, **self.kwargs)
+        except:
+            self._semaphore.release()
+            raise
+
+    def release(self, proc, close=False):
+        """Give a worker back, close it if close is True
+        or if it is not usable anymore."""
+        if (close or proc.returncode is not None or
+                proc.stdout.eof or proc.transport._eof):
+            proc.close()
+        else:
+            self._idle.append(proc)
+        self._semaphore.release()
+
+    def close(self):
+        """Close idle workers."""
+        while self._idle:
+            self._idle.pop().close()
+
+
 def _setnonblocking(fd):
     flags = fcntl.fcntl(fd, fcntl.F_GETFL)
     fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def _setcloexec(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
@@ -13,12 +13,21 @@ import re
 import socket
 import sys
 import threading
+import time
 import traceback
 import urllib.parse
 try:
     import ssl
 except ImportError:  # pragma: no cover
     ssl = None
+try:
+    import multiprocessing
+except ImportError:  # pragma: no cover
+    multiprocessing = None
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
 
 import tulip
 import tulip.http
@@ -295,3 +304,376 @@ class Router:
         # keep-alive
         if response.keep_alive():
             self._srv.keep_alive(True)
+
+
+BENCHMARK_BODY = b'Hello, World!'
+
+
+class BenchmarkHttpServer(tulip.http.ServerHttpProtocol):
+    """Minimal keep-alive server used as a throughput baseline."""
+
+    def handle_request(self, message, payload):
+        response = tulip.http.Response(
+            self.transport, 200, message.version)
+        response.add_header('Content-Type', 'text/plain')
+        response.add_header('Content-Length', str(len(BENCHMARK_BODY)))
+        response.send_headers()
+        response.write(BENCHMARK_BODY)
+        response.write_eof()
+        self.keep_alive(response.keep_alive())
+
+
+class BenchmarkTlsServer(tulip.Protocol):
+    """Answers each b'<size>\\n' line with size bytes."""
+
+    block = b'x' * 2**16
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.buf = b''
+
+    def data_received(self, data):
+        self.buf += data
+        while b'\n' in self.buf:
+            line, self.buf = self.buf.split(b'\n', 1)
+            size = int(line)
+            for i in range(size // len(self.block)):
+                self.transport.write(self.block)
+            if size % len(self.block):
+                self.transport.write(self.block[:size % len(self.block)])
+
+
+def benchmark_ssl_context():
+    """Server context with the self-signed sample certificate."""
+    here = os.path.join(os.path.dirname(__file__), '..', 'tests')
+    sslcontext = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    sslcontext.load_cert_chain(os.path.join(here, 'sample.crt'),
+                               os.path.join(here, 'sample.key'))
+    return sslcontext
+
+
+def benchmark_wsgi_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain'),
+                              ('Content-Length', str(len(BENCHMARK_BODY)))])
+    return [BENCHMARK_BODY]
+
+
+@tulip.coroutine
+def benchmark_ws_echo(websocket, uri):
+    while True:
+        message = yield from websocket.recv()
+        if message is None:
+            break
+        websocket.send(message)
+
+
+def _benchmark_serve(kind, host, port, started, app=None):
+    """Run a benchmark server on a new event loop until it is stopped.
+
+    started is called with (loop, stop waiter, address)."""
+    loop = tulip.new_event_loop()
+    tulip.set_event_loop(loop)
+    pool = None
+
+    if kind == 'http':
+        factory = lambda: BenchmarkHttpServer(keep_alive=75)
+        socks = loop.run_until_complete(
+            loop.start_serving(factory, host, port))
+    elif kind == 'wsgi':
+        factory = lambda: tulip.http.WSGIServerHttpProtocol(
+            app or benchmark_wsgi_app, keep_alive=75)
+        socks = loop.run_until_complete(
+            loop.start_serving(factory, host, port))
+    elif kind == 'wsgi-spool':
+        factory = lambda: tulip.http.WSGIServerHttpProtocol(
+            app or benchmark_wsgi_app, readpayload=True, keep_alive=75)
+        socks = loop.run_until_complete(
+            loop.start_serving(factory, host, port))
+    elif kind == 'wsgi-threads':
+        pool = tulip.http.WSGIThreadPool()
+        factory = lambda: tulip.http.WSGIServerHttpProtocol(
+            app or benchmark_wsgi_app, keep_alive=75, thread_pool=pool)
+        socks = loop.run_until_complete(
+            loop.start_serving(factory, host, port))
+    elif kind == 'wsgi-compress':
+        cache = tulip.http.PrecompressedCache()
+        factory = lambda: tulip.http.WSGIServerHttpProtocol(
+            app or benchmark_wsgi_app, keep_alive=75, compress=True,
+            compress_cache=cache)
+        socks = loop.run_until_complete(
+            loop.start_serving(factory, host, port))
+    elif kind == 'tls':
+        socks = loop.run_until_complete(
+            loop.start_serving(BenchmarkTlsServer, host, port,
+                               ssl=benchmark_ssl_context()))
+    elif kind == 'websocket':
+        import websockets
+        socks = loop.run_until_complete(
+            websockets.serve(app or benchmark_ws_echo, host, port))
+    else:
+        raise ValueError('Unknown server kind: {!r}'.format(kind))
+
+    waiter = tulip.Future()
+    started(loop, waiter, socks[0].getsockname())
+    loop.run_until_complete(waiter)
+
+    for s in socks:
+        loop.stop_serving(s)
+    loop.close()
+    if pool is not None:
+        pool.shutdown()
+
+
+def _benchmark_process(kind, host, port, conn, app):
+    def started(loop, waiter, addr):
+        conn.send(addr)
+    _benchmark_serve(kind, host, port, started, app)
+
+
+@contextlib.contextmanager
+def run_benchmark_server(loop, kind='http', *, host='127.0.0.1', port=0,
+                         process=False, app=None):
+    """Run a 'http', 'wsgi', 'wsgi-spool', 'wsgi-threads',
+    'wsgi-compress', 'tls' or 'websocket' benchmark server.
+
+    The server runs its own event loop in a thread, or in a separate
+    process if process is true, so client and server do not compete for
+    one loop. app replaces the default WSGI application or websocket
+    handler. Yields an object with host, port, pid and url().
+    """
+
+    class BenchmarkServer:
+
+        def __init__(self, host, port, pid):
+            self.host = host
+            self.port = port
+            self.address = (host, port)
+            self.pid = pid
+
+        def url(self, path='/'):
+            scheme = 'ws' if kind == 'websocket' else 'http'
+            return '{}://{}:{}{}'.format(scheme, self.host, self.port, path)
+
+    if process:
+        if multiprocessing is None:  # pragma: no cover
+            raise RuntimeError('multiprocessing is not available')
+
+        parent, child = multiprocessing.Pipe()
+        proc = multiprocessing.Process(
+            target=_benchmark_process, args=(kind, host, port, child, app))
+        proc.daemon = True
+        proc.start()
+        try:
+            if not parent.poll(10):
+                raise RuntimeError('Benchmark server did not start')
+            yield BenchmarkServer(*parent.recv(), pid=proc.pid)
+        finally:
+            proc.terminate()
+            proc.join()
+        return
+
+    def started(thread_loop, waiter, addr):
+        loop.call_soon_threadsafe(fut.set_result, (thread_loop, waiter, addr))
+
+    fut = tulip.Future()
+    server_thread = threading.Thread(
+        target=_benchmark_serve, args=(kind, host, port, started, app))
+    server_thread.start()
+
+    thread_loop, waiter, addr = loop.run_until_complete(fut)
+    try:
+        yield BenchmarkServer(*addr, pid=os.getpid())
+    finally:
+        thread_loop.call_soon_threadsafe(waiter.set_result, None)
+        server_thread.join()
+
+
+def get_rss(pid=None, peak=False):
+    """Return the resident set size of a process in bytes, or None.
+    With peak, return the largest resident set size it had."""
+    field = 'VmHWM:' if peak else 'VmRSS:'
+    try:
+        with open('/proc/{}/status'.format(pid or 'self')) as fp:
+            for line in fp:
+                if line.startswith(field):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    if pid is None and resource is not None:  # pragma: no cover
+        # peak rss, in kilobytes on linux and bytes on osx
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024
+
+    return None
+
+
+def percentile(values, q):
+    """Return the q-th percentile (0 <= q <= 100) of sorted values."""
+    if not values:
+        return None
+    index = int(round(q / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def benchmark_result(name, latencies, errors, duration, pid=None):
+    """Summarize a load run as a JSON serializable dict.
+
+    latencies are in seconds, reported latencies in milliseconds."""
+    latencies = sorted(latencies)
+    ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        'name': name,
+        'requests': len(latencies),
+        'errors': errors,
+        'duration': round(duration, 3),
+        'rps': round(len(latencies) / duration, 1) if duration else None,
+        'latency': {
+            'p50': ms(percentile(latencies, 50)),
+            'p90': ms(percentile(latencies, 90)),
+            'p99': ms(percentile(latencies, 99)),
+            'max': ms(latencies[-1] if latencies else None),
+        },
+        'rss': get_rss(pid),
+    }
+
+
+@tulip.coroutine
+def http_load(host, port, *, requests=1000, concurrency=10,
+              keep_alive=True, pipeline=1, path='/', method='GET',
+              body=b'', headers=()):
+    """Send requests to an http server, return (latencies, errors).
+
+    concurrency connections send requests until requests responses
+    have been received. keep_alive reuses connections, pipeline sends
+    that many requests before reading the responses (keep-alive only).
+    Latencies are measured from the write of a request to the end of
+    its response payload.
+    """
+    loop = tulip.get_event_loop()
+    if not keep_alive:
+        pipeline = 1
+
+    hdrs = ['{} {} HTTP/1.1'.format(method, path),
+            'Host: {}:{}'.format(host, port)]
+    if not keep_alive:
+        hdrs.append('Connection: close')
+    if body:
+        hdrs.append('Content-Length: {}'.format(len(body)))
+    hdrs.extend('{}: {}'.format(name, value) for name, value in headers)
+    request = ('\r\n'.join(hdrs) + '\r\n\r\n').encode('latin1') + body
+
+    latencies = []
+    remaining = [requests]
+    errors = [0]
+
+    @tulip.coroutine
+    def worker():
+        transport = proto = None
+        while remaining[0] > 0:
+            count = min(pipeline, remaining[0])
+            remaining[0] -= count
+            try:
+                if transport is None:
+                    transport, proto = yield from loop.create_connection(
+                        tulip.StreamProtocol, host, port)
+
+                started = loop.time()
+                transport.write(request * count)
+
+                for i in range(count):
+                    message = yield from proto.set_parser(
+                        tulip.http.http_response_parser()).read()
+                    if message is None:
+                        raise ConnectionError('Connection closed')
+                    content = proto.set_parser(
+                        tulip.http.http_payload_parser(message))
+                    while (yield from content.read()) is not None:
+                        pass
+                    if message.code >= 400:
+                        errors[0] += 1
+                    else:
+                        latencies.append(loop.time() - started)
+
+                    if message.should_close:
+                        transport.close()
+                        transport = None
+                        errors[0] += count - i - 1
+                        break
+                else:
+                    proto.unset_parser()
+            except Exception:
+                errors[0] += count
+                if transport is not None:
+                    transport.close()
+                    transport = None
+
+        if transport is not None:
+            transport.close()
+
+    yield from tulip.wait([tulip.Task(worker()) for i in range(concurrency)])
+    return latencies, errors[0]
+
+
+@tulip.coroutine
+def websocket_load(uri, *, messages=1000, concurrency=10, size=32):
+    """Exchange messages with a websocket echo server,
+    return (latencies, errors). Latencies are per round trip."""
+    import websockets
+
+    loop = tulip.get_event_loop()
+    data = 'x' * size
+    latencies = []
+    remaining = [messages]
+    errors = [0]
+
+    @tulip.coroutine
+    def worker():
+        try:
+            ws = yield from websockets.connect(uri)
+        except Exception:
+            errors[0] += 1
+            return
+
+        try:
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                started = loop.time()
+                ws.send(data)
+                reply = yield from ws.recv()
+                if reply != data:
+                    errors[0] += 1
+                else:
+                    latencies.append(loop.time() - started)
+        except Exception:
+            errors[0] += 1
+        finally:
+            yield from ws.close()
+
+    yield from tulip.wait([tulip.Task(worker()) for i in range(concurrency)])
+    return latencies, errors[0]
+
+
+def run_benchmark(loop, name, kind='http', *, process=False, app=None,
+                  **options):
+    """Start a kind server, run a load against it and return
+    the benchmark_result() dict. options are passed to http_load()
+    or websocket_load()."""
+    with run_benchmark_server(loop, kind, process=process,
+                              app=app) as server:
+        started = time.time()
+        if kind == 'websocket':
+            latencies, errors = loop.run_until_complete(
+                websocket_load(server.url(), **options))
+        else:
+            latencies, errors = loop.run_until_complete(
+                http_load(server.host, server.port, **options))
+        duration = time.time() - started
+
+        result = benchmark_result(
+            name, latencies, errors, duration,
+            pid=server.pid if process else None)
+        result['kind'] = kind
+        result['process'] = process
+        result['options'] = options
+        return result
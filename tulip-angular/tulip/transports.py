@@ -60,12 +60,25 @@ class WriteTransport(BaseTransport):
     def writelines(self, list_of_data):
         """Write a list (or any iterable) of data bytes to the transport.
 
-        The default implementation just calls write() for each item in
-        the list/iterable.
+        Items can be bytes, bytearray or memoryview objects. The default
+        implementation concatenates the items and calls write() once.
         """
-        for data in list_of_data:
+        data = b''.join(list_of_data)
+        if data:
             self.write(data)
 
+    def get_write_buffer_size(self):
+        """Return the number of bytes buffered but not yet sent."""
+        raise NotImplementedError
+
+    def drain(self):
+        """Return a Future which is done when the write buffer is empty.
+
+        Producers writing large amounts of data can wait for it
+        to keep the memory used by the transport buffer bounded.
+        """
+        raise NotImplementedError
+
     def write_eof(self):
         """Closes the write end after flushing buffered data.
 
@@ -122,7 +135,7 @@ class Transport(ReadTransport, WriteTransport):
     connection_made() method, passing it the transport.
 
     The implementation here raises NotImplemented for every method
-    except writelines(), which calls write() in a loop.
+    except writelines(), which calls write() with the joined data.
     """
 
 
@@ -139,6 +152,18 @@ class DatagramTransport(BaseTransport):
         """
         raise NotImplementedError
 
+    def sendto_many(self, datagrams):
+        """Send an iterable of (data, addr) tuples.
+
+        The default implementation calls sendto() for each datagram.
+        """
+        for data, addr in datagrams:
+            self.sendto(data, addr)
+
+    def get_stats(self):
+        """Return a dict of transport statistics."""
+        raise NotImplementedError
+
     def abort(self):
         """Closes the transport immediately.
 
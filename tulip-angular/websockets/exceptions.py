@@ -21,3 +21,9 @@ class WebSocketProtocolError(Exception):
     # Internal exception raised when the other end breaks the protocol.
     # It's private because it shouldn't leak outside of WebSocketCommonProtocol.
     pass
+
+
+class PayloadTooBig(Exception):
+    # Internal exception raised when a message exceeds the size limit.
+    # It's private for the same reasons as WebSocketProtocolError.
+    pass
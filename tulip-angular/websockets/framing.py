@@ -15,7 +15,7 @@ import struct
 
 import tulip
 
-from .exceptions import WebSocketProtocolError
+from .exceptions import PayloadTooBig, WebSocketProtocolError
 
 
 __all__ = [
@@ -48,7 +48,7 @@ Frame = collections.namedtuple('Frame', ('fin', 'opcode', 'data'))
 
 
 @tulip.coroutine
-def read_frame(reader, mask):
+def read_frame(reader, mask, max_size=None):
     """
     Read a WebSocket frame and return a :class:`Frame` object.
 
@@ -58,6 +58,10 @@ def read_frame(reader, mask):
     `mask` is a :class:`bool` telling whether the frame should be masked, ie.
     whether the read happens on the server side.
 
+    If `max_size` is set, the payload of a data frame may not be longer than
+    `max_size` bytes. The limit is checked against the frame header, before
+    reading the payload, and :exc:`PayloadTooBig` is raised if it's exceeded.
+
     This function validates the frame before returning it and raises
     :exc:`WebSocketProtocolError` if it contains incorrect values.
     """
@@ -77,6 +81,11 @@ def read_frame(reader, mask):
     elif length == 127:
         data = yield from read_bytes(reader, 8)
         length, = struct.unpack('!Q', data)
+    if (max_size is not None and length > max_size
+            and opcode in (OP_CONT, OP_TEXT, OP_BINARY)):
+        raise PayloadTooBig(
+                "Payload exceeds limit ({} > {} bytes)".format(
+                    length, max_size))
     if mask:
         mask_bits = yield from read_bytes(reader, 4)
 
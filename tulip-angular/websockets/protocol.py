@@ -5,7 +5,7 @@ protocol as specified in `sections 4 to 8 of RFC 6455`_.
 .. _sections 4 to 8 of RFC 6455: http://tools.ietf.org/html/rfc6455#section-4
 """
 
-__all__ = ['WebSocketCommonProtocol']
+__all__ = ['WebSocketCommonProtocol', 'MessageStream']
 
 import codecs
 import collections
@@ -15,7 +15,8 @@ import struct
 
 import tulip
 
-from .exceptions import InvalidHandshake, InvalidState, WebSocketProtocolError
+from .exceptions import (
+        InvalidHandshake, InvalidState, PayloadTooBig, WebSocketProtocolError)
 from .framing import *
 from .handshake import *
 from .http import read_request, read_response, USER_AGENT
@@ -24,6 +25,58 @@ from .http import read_request, read_response, USER_AGENT
 logger = logging.getLogger(__name__)
 
 
+class MessageStream(tulip.DataBuffer):
+    """
+    Incoming message delivered fragment by fragment.
+
+    :attr:`text` is ``True`` for a text message and ``False`` for a binary
+    message. :meth:`read` returns the next fragment, as a :class:`str` or
+    :class:`bytes`, and ``None`` once the message is complete::
+
+        while True:
+            fragment = yield from stream.read()
+            if fragment is None:
+                break
+            # ...
+
+    If the connection fails before the end of the message, :meth:`read`
+    raises :exc:`InvalidState`.
+
+    The protocol stops reading from the network while `max_queue` fragments
+    are waiting to be read, so a slow reader slows down the other end.
+    """
+
+    def __init__(self, text, max_queue=None):
+        super().__init__()
+        self.text = text
+        self.max_queue = max_queue
+        self._drain_waiter = None
+
+    @tulip.coroutine
+    def read(self):
+        fragment = yield from super().read()
+        waiter = self._drain_waiter
+        if waiter is not None and not self.full():
+            self._drain_waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+        return fragment
+
+    def full(self):
+        """Return ``True`` if `max_queue` fragments are waiting."""
+        return (self.max_queue is not None and
+                len(self._buffer) >= self.max_queue)
+
+    def drain(self):
+        """Return a future that is done once the stream isn't full."""
+        waiter = tulip.Future()
+        if self.full():
+            self._drain_waiter = waiter
+        else:
+            waiter.set_result(None)
+        return waiter
+
+
 class WebSocketCommonProtocol(tulip.Protocol):
     """
     This class implements common parts of the WebSocket protocol.
@@ -42,6 +95,17 @@ class WebSocketCommonProtocol(tulip.Protocol):
     you need to wait until the connection is closed, you can yield from
     :attr:`close_waiter`.
 
+    The `max_size` parameter enforces the maximum size in bytes for incoming
+    messages. It's checked against frame headers before payloads are read.
+    Exceeding it fails the connection with status code 1009. ``None`` means
+    no limit.
+
+    When `streaming` is ``True``, :meth:`recv` returns a
+    :class:`MessageStream` as soon as the first fragment of a message is
+    received, instead of reassembling the message in memory. Reading from
+    the network is paused while `max_queue` fragments of the stream are
+    waiting to be read. ``None`` means no limit.
+
     There are only two differences between the client-side and the server-side
     behavior: masking the payload and closing the underlying TCP connection.
     This class implements the server-side behavior by default. To get the
@@ -51,8 +115,12 @@ class WebSocketCommonProtocol(tulip.Protocol):
     is_client = False
     state = 'OPEN'
 
-    def __init__(self, timeout=10):
+    def __init__(self, timeout=10, max_size=None, streaming=False,
+                 max_queue=32):
         self.timeout = timeout
+        self.max_size = max_size
+        self.streaming = streaming
+        self.max_queue = max_queue
 
         self.close_code = None
         self.close_reason = ''
@@ -97,7 +165,8 @@ class WebSocketCommonProtocol(tulip.Protocol):
         This coroutine receives the next message.
 
         It returns a :class:`str` for a text frame and :class:`bytes` for a
-        binary frame.
+        binary frame. In streaming mode, it returns a :class:`MessageStream`
+        instead.
 
         When the end of the message stream is reached, or when a protocol
         error occurs, :meth:`recv` returns ``None``, indicating that the
@@ -132,6 +201,56 @@ class WebSocketCommonProtocol(tulip.Protocol):
             raise TypeError("data must be bytes or str")
         self.write_frame(opcode, data)
 
+    def send_fragments(self, fragments, chunk_size=2**16):
+        """
+        This function sends a message in several frames.
+
+        `fragments` is an iterable of :class:`str`, sent as a text message, or
+        of :class:`bytes`, sent as a binary message. Each item becomes a frame.
+        Generators are consumed lazily, so the message is never assembled in
+        memory. A binary file object is also accepted; it's read in chunks of
+        `chunk_size` bytes.
+
+        It raises a :exc:`TypeError` for other inputs or when :class:`str` and
+        :class:`bytes` are mixed, and :exc:`InvalidState` once the connection
+        is closed. If this happens, or if `fragments` raises an exception,
+        after the first frames were sent, the message can't be completed and
+        the connection is failed with status code 1011.
+        """
+        if hasattr(fragments, 'read'):
+            fragments = read_chunks(fragments, chunk_size)
+        opcode, pending, started = None, None, False
+        try:
+            for data in fragments:
+                if isinstance(data, str):
+                    data_opcode = OP_TEXT
+                    data = data.encode('utf-8')
+                elif isinstance(data, bytes):
+                    data_opcode = OP_BINARY
+                else:
+                    raise TypeError("fragments must be bytes or str")
+                if opcode is None:
+                    opcode = data_opcode
+                elif data_opcode != opcode:
+                    raise TypeError("fragments must not mix bytes and str")
+                # Keep one fragment pending so that the last one carries FIN.
+                if pending is not None:
+                    self.write_frame(
+                            OP_CONT if started else opcode, pending, fin=False)
+                    started = True
+                pending = data
+        except Exception:
+            # The other end is waiting for the rest of the message. Send
+            # the close frame now, before anything else can be written.
+            if started and self.state == 'OPEN':
+                self.start_closing(1011)
+                self.close()
+            raise
+        # An empty iterable still sends an empty message.
+        if opcode is None:
+            opcode, pending = OP_BINARY, b''
+        self.write_frame(OP_CONT if started else opcode, pending)
+
     @tulip.task
     def close(self, code=1000, reason=''):
         """
@@ -145,11 +264,7 @@ class WebSocketCommonProtocol(tulip.Protocol):
         The `code` must be an :class:`int` and the `reason` a :class:`str`.
         """
         if self.state == 'OPEN':
-            # 7.1.2. Start the WebSocket Closing Handshake
-            self.close_code, self.close_reason = code, reason
-            self.write_frame(OP_CLOSE, serialize_close(code, reason))
-            # 7.1.3. The WebSocket Closing Handshake is Started
-            self.state = 'CLOSING'
+            self.start_closing(code, reason)
 
         yield from tulip.wait([self.closing_handshake], timeout=self.timeout)
         yield from tulip.wait([self.close_waiter], timeout=self.timeout)
@@ -204,10 +319,16 @@ class WebSocketCommonProtocol(tulip.Protocol):
         yield from self.opening_handshake
         while not self.closing_handshake.done():
             try:
-                msg = yield from self.read_message()
-                if msg is None:
-                    break
-                self.handle_message(msg)
+                if self.streaming:
+                    if not (yield from self.stream_message()):
+                        break
+                else:
+                    msg = yield from self.read_message()
+                    if msg is None:
+                        break
+                    self.handle_message(msg)
+            except PayloadTooBig:
+                yield from self.fail_connection(1009)
             except WebSocketProtocolError:
                 yield from self.fail_connection(1002)
             except UnicodeDecodeError:
@@ -220,7 +341,7 @@ class WebSocketCommonProtocol(tulip.Protocol):
     @tulip.coroutine
     def read_message(self):
         # Reassemble fragmented messages.
-        frame = yield from self.read_data_frame()
+        frame = yield from self.read_data_frame(self.max_size)
         if frame is None:
             return
         if frame.opcode == OP_TEXT:
@@ -242,23 +363,93 @@ class WebSocketCommonProtocol(tulip.Protocol):
         else:
             append = lambda f: chunks.append(f.data)
         append(frame)
+        size = len(frame.data)
 
         while not frame.fin:
-            frame = yield from self.read_data_frame()
-            if frame is None:
-                raise WebSocketProtocolError("Incomplete fragmented message")
-            if frame.opcode != OP_CONT:
-                raise WebSocketProtocolError("Unexpected opcode")
+            frame = yield from self.read_continuation_frame(size)
             append(frame)
+            size += len(frame.data)
 
         return ('' if text else b'').join(chunks)
 
     @tulip.coroutine
-    def read_data_frame(self):
+    def stream_message(self):
+        # Deliver fragments as they're received, without reassembling them.
+        frame = yield from self.read_data_frame(self.max_size)
+        if frame is None:
+            return False
+        if frame.opcode == OP_TEXT:
+            text = True
+        elif frame.opcode == OP_BINARY:
+            text = False
+        else:   # frame.opcode == OP_CONT
+            raise WebSocketProtocolError("Unexpected opcode")
+
+        stream = MessageStream(text, self.max_queue)
+        self.handle_message(stream)
+        if text:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='strict')
+            decode = lambda f: decoder.decode(f.data, f.fin)
+        else:
+            decode = lambda f: f.data
+
+        try:
+            size = 0
+            while True:
+                data = decode(frame)
+                if data:
+                    stream.feed_data(data)
+                if stream.full():
+                    yield from self.wait_for_reader(stream)
+                    if self.state == 'CLOSED':
+                        stream.set_exception(InvalidState(
+                                "WebSocket connection closed during a message"))
+                        return False
+                size += len(frame.data)
+                if frame.fin:
+                    break
+                frame = yield from self.read_continuation_frame(size)
+        except Exception:
+            stream.set_exception(InvalidState(
+                    "WebSocket connection failed during a message"))
+            raise
+        stream.feed_eof()
+        return True
+
+    @tulip.coroutine
+    def wait_for_reader(self, stream):
+        # Stop reading from the network until the stream isn't full anymore,
+        # or until the connection is closed.
+        try:
+            self.transport.pause()
+        except NotImplementedError:
+            paused = False
+        else:
+            paused = True
+        try:
+            yield from tulip.wait([stream.drain(), self.close_waiter],
+                                  return_when=tulip.FIRST_COMPLETED)
+        finally:
+            if paused and self.state != 'CLOSED':
+                self.transport.resume()
+
+    @tulip.coroutine
+    def read_continuation_frame(self, size):
+        # 5.4. Fragmentation - `size` is the length of the message so far.
+        max_size = None if self.max_size is None else self.max_size - size
+        frame = yield from self.read_data_frame(max_size)
+        if frame is None:
+            raise WebSocketProtocolError("Incomplete fragmented message")
+        if frame.opcode != OP_CONT:
+            raise WebSocketProtocolError("Unexpected opcode")
+        return frame
+
+    @tulip.coroutine
+    def read_data_frame(self, max_size=None):
         # Deal with control frames automatically and return next data frame.
         # 6.2. Receiving Data
         while True:
-            frame = yield from self.read_frame()
+            frame = yield from self.read_frame(max_size)
             # 5.5. Control Frames
             if frame.opcode == OP_CLOSE:
                 self.close_code, self.close_reason = parse_close(frame.data)
@@ -285,24 +476,32 @@ class WebSocketCommonProtocol(tulip.Protocol):
                 return frame
 
     @tulip.coroutine
-    def read_frame(self):
+    def read_frame(self, max_size=None):
         is_masked = not self.is_client
-        frame = yield from read_frame(self.stream.readexactly, is_masked)
+        frame = yield from read_frame(
+                self.stream.readexactly, is_masked, max_size)
         side = 'client' if self.is_client else 'server'
         logger.debug("%s << %s", side, frame)
         return frame
 
-    def write_frame(self, opcode, data=b'', expected_state='OPEN'):
+    def write_frame(self, opcode, data=b'', expected_state='OPEN', fin=True):
         # This may happen if a user attempts to write on a closed connection.
         if self.state != expected_state:
             raise InvalidState("Cannot write to a WebSocket "
                                "in the {} state".format(self.state))
-        frame = Frame(True, opcode, data)
+        frame = Frame(fin, opcode, data)
         side = 'client' if self.is_client else 'server'
         logger.debug("%s >> %s", side, frame)
         is_masked = self.is_client
         write_frame(frame, self.transport.write, is_masked)
 
+    def start_closing(self, code, reason=''):
+        # 7.1.2. Start the WebSocket Closing Handshake
+        self.close_code, self.close_reason = code, reason
+        self.write_frame(OP_CLOSE, serialize_close(code, reason))
+        # 7.1.3. The WebSocket Closing Handshake is Started
+        self.state = 'CLOSING'
+
     @tulip.coroutine
     def close_connection(self):
         # 7.1.1. Close the WebSocket Connection
@@ -365,3 +564,12 @@ class WebSocketCommonProtocol(tulip.Protocol):
             self.conn_lost_alarm.set_result(None)
         if self.close_code is None:
             self.close_code = 1006
+
+
+def read_chunks(fileobj, size):
+    # Undocumented utility function.
+    while True:
+        data = fileobj.read(size)
+        if not data:
+            return
+        yield data
@@ -3,7 +3,7 @@ import unittest
 
 import tulip
 
-from .exceptions import WebSocketProtocolError
+from .exceptions import PayloadTooBig, WebSocketProtocolError
 from .framing import *
 
 
@@ -17,11 +17,12 @@ class FramingTests(unittest.TestCase):
     def tearDown(self):
         self.loop.close()
 
-    def decode(self, message, mask=False):
+    def decode(self, message, mask=False, max_size=None):
         self.stream.feed_data(message)
         self.stream.feed_eof()
         reader = self.stream.readexactly
-        return self.loop.run_until_complete(read_frame(reader, mask))
+        return self.loop.run_until_complete(
+                read_frame(reader, mask, max_size))
 
     def encode(self, frame, mask=False):
         encoded = io.BytesIO()
@@ -124,6 +125,18 @@ class FramingTests(unittest.TestCase):
         with self.assertRaises(WebSocketProtocolError):
             self.decode(b'\x80\x01')
 
+    def test_payload_too_big(self):
+        self.assertEqual(
+                self.decode(b'\x82\x04Eggs', max_size=4),
+                Frame(True, OP_BINARY, b'Eggs'))
+        with self.assertRaises(PayloadTooBig):
+            self.decode(b'\x82\x7e\x00\x7e', max_size=125)
+
+    def test_payload_too_big_ignores_control_frames(self):
+        self.assertEqual(
+                self.decode(b'\x89\x04ping', max_size=0),
+                Frame(True, OP_PING, b'ping'))
+
     def test_parse_close(self):
         self.round_trip_close(b'\x03\xe8', 1000, '')
         self.round_trip_close(b'\x03\xe8OK', 1000, 'OK')
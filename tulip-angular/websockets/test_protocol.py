@@ -6,7 +6,7 @@ import tulip
 
 from .exceptions import InvalidState
 from .framing import *
-from .protocol import WebSocketCommonProtocol
+from .protocol import MessageStream, WebSocketCommonProtocol
 
 
 MS = 0.001          # Unit for timeouts. May be increased on slow machines.
@@ -52,6 +52,20 @@ class CommonTests:
         if stream.byte_count:
             return read_frame(stream.readexactly, self.protocol.is_client)
 
+    @tulip.coroutine
+    def sent_frames(self):
+        """Read all the frames sent to the transport."""
+        stream = tulip.StreamReader()
+        for (data,), kw in self.transport.write.call_args_list:
+            stream.feed_data(data)
+        self.transport.write.call_args_list = []
+        stream.feed_eof()
+        frames = []
+        while stream.byte_count:
+            frames.append((yield from read_frame(
+                    stream.readexactly, self.protocol.is_client)))
+        return frames
+
     @tulip.task
     def echo(self):
         """Echo to the protocol the next frame sent to the transport."""
@@ -245,6 +259,188 @@ class CommonTests:
         self.assertIsNone(self.loop.run_until_complete(self.protocol.recv()))
         self.assertConnectionClosed(1006, '')
 
+    def test_fragmented_unicode_error_fails_fast(self):
+        # Invalid UTF-8 is detected before the end of the message.
+        self.feed(Frame(False, OP_TEXT, b'caf\xff'))
+        self.loop.call_later(MS, self.fast_connection_failure)
+        self.assertIsNone(self.loop.run_until_complete(self.protocol.recv()))
+        self.assertConnectionClosed(1007, '')
+
+    def test_fragmented_split_utf8(self):
+        data = 'café'.encode('utf-8')
+        self.feed(Frame(False, OP_TEXT, data[:4]))
+        self.feed(Frame(True, OP_CONT, data[4:]))
+        data = self.loop.run_until_complete(self.protocol.recv())
+        self.assertEqual(data, 'café')
+
+    def test_fragmented_truncated_utf8(self):
+        data = 'café'.encode('utf-8')
+        self.feed(Frame(False, OP_TEXT, data[:4]))
+        self.feed(Frame(True, OP_CONT, b''))
+        self.loop.call_later(MS, self.fast_connection_failure)
+        self.assertIsNone(self.loop.run_until_complete(self.protocol.recv()))
+        self.assertConnectionClosed(1007, '')
+
+    def test_recv_max_size(self):
+        self.protocol.max_size = 3
+        self.feed(Frame(True, OP_BINARY, b'tea'))
+        data = self.loop.run_until_complete(self.protocol.recv())
+        self.assertEqual(data, b'tea')
+
+    def test_recv_too_big(self):
+        self.protocol.max_size = 3
+        self.feed(Frame(True, OP_BINARY, b'toast'))
+        self.loop.call_later(MS, self.fast_connection_failure)
+        self.assertIsNone(self.loop.run_until_complete(self.protocol.recv()))
+        self.assertConnectionClosed(1009, '')
+
+    def test_fragmented_too_big(self):
+        self.protocol.max_size = 3
+        self.feed(Frame(False, OP_BINARY, b'to'))
+        self.feed(Frame(True, OP_CONT, b'ast'))
+        self.loop.call_later(MS, self.fast_connection_failure)
+        self.assertIsNone(self.loop.run_until_complete(self.protocol.recv()))
+        self.assertConnectionClosed(1009, '')
+
+    def read_stream(self, stream):
+        """Read all fragments from a message stream."""
+        @tulip.coroutine
+        def read_all():
+            fragments = []
+            while True:
+                fragment = yield from stream.read()
+                if fragment is None:
+                    return fragments
+                fragments.append(fragment)
+        return self.loop.run_until_complete(read_all())
+
+    def test_stream_text(self):
+        self.protocol.streaming = True
+        self.feed(Frame(False, OP_TEXT, 'ca'.encode('utf-8')))
+        self.feed(Frame(False, OP_CONT, 'f'.encode('utf-8')))
+        self.feed(Frame(True, OP_CONT, 'é'.encode('utf-8')))
+        stream = self.loop.run_until_complete(self.protocol.recv())
+        self.assertIsInstance(stream, MessageStream)
+        self.assertTrue(stream.text)
+        self.assertEqual(self.read_stream(stream), ['ca', 'f', 'é'])
+
+    def test_stream_binary(self):
+        self.protocol.streaming = True
+        self.feed(Frame(True, OP_BINARY, b'tea'))
+        stream = self.loop.run_until_complete(self.protocol.recv())
+        self.assertFalse(stream.text)
+        self.assertEqual(self.read_stream(stream), [b'tea'])
+
+    def test_stream_before_end_of_message(self):
+        self.protocol.streaming = True
+        self.feed(Frame(False, OP_BINARY, b't'))
+        stream = self.loop.run_until_complete(self.protocol.recv())
+        self.assertEqual(self.loop.run_until_complete(stream.read()), b't')
+        self.feed(Frame(True, OP_CONT, b'ea'))
+        self.assertEqual(self.read_stream(stream), [b'ea'])
+
+    def test_stream_split_utf8(self):
+        self.protocol.streaming = True
+        data = 'café'.encode('utf-8')
+        self.feed(Frame(False, OP_TEXT, data[:4]))
+        self.feed(Frame(True, OP_CONT, data[4:]))
+        stream = self.loop.run_until_complete(self.protocol.recv())
+        self.assertEqual(self.read_stream(stream), ['caf', 'é'])
+
+    def test_stream_unterminated(self):
+        self.protocol.streaming = True
+        self.feed(Frame(False, OP_TEXT, 'ca'.encode('utf-8')))
+        self.feed(Frame(True, OP_BINARY, b'tea'))
+        self.loop.call_later(MS, self.fast_connection_failure)
+        stream = self.loop.run_until_complete(self.protocol.recv())
+        with self.assertRaises(InvalidState):
+            self.read_stream(stream)
+        self.assertIsNone(self.loop.run_until_complete(self.protocol.recv()))
+        self.assertConnectionClosed(1002, '')
+
+    def test_stream_unicode_error(self):
+        self.protocol.streaming = True
+        self.feed(Frame(False, OP_TEXT, 'ca'.encode('utf-8')))
+        self.feed(Frame(False, OP_CONT, b'f\xff'))
+        self.loop.call_later(MS, self.fast_connection_failure)
+        stream = self.loop.run_until_complete(self.protocol.recv())
+        with self.assertRaises(InvalidState):
+            self.read_stream(stream)
+        self.assertIsNone(self.loop.run_until_complete(self.protocol.recv()))
+        self.assertConnectionClosed(1007, '')
+
+    def test_stream_backpressure(self):
+        self.protocol.streaming = True
+        self.protocol.max_queue = 1
+        self.feed(Frame(False, OP_BINARY, b't'))
+        self.feed(Frame(False, OP_CONT, b'e'))
+        self.feed(Frame(True, OP_CONT, b'a'))
+        stream = self.loop.run_until_complete(self.protocol.recv())
+        self.assertTrue(self.transport.pause.called)
+        self.assertEqual(self.read_stream(stream), [b't', b'e', b'a'])
+        self.assertTrue(self.transport.resume.called)
+
+    def test_stream_closed_while_paused(self):
+        self.protocol.streaming = True
+        self.protocol.max_queue = 1
+        self.feed(Frame(False, OP_BINARY, b't'))
+        self.feed(Frame(False, OP_CONT, b'e'))
+        stream = self.loop.run_until_complete(self.protocol.recv())
+        self.feed_eof()
+        self.assertIsNone(self.loop.run_until_complete(self.protocol.recv()))
+        with self.assertRaises(InvalidState):
+            self.read_stream(stream)
+        self.assertConnectionClosed(1006, '')
+
+    def test_send_fragments_text(self):
+        self.protocol.send_fragments(['ca', 'fé'])
+        self.assertEqual(self.loop.run_until_complete(self.sent_frames()), [
+            Frame(False, OP_TEXT, 'ca'.encode('utf-8')),
+            Frame(True, OP_CONT, 'fé'.encode('utf-8')),
+        ])
+
+    def test_send_fragments_generator(self):
+        self.protocol.send_fragments(bytes([c]) for c in b'tea')
+        self.assertEqual(self.loop.run_until_complete(self.sent_frames()), [
+            Frame(False, OP_BINARY, b't'),
+            Frame(False, OP_CONT, b'e'),
+            Frame(True, OP_CONT, b'a'),
+        ])
+
+    def test_send_fragments_file(self):
+        self.protocol.send_fragments(io.BytesIO(b'tea'), chunk_size=2)
+        self.assertEqual(self.loop.run_until_complete(self.sent_frames()), [
+            Frame(False, OP_BINARY, b'te'),
+            Frame(True, OP_CONT, b'a'),
+        ])
+
+    def test_send_fragments_single(self):
+        self.protocol.send_fragments([b'tea'])
+        self.assertFrameSent(True, OP_BINARY, b'tea')
+
+    def test_send_fragments_empty(self):
+        self.protocol.send_fragments([])
+        self.assertFrameSent(True, OP_BINARY, b'')
+
+    def test_send_fragments_type_error(self):
+        with self.assertRaises(TypeError):
+            self.protocol.send_fragments([42])
+        self.assertNoFrameSent()
+
+    def test_send_fragments_type_error_after_frames(self):
+        with self.assertRaises(TypeError):
+            self.protocol.send_fragments([b't', b'e', 42])
+        close = Frame(True, OP_CLOSE, serialize_close(1011, ''))
+        self.assertEqual(self.loop.run_until_complete(self.sent_frames()), [
+            Frame(False, OP_BINARY, b't'),
+            close,
+        ])
+        self.feed(close)
+        if self.protocol.is_client:
+            self.loop.call_later(MS, self.feed_eof)
+        self.assertIsNone(self.loop.run_until_complete(self.protocol.recv()))
+        self.assertConnectionClosed(1011, '')
+
 
 class ServerTests(CommonTests, unittest.TestCase):
 
@@ -62,12 +62,15 @@ all_by_module = {
                              'bind_arguments', 'secure_filename'],
     'werkzeug.wsgi':        ['get_current_url', 'get_host', 'pop_path_info',
                              'peek_path_info', 'SharedDataMiddleware',
+                             'StaticFileIndex', 'StaticFile',
                              'DispatcherMiddleware', 'ClosingIterator',
                              'FileWrapper', 'make_line_iter', 'LimitedStream',
-                             'responder', 'wrap_file', 'extract_path_info'],
+                             'responder', 'wrap_file', 'extract_path_info',
+                             'wrap_file_ranges', 'FileRangeWrapper'],
     'werkzeug.datastructures': ['MultiDict', 'CombinedMultiDict', 'Headers',
                              'EnvironHeaders', 'ImmutableList',
                              'ImmutableDict', 'ImmutableMultiDict',
+                             'LazyMultiDict', 'ImmutableLazyMultiDict',
                              'TypeConversionDict', 'ImmutableTypeConversionDict',
                              'Accept', 'MIMEAccept', 'CharsetAccept',
                              'LanguageAccept', 'RequestCacheControl',
@@ -78,7 +81,8 @@ all_by_module = {
     'werkzeug.useragents':  ['UserAgent'],
     'werkzeug.http':        ['parse_etags', 'parse_date', 'http_date',
                              'cookie_date', 'parse_cache_control_header',
-                             'is_resource_modified', 'parse_accept_header',
+                             'is_resource_modified', 'get_byte_ranges',
+                             'parse_accept_header',
                              'parse_set_header', 'quote_etag', 'unquote_etag',
                              'generate_etag', 'dump_header',
                              'parse_list_header', 'parse_dict_header',
@@ -215,6 +215,9 @@ class _DictAccessorProperty(object):
 
 
 def _cookie_quote(b):
+    # most values only consist of legal characters
+    if not b.translate(None, _legal_cookie_chars):
+        return bytes(b)
     buf = bytearray()
     all_legal = True
     _lookup = _cookie_quoting_map.get
@@ -269,17 +272,39 @@ def _cookie_unquote(b):
 
 def _cookie_parse_impl(b):
     """Lowlevel cookie parsing facility that operates on bytes."""
+    if b'"' not in b and b'\n' not in b:
+        return _simple_cookie_parse_impl(b)
+    return _quoted_cookie_parse_impl(b)
+
+
+def _simple_cookie_parse_impl(b):
+    """Splits cookies without quoted values the same way `_cookie_re`
+    does, without a regular expression.
+    """
     i = 0
     n = len(b)
-
     while i < n:
-        match = _cookie_re.search(b + b';', i)
-        if not match:
+        if b[i:i + 1] == b'=':
+            i += 1
+            continue
+        eq = b.find(b'=', i)
+        if eq < 0:
             break
+        end = b.find(b';', eq)
+        if end < 0:
+            end = n
+        key = b[i:eq].strip()
+        i = end + 1
+
+        # Ignore parameters.  We have no interest in them.
+        if key.lower() not in _cookie_params:
+            yield key, b[eq + 1:end].strip()
+
 
-        key = match.group('key').strip()
-        value = match.group('val')
-        i = match.end(0)
+def _quoted_cookie_parse_impl(b):
+    for match in _cookie_re.finditer(b + b';'):
+        key, value = match.group('key', 'val')
+        key = key.strip()
 
         # Ignore parameters.  We have no interest in them.
         if key.lower() not in _cookie_params:
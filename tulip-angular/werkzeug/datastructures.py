@@ -12,7 +12,7 @@ import re
 import sys
 import codecs
 import mimetypes
-from itertools import repeat
+from itertools import repeat, islice
 
 from werkzeug._internal import _missing, _empty_stream
 from werkzeug._compat import iterkeys, itervalues, iteritems, iterlists, \
@@ -609,6 +609,148 @@ class MultiDict(TypeConversionDict):
         return '%s(%r)' % (self.__class__.__name__, list(iteritems(self, multi=True)))
 
 
+@native_itermethods(['values', 'items', 'lists', 'listvalues'])
+class LazyMultiDictMixin(object):
+    """Makes a :class:`MultiDict` decode its values only when they are
+    accessed.  The values passed to the constructor are kept as they are
+    and `decode` is called on the values of a key the first time that key
+    is looked up.  Keys, length and membership tests never decode values,
+    methods returning all values decode everything.
+
+    .. versionadded:: 0.10
+
+    :private:
+    """
+
+    _decode = None
+    _pending = ()
+
+    def __init__(self, mapping=None, decode=None):
+        super(LazyMultiDictMixin, self).__init__(mapping)
+        if decode is not None:
+            self._decode = decode
+            self._pending = set(dict.keys(self))
+
+    def _decode_key(self, key):
+        if key in self._pending:
+            values = dict.__getitem__(self, key)
+            values[:] = [self._decode(value) for value in values]
+            self._pending.discard(key)
+
+    def _decode_all(self):
+        for key in list(self._pending):
+            self._decode_key(key)
+
+    def __getitem__(self, key):
+        self._decode_key(key)
+        return super(LazyMultiDictMixin, self).__getitem__(key)
+
+    def __setitem__(self, key, value):
+        super(LazyMultiDictMixin, self).__setitem__(key, value)
+        if key in self._pending:
+            self._pending.discard(key)
+
+    def __delitem__(self, key):
+        super(LazyMultiDictMixin, self).__delitem__(key)
+        if key in self._pending:
+            self._pending.discard(key)
+
+    def __eq__(self, other):
+        self._decode_all()
+        if isinstance(other, LazyMultiDictMixin):
+            other._decode_all()
+        return super(LazyMultiDictMixin, self).__eq__(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def add(self, key, value):
+        self._decode_key(key)
+        super(LazyMultiDictMixin, self).add(key, value)
+
+    def getlist(self, key, type=None):
+        self._decode_key(key)
+        return super(LazyMultiDictMixin, self).getlist(key, type)
+
+    def setlist(self, key, new_list):
+        super(LazyMultiDictMixin, self).setlist(key, new_list)
+        if key in self._pending:
+            self._pending.discard(key)
+
+    def setdefault(self, key, default=None):
+        self._decode_key(key)
+        return super(LazyMultiDictMixin, self).setdefault(key, default)
+
+    def setlistdefault(self, key, default_list=None):
+        self._decode_key(key)
+        return super(LazyMultiDictMixin, self).setlistdefault(key,
+                                                              default_list)
+
+    # on Python 2 the methods of the dict are lists, the iter* methods
+    # returned here have to be iterators
+    def items(self, multi=False):
+        self._decode_all()
+        return iter(super(LazyMultiDictMixin, self).items(multi))
+
+    def lists(self):
+        self._decode_all()
+        return iter(super(LazyMultiDictMixin, self).lists())
+
+    def values(self):
+        self._decode_all()
+        return iter(super(LazyMultiDictMixin, self).values())
+
+    def listvalues(self):
+        self._decode_all()
+        return iter(super(LazyMultiDictMixin, self).listvalues())
+
+    def to_dict(self, flat=True):
+        self._decode_all()
+        return super(LazyMultiDictMixin, self).to_dict(flat)
+
+    def update(self, other_dict):
+        self._decode_all()
+        super(LazyMultiDictMixin, self).update(other_dict)
+
+    def pop(self, key, default=_missing):
+        self._decode_key(key)
+        return super(LazyMultiDictMixin, self).pop(key, default)
+
+    def popitem(self):
+        self._decode_all()
+        return super(LazyMultiDictMixin, self).popitem()
+
+    def poplist(self, key):
+        self._decode_key(key)
+        return super(LazyMultiDictMixin, self).poplist(key)
+
+    def popitemlist(self):
+        self._decode_all()
+        return super(LazyMultiDictMixin, self).popitemlist()
+
+    def clear(self):
+        super(LazyMultiDictMixin, self).clear()
+        self._pending = ()
+
+    def __getstate__(self):
+        self._decode_all()
+        return super(LazyMultiDictMixin, self).__getstate__()
+
+
+class LazyMultiDict(LazyMultiDictMixin, MultiDict):
+    """A :class:`MultiDict` that decodes its values on first access, for
+    example the values of a query string that are never looked at are
+    never unquoted.  This is what :func:`~werkzeug.urls.url_decode`
+    returns if `lazy` is enabled.
+
+    Code that reads the dict with the C level dict API instead of the
+    :class:`MultiDict` methods (``dict(d)``, ``json.dumps(d)``) sees the
+    undecoded values, use :meth:`to_dict` in that case.
+
+    .. versionadded:: 0.10
+    """
+
+
 class _omd_bucket(object):
     """Wraps values in the :class:`OrderedMultiDict`.  This makes it
     possible to keep an order over multiple different keys.  It requires
@@ -829,6 +971,20 @@ def _unicodify_header_value(value):
     return value
 
 
+# lowercased header names shared by all header indexes
+_lowered_keys = {}
+
+
+def _lower_key(key):
+    try:
+        return _lowered_keys[key]
+    except KeyError:
+        if len(_lowered_keys) >= 1024:
+            _lowered_keys.clear()
+        rv = _lowered_keys[key] = key.lower()
+        return rv
+
+
 @native_itermethods(['keys', 'values', 'items'])
 class Headers(object):
     """An object that stores some headers.  It has a dict-like interface
@@ -851,17 +1007,39 @@ class Headers(object):
     which are used as default values.  This does not reuse the list passed
     to the constructor for internal usage.
 
+    Lookups by key go through an index of the lowercased keys that is
+    built on first use and kept up to date by :meth:`add`.
+
     :param defaults: The list of default values for the :class:`Headers`.
     """
 
+    __slots__ = ('_list', '_index')
+
     def __init__(self, defaults=None):
         self._list = []
+        self._index = None
         if defaults is not None:
             if isinstance(defaults, (list, Headers)):
                 self._list.extend(defaults)
             else:
                 self.extend(defaults)
 
+    def __reduce_ex__(self, protocol):
+        return type(self), (self._list,)
+
+    def _get_index(self):
+        """Return a dict mapping the lowercased keys to the position of
+        their first value.  Operations that remove or replace headers
+        drop the index, it is rebuilt on the next lookup.
+        """
+        index = self._index
+        if index is None:
+            index = {}
+            for idx, (key, _) in enumerate(self._list):
+                index.setdefault(_lower_key(key), idx)
+            self._index = index
+        return index
+
     def __getitem__(self, key, _get_mode=False):
         if not _get_mode:
             if isinstance(key, integer_types):
@@ -870,10 +1048,9 @@ class Headers(object):
                 return self.__class__(self._list[key])
         if not isinstance(key, string_types):
             raise exceptions.BadRequestKeyError(key)
-        ikey = key.lower()
-        for k, v in self._list:
-            if k.lower() == ikey:
-                return v
+        idx = self._get_index().get(key.lower())
+        if idx is not None:
+            return self._list[idx][1]
         # micro optimization: if we are in get mode we will catch that
         # exception one stack level down so we can raise a standard
         # key error instead of our special one.
@@ -934,8 +1111,11 @@ class Headers(object):
         :return: a :class:`list` of all the values for the key.
         """
         ikey = key.lower()
+        idx = self._get_index().get(ikey)
+        if idx is None:
+            return []
         result = []
-        for k, v in self:
+        for k, v in islice(self._list, idx, None):
             if k.lower() == ikey:
                 if type is not None:
                     try:
@@ -983,6 +1163,7 @@ class Headers(object):
                 self.add(key, value)
 
     def __delitem__(self, key, _index_operation=True):
+        self._index = None
         if _index_operation and isinstance(key, (integer_types, slice)):
             del self._list[key]
             return
@@ -1010,8 +1191,10 @@ class Headers(object):
         :return: an item.
         """
         if key is None:
+            self._index = None
             return self._list.pop()
         if isinstance(key, integer_types):
+            self._index = None
             return self._list.pop(key)
         try:
             rv = self[key]
@@ -1063,6 +1246,8 @@ class Headers(object):
             _value = _options_header_vkw(_value, kw)
         _value = _unicodify_header_value(_value)
         self._validate_value(_value)
+        if self._index is not None:
+            self._index.setdefault(_lower_key(_key), len(self._list))
         self._list.append((_key, _value))
 
     def _validate_value(self, value):
@@ -1083,6 +1268,7 @@ class Headers(object):
     def clear(self):
         """Clears all headers."""
         del self._list[:]
+        self._index = None
 
     def set(self, _key, _value, **kw):
         """Remove all header tuples for `key` and add a new one.  The newly
@@ -1103,6 +1289,7 @@ class Headers(object):
             _value = _options_header_vkw(_value, kw)
         _value = _unicodify_header_value(_value)
         self._validate_value(_value)
+        self._index = None
         if not self._list:
             self._list.append((_key, _value))
             return
@@ -1138,6 +1325,7 @@ class Headers(object):
                 value = [value]
             value = [(k, _unicodify_header_value(v)) for (k, v) in value]
             [self._validate_value(v) for (k, v) in value]
+            self._index = None
             if isinstance(key, integer_types):
                 self._list[key] = value[0]
             else:
@@ -1236,6 +1424,9 @@ class EnvironHeaders(ImmutableHeadersMixin, Headers):
     def __init__(self, environ):
         self.environ = environ
 
+    def __reduce_ex__(self, protocol):
+        return type(self), (self.environ,)
+
     def __eq__(self, other):
         return self.environ is other.environ
 
@@ -1247,6 +1438,19 @@ class EnvironHeaders(ImmutableHeadersMixin, Headers):
             return _unicodify_header_value(self.environ[key])
         return _unicodify_header_value(self.environ['HTTP_' + key])
 
+    def getlist(self, key, type=None):
+        # the environ holds at most one value per header
+        try:
+            value = self.__getitem__(key)
+        except KeyError:
+            return []
+        if type is not None:
+            try:
+                value = type(value)
+            except ValueError:
+                return []
+        return [value]
+
     def __len__(self):
         # the iter is necessary because otherwise list calls our
         # len which would call list again and so forth.
@@ -1462,6 +1666,15 @@ class ImmutableMultiDict(ImmutableMultiDictMixin, MultiDict):
         return self
 
 
+class ImmutableLazyMultiDict(LazyMultiDictMixin, ImmutableMultiDict):
+    """An immutable :class:`LazyMultiDict`.
+
+    .. versionadded:: 0.10
+    """
+
+    __hash__ = ImmutableMultiDict.__hash__
+
+
 class ImmutableOrderedMultiDict(ImmutableMultiDictMixin, OrderedMultiDict):
     """An immutable :class:`OrderedMultiDict`.
 
@@ -2162,6 +2375,34 @@ class Range(object):
         if is_byte_range_valid(start, end, length):
             return start, min(end, length)
 
+    def ranges_for_length(self, length):
+        """Returns a sorted list of the satisfiable ranges as ``(start, stop)``
+        tuples for the given length, overlapping and adjacent ranges are
+        merged.  If the range is not for bytes or the length is `None`,
+        `None` is returned.  An empty list means that none of the ranges
+        can be satisfied.
+
+        .. versionadded:: 0.10
+        """
+        if self.units != 'bytes' or length is None:
+            return None
+        ranges = []
+        for start, end in self.ranges:
+            if end is None:
+                end = length
+                if start < 0:
+                    start = max(start + length, 0)
+            if is_byte_range_valid(start, end, length):
+                ranges.append((start, min(end, length)))
+        ranges.sort()
+        rv = ranges[:1]
+        for start, end in ranges[1:]:
+            if start <= rv[-1][1]:
+                rv[-1] = (rv[-1][0], max(end, rv[-1][1]))
+            else:
+                rv.append((start, end))
+        return rv
+
     def make_content_range(self, length):
         """Creates a :class:`~werkzeug.datastructures.ContentRange` object
         from the current range and given content length.
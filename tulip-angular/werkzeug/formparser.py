@@ -10,16 +10,15 @@
     :license: BSD, see LICENSE for more details.
 """
 import re
-import codecs
+import binascii
 from io import BytesIO
 from tempfile import TemporaryFile
-from itertools import chain, repeat, tee
+from itertools import repeat, tee
 from functools import update_wrapper
 
 from werkzeug._compat import to_native, text_type
 from werkzeug.urls import url_decode_stream
-from werkzeug.wsgi import make_line_iter, \
-     get_input_stream, get_content_length
+from werkzeug.wsgi import get_input_stream, get_content_length
 from werkzeug.datastructures import Headers, FileStorage, MultiDict
 from werkzeug.http import parse_options_header
 
@@ -38,7 +37,8 @@ _supported_multipart_encodings = frozenset(['base64', 'quoted-printable'])
 def default_stream_factory(total_content_length, filename, content_type,
                            content_length=None):
     """The stream factory that is used per default."""
-    if total_content_length > 1024 * 500:
+    # length is unknown for terminated input streams
+    if total_content_length is None or total_content_length > 1024 * 500:
         return TemporaryFile('wb+')
     return BytesIO()
 
@@ -130,12 +130,15 @@ class FormDataParser(object):
     :param cls: an optional dict class to use.  If this is not specified
                        or `None` the default :class:`MultiDict` is used.
     :param silent: If set to False parsing errors will not be caught.
+    :param lazy: If set to `True` url encoded form values are unquoted
+                 when they are first accessed, see
+                 :class:`~werkzeug.datastructures.LazyMultiDict`.
     """
 
     def __init__(self, stream_factory=None, charset='utf-8',
                  errors='replace', max_form_memory_size=None,
                  max_content_length=None, cls=None,
-                 silent=True):
+                 silent=True, lazy=False):
         if stream_factory is None:
             stream_factory = default_stream_factory
         self.stream_factory = stream_factory
@@ -147,6 +150,7 @@ class FormDataParser(object):
             cls = MultiDict
         self.cls = cls
         self.silent = silent
+        self.lazy = lazy
 
     def get_parse_func(self, mimetype, options):
         return self.parse_functions.get(mimetype)
@@ -210,7 +214,8 @@ class FormDataParser(object):
            content_length > self.max_form_memory_size:
             raise exceptions.RequestEntityTooLarge()
         form = url_decode_stream(stream, self.charset,
-                                 errors=self.errors, cls=self.cls)
+                                 errors=self.errors, cls=self.cls,
+                                 lazy=self.lazy)
         return stream, form, self.cls()
 
     #: mapping of mimetypes to parsing functions
@@ -272,17 +277,312 @@ _begin_file = 'begin_file'
 _cont = 'cont'
 _end = 'end'
 
+# states of the MultiPartFeedParser
+_preamble = 'preamble'
+_headers = 'headers'
+_data = 'data'
+_epilogue = 'epilogue'
+
+_line_end_re = re.compile(br'\r\n|\r|\n')
+_base64_ignored_re = re.compile(br'[^A-Za-z0-9+/=]+')
+_base64_alphabet = (b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+                    b'0123456789+/=')
+
+
+def _decode_base64(data, final):
+    """Decodes the complete groups of four characters in `data` and
+    returns the decoded bytes and the rest of `data`.
+    """
+    # a2b_base64 skips other characters too, but they have to be removed
+    # to know where the groups of four characters end
+    data = data.translate(None, b' \t\r\n')
+    if data.translate(None, _base64_alphabet):
+        data = _base64_ignored_re.sub(b'', data)
+    end = len(data) if final else len(data) - len(data) % 4
+    return binascii.a2b_base64(data[:end]), data[end:]
+
+
+def _decode_quoted_printable(data, final):
+    """Decodes `data` up to where an escape sequence or the whitespace
+    before a line break could continue in the next chunk and returns the
+    decoded bytes and the rest of `data`.
+    """
+    end = len(data)
+    if not final:
+        pos = data.rfind(b'=', max(end - 2, 0))
+        if pos >= 0:
+            end = pos
+        while end and data[end - 1:end] in b' \t\r':
+            end -= 1
+    return binascii.a2b_qp(data[:end]), data[end:]
+
+
+_transfer_decoders = {
+    'base64': _decode_base64,
+    'quoted-printable': _decode_quoted_printable,
+}
+
+
+class MultiPartFeedParser(object):
+    """Incremental multipart parser.  Data is pushed into the parser with
+    :meth:`feed` as it arrives, which returns the events that became
+    available, in the same grammar as :meth:`MultiPartParser.parse_lines`.
+    Part data is found by searching the buffer for the boundary instead of
+    splitting it into lines, and only a few bytes of it are kept between
+    two calls, so this works with any chunk size and does not depend on
+    the data having newlines.
+
+    This is also usable from an event loop, for example in a tulip
+    handler::
+
+        parser = MultiPartFeedParser(boundary)
+        while not parser.finished:
+            chunk = yield from payload.read()
+            if not chunk:
+                events = parser.feed_eof()
+            else:
+                events = parser.feed(chunk)
+            for event, value in events:
+                ...
+
+    :param boundary: the multipart boundary as bytes.
+    :param max_header_size: the maximum size of the headers of a part.
+
+    .. versionadded:: 0.10
+    """
+
+    def __init__(self, boundary, max_header_size=64 * 1024):
+        self.boundary = boundary
+        self.max_header_size = max_header_size
+        self._next_part = b'--' + boundary
+        self._last_part = self._next_part + b'--'
+        self._buffer = b''
+        self._pos = 0
+        self._state = _preamble
+        self._decode = None
+        self._encoded = b''
+        self._part_start = False
+
+    @property
+    def finished(self):
+        """`True` after the closing boundary was found.  Data after it
+        is ignored."""
+        return self._state is _epilogue
+
+    def fail(self, message):
+        raise ValueError(message)
+
+    def feed(self, data):
+        """Feeds a chunk of the body into the parser and returns a list
+        of ``(event, value)`` tuples.
+        """
+        if self._state is _epilogue or not data:
+            return []
+        # the parsed part of the buffer is dropped once per chunk
+        if self._pos < len(self._buffer):
+            self._buffer = self._buffer[self._pos:] + data
+        else:
+            self._buffer = bytes(data)
+        self._pos = 0
+        events = []
+        self._parse(events, False)
+        return events
+
+    def feed_eof(self):
+        """Signals the end of the body.  Returns the remaining events or
+        raises a `ValueError` if the body is incomplete.
+        """
+        events = []
+        self._parse(events, True)
+        if self._state is _preamble:
+            self.fail('Expected boundary at start of multipart data')
+        elif self._state is _headers:
+            self.fail('unexpected end of line in multipart header')
+        elif self._state is _data:
+            self.fail('unexpected end of stream')
+        return events
+
+    def _parse(self, events, eof):
+        while True:
+            if self._state is _preamble:
+                progress = self._parse_preamble(eof)
+            elif self._state is _headers:
+                progress = self._parse_headers(events, eof)
+            elif self._state is _data:
+                progress = self._parse_data(events, eof)
+            else:
+                self._buffer = b''
+                self._pos = 0
+                return
+            if not progress:
+                return
+
+    def _find_line_end(self, buf, pos, eof):
+        """Returns the match of the next line ending or `None` if more
+        data is required to know where the line ends.
+        """
+        m = _line_end_re.search(buf, pos)
+        # a carriage return at the end could be followed by a newline
+        if m is not None and m.group() == b'\r' and \
+           m.end() == len(buf) and not eof:
+            return None
+        return m
+
+    def _parse_preamble(self, eof):
+        # there may be some additional newlines before the first boundary
+        buf = self._buffer = self._buffer[self._pos:].lstrip()
+        self._pos = 0
+        m = self._find_line_end(buf, 0, eof)
+        if m is None:
+            if not eof:
+                if len(buf) > self.max_header_size:
+                    self.fail('Expected boundary at start of multipart data')
+                return False
+            line, rest = buf, b''
+        else:
+            line, rest = buf[:m.start()], buf[m.end():]
+
+        line = line.rstrip()
+        if line == self._last_part:
+            self._state = _epilogue
+        elif line == self._next_part:
+            self._state = _headers
+            self._buffer = rest
+            self._pos = 0
+        elif line or eof:
+            self.fail('Expected boundary at start of multipart data')
+        else:
+            return False
+        return True
+
+    def _parse_headers(self, events, eof):
+        buf = self._buffer
+        lines = []
+        pos = self._pos
+        while True:
+            m = self._find_line_end(buf, pos, eof)
+            if m is None:
+                if len(buf) - self._pos > self.max_header_size:
+                    self.fail('multipart headers are too long')
+                return False
+            if m.start() == pos:
+                break
+            lines.append(buf[pos:m.end()])
+            pos = m.end()
+        self._pos = m.end()
+        headers = parse_multipart_headers(lines)
+
+        disposition = headers.get('content-disposition')
+        if disposition is None:
+            self.fail('Missing Content-Disposition header')
+        disposition, extra = parse_options_header(disposition)
+        name = extra.get('name')
+        filename = extra.get('filename')
+
+        # transfer encoded parts are decoded as they arrive, only the
+        # characters that can't be decoded yet are kept
+        self._decode = _transfer_decoders.get(
+            headers.get('content-transfer-encoding'))
+        self._encoded = b''
+
+        # if no content type is given we stream into memory.  Otherwise
+        # the stream factory is asked for something we can write in.
+        if filename is None:
+            events.append((_begin_form, (headers, name)))
+        else:
+            events.append((_begin_file, (headers, name, filename)))
+        self._state = _data
+        self._part_start = True
+        return True
+
+    def _parse_data(self, events, eof):
+        buf = self._buffer
+        next_part = self._next_part
+        size = len(buf)
+        start = pos = self._pos
+        while True:
+            pos = buf.find(next_part, pos)
+            if pos < 0:
+                break
+            # the boundary has to be at the start of a line ...
+            if (pos > start or not self._part_start) and \
+               buf[pos - 1:pos] not in (b'\r', b'\n'):
+                pos += 1
+                continue
+
+            # ... and it may be followed by whitespace until the line ends
+            end = pos + len(next_part)
+            last = buf[end:end + 2] == b'--'
+            if last:
+                end += 2
+            elif buf[end:end + 1] == b'-' and end + 1 == size and not eof:
+                break
+            while buf[end:end + 1] in (b' ', b'\t'):
+                end += 1
+            if end == size and not eof:
+                break
+            if end < size and buf[end:end + 1] not in (b'\r', b'\n'):
+                pos += 1
+                continue
+            if buf[end:end + 2] == b'\r\n':
+                end += 2
+            elif buf[end:end + 1] == b'\r':
+                if end + 1 == size and not eof:
+                    break
+                end += 1
+            elif end < size:
+                end += 1
+
+            # the newline before the boundary is not part of the data
+            self._write(events, buf[start:self._strip_newline(buf, pos)])
+            self._end_part(events)
+            self._pos = end
+            self._state = last and _epilogue or _headers
+            return True
+
+        # keep everything that could be the start of a boundary
+        if pos < 0:
+            keep = max(size - len(next_part) - 2, start)
+        else:
+            keep = self._strip_newline(buf, pos)
+        if keep > start:
+            self._write(events, buf[start:keep])
+            self._pos = keep
+            self._part_start = False
+        return False
+
+    def _strip_newline(self, buf, pos):
+        if pos - 2 >= self._pos and buf[pos - 2:pos] == b'\r\n':
+            return pos - 2
+        return max(pos - 1, self._pos)
+
+    def _write(self, events, data, final=False):
+        if self._decode is not None and (data or final):
+            try:
+                data, self._encoded = self._decode(self._encoded + data,
+                                                   final)
+            except Exception:
+                self.fail('could not decode transfer encoded chunk')
+        if data:
+            events.append((_cont, data))
+
+    def _end_part(self, events):
+        if self._decode is not None:
+            self._write(events, b'', True)
+            self._decode = None
+        events.append((_end, None))
+
 
 class MultiPartParser(object):
 
     def __init__(self, stream_factory=None, charset='utf-8', errors='replace',
-                 max_form_memory_size=None, cls=None, buffer_size=10 * 1024):
+                 max_form_memory_size=None, cls=None, buffer_size=64 * 1024):
+        if stream_factory is None:
+            stream_factory = default_stream_factory
         self.stream_factory = stream_factory
         self.charset = charset
         self.errors = errors
         self.max_form_memory_size = max_form_memory_size
-        if stream_factory is None:
-            stream_factory = default_stream_factory
         if cls is None:
             cls = MultiDict
         self.cls = cls
@@ -373,93 +673,26 @@ class MultiPartParser(object):
         Always obeys the grammar
         parts = ( begin_form cont* end |
                   begin_file cont* end )*
-        """
-        next_part = b'--' + boundary
-        last_part = next_part + b'--'
-
-        iterator = chain(make_line_iter(file, limit=content_length,
-                                        buffer_size=self.buffer_size),
-                         _empty_string_iter)
-
-        terminator = self._find_terminator(iterator)
 
-        if terminator == last_part:
-            return
-        elif terminator != next_part:
-            self.fail('Expected boundary at start of multipart data')
-
-        while terminator != last_part:
-            headers = parse_multipart_headers(iterator)
-
-            disposition = headers.get('content-disposition')
-            if disposition is None:
-                self.fail('Missing Content-Disposition header')
-            disposition, extra = parse_options_header(disposition)
-            transfer_encoding = self.get_part_encoding(headers)
-            name = extra.get('name')
-            filename = extra.get('filename')
-
-            # if no content type is given we stream into memory.  A list is
-            # used as a temporary container.
-            if filename is None:
-                yield _begin_form, (headers, name)
-
-            # otherwise we parse the rest of the headers and ask the stream
-            # factory for something we can write in.
-            else:
-                yield _begin_file, (headers, name, filename)
-
-            buf = b''
-            for line in iterator:
-                if not line:
-                    self.fail('unexpected end of stream')
-
-                if line[:2] == b'--':
-                    terminator = line.rstrip()
-                    if terminator in (next_part, last_part):
-                        break
-
-                if transfer_encoding is not None:
-                    if transfer_encoding == 'base64':
-                        transfer_encoding = 'base64_codec'
-                    try:
-                        line = codecs.decode(line, transfer_encoding)
-                    except Exception:
-                        self.fail('could not decode transfer encoded chunk')
-
-                # we have something in the buffer from the last iteration.
-                # this is usually a newline delimiter.
-                if buf:
-                    yield _cont, buf
-                    buf = b''
-
-                # If the line ends with windows CRLF we write everything except
-                # the last two bytes.  In all other cases however we write
-                # everything except the last byte.  If it was a newline, that's
-                # fine, otherwise it does not matter because we will write it
-                # the next iteration.  this ensures we do not write the
-                # final newline into the stream.  That way we do not have to
-                # truncate the stream.  However we do have to make sure that
-                # if something else than a newline is in there we write it
-                # out.
-                if line[-2:] == b'\r\n':
-                    buf = b'\r\n'
-                    cutoff = -2
-                else:
-                    buf = line[-1:]
-                    cutoff = -1
-                yield _cont, line[:cutoff]
-
-            else: # pragma: no cover
-                raise ValueError('unexpected end of part')
-
-            # if we have a leftover in the buffer that is not a newline
-            # character we have to flush it, otherwise we will chop of
-            # certain values.
-            if buf not in (b'', b'\r', b'\n', b'\r\n'):
-                yield _cont, buf
-
-            yield _end, None
+        The file is read in chunks of `buffer_size` and fed into a
+        :class:`MultiPartFeedParser`.
+        """
+        parser = MultiPartFeedParser(boundary)
+        parser.fail = self.fail
+        remaining = content_length
+        while not parser.finished:
+            size = self.buffer_size
+            if remaining is not None:
+                size = min(size, remaining)
+            data = size and file.read(size)
+            if not data:
+                for event in parser.feed_eof():
+                    yield event
+                break
+            if remaining is not None:
+                remaining -= len(data)
+            for event in parser.feed(data):
+                yield event
 
     def parse_parts(self, file, boundary, content_length):
         """Generate ``('file', (name, val))`` and
@@ -28,11 +28,13 @@ except ImportError: # pragma: no cover
     from urllib.request import parse_http_list as _parse_list_header
 from datetime import datetime, timedelta
 from hashlib import md5
+from collections import OrderedDict
+from threading import Lock
 import base64
 
 from werkzeug._internal import _cookie_quote, _make_cookie_domain, \
-     _cookie_parse_impl
-from werkzeug._compat import to_unicode, iteritems, text_type, \
+     _cookie_parse_impl, _missing
+from werkzeug._compat import iteritems, text_type, \
      string_types, try_coerce_native, to_bytes, PY2, \
      integer_types
 
@@ -48,6 +50,17 @@ _quoted_string_re = r'"[^"\\]*(?:\\.[^"\\]*)*"'
 _option_header_piece_re = re.compile(r';\s*(%s|[^\s;=]+)\s*(?:=\s*(%s|[^;]+))?\s*' %
     (_quoted_string_re, _quoted_string_re))
 
+_weekday_names = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_month_names = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug',
+                'Sep', 'Oct', 'Nov', 'Dec')
+_month_numbers = dict((name, idx + 1) for idx, name in enumerate(_month_names))
+_rfc1123_date_re = re.compile(
+    r'(?:%s), (\d\d) (%s) ((?!00)\d{4}) (\d\d):(\d\d):(\d\d) GMT$' % (
+        '|'.join(_weekday_names), '|'.join(_month_names)))
+# the last formatted date per delimiter, (seconds, string)
+_last_dates = {}
+# cookie paths that iri_to_uri would not change
+_plain_cookie_path_re = re.compile(r'/[A-Za-z0-9_.\-~/+%]*$')
 _entity_headers = frozenset([
     'allow', 'content-encoding', 'content-language', 'content-length',
     'content-location', 'content-md5', 'content-range', 'content-type',
@@ -60,6 +73,83 @@ _hop_by_hop_headers = frozenset([
 ])
 
 
+class ParsedHeaderCache(object):
+    """A bounded LRU cache of parsed header values.  Headers such as
+    `Accept` or `User-Agent` are sent with the same value over and over
+    again, the parsers in this module and the
+    :class:`~werkzeug.useragents.UserAgent` look their result up here
+    before running their regular expressions.  Entries are keyed by the
+    kind of parser and the raw header value, values longer than
+    `max_value_length` are never cached.  Only immutable results are
+    stored.
+
+    The process wide instance is :data:`parsed_header_cache`.
+
+    .. versionadded:: 0.10
+
+    :param maxsize: the maximum number of cached values.
+    :param max_value_length: the length of the longest header value
+                             that is cached.
+    """
+
+    def __init__(self, maxsize=1024, max_value_length=1024):
+        self.maxsize = maxsize
+        self.max_value_length = max_value_length
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # the cache is shared by all threads of the process
+        self._lock = Lock()
+
+    def get(self, kind, value):
+        """Return the cached result for a header value or `_missing`."""
+        if len(value) > self.max_value_length:
+            return _missing
+        key = (kind, value)
+        with self._lock:
+            try:
+                rv = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return _missing
+            self._entries[key] = rv
+            self.hits += 1
+            return rv
+
+    def set(self, kind, value, result):
+        """Store the result of parsing a header value."""
+        if len(value) > self.max_value_length or not self.maxsize:
+            return
+        entries = self._entries
+        with self._lock:
+            entries[(kind, value)] = result
+            while len(entries) > self.maxsize:
+                entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries and reset the statistics."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """Return a dict with the number of `hits`, `misses`, the
+        `hit_rate` and the current `size` of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits':         self.hits,
+            'misses':       self.misses,
+            'hit_rate':     lookups and float(self.hits) / lookups or 0.0,
+            'size':         len(self._entries),
+            'maxsize':      self.maxsize
+        }
+
+
+#: The :class:`ParsedHeaderCache` used by the header parsers.
+parsed_header_cache = ParsedHeaderCache()
+
+
 HTTP_STATUS_CODES = {
     100:    'Continue',
     101:    'Switching Protocols',
@@ -355,6 +445,9 @@ def parse_accept_header(value, cls=None):
     if not value:
         return cls(None)
 
+    rv = parsed_header_cache.get(cls, value)
+    if rv is not _missing:
+        return rv
     result = []
     for match in _accept_re.finditer(value):
         quality = match.group(2)
@@ -363,7 +456,9 @@ def parse_accept_header(value, cls=None):
         else:
             quality = max(min(float(quality), 1), 0)
         result.append((match.group(1), quality))
-    return cls(result)
+    rv = cls(result)
+    parsed_header_cache.set(cls, value, rv)
+    return rv
 
 
 def parse_cache_control_header(value, on_update=None, cls=None):
@@ -387,7 +482,12 @@ def parse_cache_control_header(value, on_update=None, cls=None):
         cls = RequestCacheControl
     if not value:
         return cls(None, on_update)
-    return cls(parse_dict_header(value), on_update)
+    # the parsed dict is copied by the cache control object
+    values = parsed_header_cache.get('cache-control', value)
+    if values is _missing:
+        values = parse_dict_header(value)
+        parsed_header_cache.set('cache-control', value, values)
+    return cls(values, on_update)
 
 
 def parse_set_header(value, on_update=None):
@@ -502,8 +602,22 @@ def parse_range_header(value, make_inclusive=True):
     if not value or '=' not in value:
         return None
 
+    rv = parsed_header_cache.get('range', value)
+    if rv is _missing:
+        try:
+            rv = _parse_range(value)
+        except ValueError:
+            rv = None
+        parsed_header_cache.set('range', value, rv)
+    if rv is None:
+        return None
+    return Range(rv[0], list(rv[1]))
+
+
+def _parse_range(value):
+    # ranges may overlap and come in any order, see
+    # Range.ranges_for_length() for sorting and merging them
     ranges = []
-    last_end = 0
     units, rng = value.split('=', 1)
     units = units.strip().lower()
 
@@ -512,26 +626,20 @@ def parse_range_header(value, make_inclusive=True):
         if '-' not in item:
             return None
         if item.startswith('-'):
-            if last_end < 0:
-                return None
             begin = int(item)
             end = None
-            last_end = -1
-        elif '-' in item:
+        else:
             begin, end = item.split('-', 1)
             begin = int(begin)
-            if begin < last_end or last_end < 0:
-                return None
             if end:
                 end = int(end) + 1
                 if begin >= end:
                     return None
             else:
                 end = None
-            last_end = end
         ranges.append((begin, end))
 
-    return Range(units, ranges)
+    return units, tuple(ranges)
 
 
 def parse_content_range_header(value, on_update=None):
@@ -624,6 +732,14 @@ def parse_etags(value):
     """
     if not value:
         return ETags()
+    rv = parsed_header_cache.get('etags', value)
+    if rv is _missing:
+        rv = _parse_etags(value)
+        parsed_header_cache.set('etags', value, rv)
+    return rv
+
+
+def _parse_etags(value):
     strong = []
     weak = []
     end = len(value)
@@ -664,39 +780,58 @@ def parse_date(value):
     :param value: a string with a supported date format.
     :return: a :class:`datetime.datetime` object.
     """
-    if value:
-        t = parsedate_tz(value.strip())
-        if t is not None:
-            try:
-                year = t[0]
-                # unfortunately that function does not tell us if two digit
-                # years were part of the string, or if they were prefixed
-                # with two zeroes.  So what we do is to assume that 69-99
-                # refer to 1900, and everything below to 2000
-                if year >= 0 and year <= 68:
-                    year += 2000
-                elif year >= 69 and year <= 99:
-                    year += 1900
-                return datetime(*((year,) + t[1:7])) - \
-                       timedelta(seconds=t[-1] or 0)
-            except (ValueError, OverflowError):
-                return None
+    if not value:
+        return None
+    value = value.strip()
+    # dates sent by browsers and servers are almost always RFC 1123
+    match = _rfc1123_date_re.match(value)
+    if match is not None:
+        day, month, year, hour, minute, second = match.groups()
+        try:
+            return datetime(int(year), _month_numbers[month], int(day),
+                            int(hour), int(minute), int(second))
+        except ValueError:
+            return None
+    t = parsedate_tz(value)
+    if t is not None:
+        try:
+            year = t[0]
+            # unfortunately that function does not tell us if two digit
+            # years were part of the string, or if they were prefixed
+            # with two zeroes.  So what we do is to assume that 69-99
+            # refer to 1900, and everything below to 2000
+            if year >= 0 and year <= 68:
+                year += 2000
+            elif year >= 69 and year <= 99:
+                year += 1900
+            return datetime(*((year,) + t[1:7])) - \
+                   timedelta(seconds=t[-1] or 0)
+        except (ValueError, OverflowError):
+            return None
 
 
 def _dump_date(d, delim):
     """Used for `http_date` and `cookie_date`."""
     if d is None:
-        d = gmtime()
+        d = time()
+    if isinstance(d, (integer_types, float)) and d >= 0:
+        # the current date is formatted for every response, remember
+        # the string for the last second
+        seconds = int(d)
+        last = _last_dates.get(delim)
+        if last is not None and last[0] == seconds:
+            return last[1]
+        rv = _dump_date(gmtime(seconds), delim)
+        _last_dates[delim] = (seconds, rv)
+        return rv
     elif isinstance(d, datetime):
         d = d.utctimetuple()
     elif isinstance(d, (integer_types, float)):
         d = gmtime(d)
     return '%s, %02d%s%s%s%s %02d:%02d:%02d GMT' % (
-        ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')[d.tm_wday],
-        d.tm_mday, delim,
-        ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep',
-         'Oct', 'Nov', 'Dec')[d.tm_mon - 1],
-        delim, str(d.tm_year), d.tm_hour, d.tm_min, d.tm_sec
+        _weekday_names[d.tm_wday], d.tm_mday, delim,
+        _month_names[d.tm_mon - 1], delim, str(d.tm_year),
+        d.tm_hour, d.tm_min, d.tm_sec
     )
 
 
@@ -767,6 +902,43 @@ def is_resource_modified(environ, etag=None, data=None, last_modified=None):
     return not unmodified
 
 
+def get_byte_ranges(environ, length, etag=None, last_modified=None):
+    """Returns the byte ranges a GET request asks for as a list of
+    ``(start, stop)`` tuples, see
+    :meth:`~werkzeug.datastructures.Range.ranges_for_length`.  `None` is
+    returned if the complete resource should be sent because there is no
+    valid `Range` header or the `If-Range` header does not match the etag
+    or the date of the last modification.  If-Range uses the strong
+    comparison, a weak etag never matches.  An empty list means that the
+    range is not satisfiable.
+
+    .. versionadded:: 0.10
+
+    :param environ: the WSGI environment of the request.
+    :param length: the length of the resource in bytes.
+    :param etag: the strong etag of the resource.
+    :param last_modified: an optional date of the last modification.
+    """
+    if environ['REQUEST_METHOD'] != 'GET':
+        return None
+    rng = parse_range_header(environ.get('HTTP_RANGE'))
+    if rng is None:
+        return None
+    if_range = parse_if_range_header(environ.get('HTTP_IF_RANGE'))
+    if if_range.date is not None:
+        if isinstance(last_modified, string_types):
+            last_modified = parse_date(last_modified)
+        if last_modified is None or \
+           last_modified.replace(microsecond=0) != if_range.date:
+            return None
+    elif if_range.etag is not None:
+        # parse_if_range_header() drops the weakness information
+        if if_range.etag != etag or \
+           unquote_etag(environ['HTTP_IF_RANGE'])[1]:
+            return None
+    return rng.ranges_for_length(length)
+
+
 def remove_entity_headers(headers, allowed=('expires', 'content-location')):
     """Remove all entity headers from a list or :class:`Headers` object.  This
     operation works in-place.  `Expires` and `Content-Location` headers are
@@ -853,13 +1025,11 @@ def parse_cookie(header, charset='utf-8', errors='replace', cls=None):
     if cls is None:
         cls = TypeConversionDict
 
-    def _parse_pairs():
-        for key, val in _cookie_parse_impl(header):
-            key = to_unicode(key, charset, errors, allow_none_charset=True)
-            val = to_unicode(val, charset, errors, allow_none_charset=True)
-            yield try_coerce_native(key), val
-
-    return cls(_parse_pairs())
+    pairs = _cookie_parse_impl(header)
+    if charset is not None:
+        pairs = ((try_coerce_native(key.decode(charset, errors)),
+                  val.decode(charset, errors)) for key, val in pairs)
+    return cls(pairs)
 
 
 def dump_cookie(key, value='', max_age=None, expires=None, path='/',
@@ -904,7 +1074,8 @@ def dump_cookie(key, value='', max_age=None, expires=None, path='/',
     key = to_bytes(key, charset)
     value = to_bytes(value, charset)
 
-    if path is not None:
+    if path is not None and not (isinstance(path, str) and
+                                 _plain_cookie_path_re.match(path)):
         path = iri_to_uri(path, charset)
     domain = _make_cookie_domain(domain)
     if isinstance(max_age, timedelta):
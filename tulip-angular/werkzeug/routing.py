@@ -96,7 +96,11 @@
     :license: BSD, see LICENSE for more details.
 """
 import re
+import numbers
 import posixpath
+from collections import OrderedDict
+from threading import Lock
+from itertools import chain
 from pprint import pformat
 try:
     from urlparse import urljoin
@@ -108,7 +112,7 @@ from werkzeug.utils import redirect, format_string
 from werkzeug.exceptions import HTTPException, NotFound, MethodNotAllowed
 from werkzeug._internal import _get_environ, _encode_idna
 from werkzeug._compat import itervalues, iteritems, to_unicode, to_bytes, \
-     text_type, string_types, native_string_result, \
+     text_type, string_types, integer_types, native_string_result, \
      implements_to_string, wsgi_decoding_dance
 from werkzeug.datastructures import ImmutableDict, MultiDict
 
@@ -209,6 +213,22 @@ def parse_rule(rule):
         yield None, None, remaining
 
 
+def _static_segments(rule):
+    """Return the leading path segments of a rule string that are
+    completely static.  Every path the rule can match starts with these
+    segments, which is what the match index of the map is keyed on.
+
+    :internal:
+    """
+    prefix = []
+    for converter, arguments, variable in parse_rule(rule):
+        if converter is not None:
+            # the segment the first converter is in is not static
+            return ''.join(prefix)[1:].split('/')[:-1]
+        prefix.append(variable)
+    return ''.join(prefix).rstrip('/')[1:].split('/')
+
+
 class RoutingException(Exception):
     """Special exceptions that require the application to redirect, notifying
     about missing urls, etc.
@@ -563,6 +583,7 @@ class Rule(RuleFactory):
         else:
             self.arguments = set()
         self._trace = self._converters = self._regex = self._weights = None
+        self._build_trace = self._build_format = self._build_names = None
 
     def empty(self):
         """Return an unbound copy of this rule.  This can be useful if you
@@ -652,6 +673,7 @@ class Rule(RuleFactory):
         _build_regex(self.is_leaf and self.rule or self.rule.rstrip('/'))
         if not self.is_leaf:
             self._trace.append((False, '/'))
+        self._compile_builder()
 
         if self.build_only:
             return
@@ -662,6 +684,31 @@ class Rule(RuleFactory):
         )
         self._regex = re.compile(regex, re.UNICODE)
 
+    def _compile_builder(self):
+        """Quotes the static parts of the trace once for :meth:`build`.
+        If all converters of the rule use the default `to_url`, the url
+        is built from a single format string.
+
+        :internal:
+        """
+        self._build_trace = []
+        for is_dynamic, data in self._trace:
+            if not is_dynamic:
+                data = url_quote(to_bytes(data, self.map.charset),
+                                 safe='/:|+')
+                if self._build_trace and not self._build_trace[-1][0]:
+                    data = self._build_trace.pop()[1] + data
+            self._build_trace.append((is_dynamic, data))
+
+        self._build_format = self._build_names = None
+        if all(type(self._converters[data]).to_url == BaseConverter.to_url
+               for is_dynamic, data in self._build_trace if is_dynamic):
+            self._build_format = u''.join(
+                is_dynamic and u'%s' or data.replace(u'%', u'%%')
+                for is_dynamic, data in self._build_trace)
+            self._build_names = tuple(
+                data for is_dynamic, data in self._build_trace if is_dynamic)
+
     def match(self, path):
         """Check if the rule matches a given path. Path is a string in the
         form ``"subdomain|/path(method)"`` and is assembled by the map.  If
@@ -710,30 +757,34 @@ class Rule(RuleFactory):
 
         :internal:
         """
-        tmp = []
-        add = tmp.append
-        processed = set(self.arguments)
-        for is_dynamic, data in self._trace:
-            if is_dynamic:
-                try:
-                    add(self._converters[data].to_url(values[data]))
-                except ValidationError:
-                    return
-                processed.add(data)
-            else:
-                add(url_quote(to_bytes(data, self.map.charset), safe='/:|+'))
-        domain_part, url = (u''.join(tmp)).split(u'|', 1)
+        if self._build_format is not None:
+            charset = self.map.charset
+            rv = self._build_format % tuple(
+                url_quote(to_bytes(values[name], charset))
+                for name in self._build_names)
+        else:
+            tmp = []
+            add = tmp.append
+            for is_dynamic, data in self._build_trace:
+                if is_dynamic:
+                    try:
+                        add(self._converters[data].to_url(values[data]))
+                    except ValidationError:
+                        return
+                else:
+                    add(data)
+            rv = u''.join(tmp)
+        domain_part, url = rv.split(u'|', 1)
 
-        if append_unknown:
+        if append_unknown and not self.arguments.issuperset(values):
             query_vars = MultiDict(values)
-            for key in processed:
+            for key in self.arguments:
                 if key in query_vars:
                     del query_vars[key]
 
-            if query_vars:
-                url += u'?' + url_encode(query_vars, charset=self.map.charset,
-                                        sort=self.map.sort_parameters,
-                                        key=self.map.sort_key)
+            url += u'?' + url_encode(query_vars, charset=self.map.charset,
+                                    sort=self.map.sort_parameters,
+                                    key=self.map.sort_key)
 
         return domain_part, url
 
@@ -1008,12 +1059,20 @@ class Map(object):
                           feature and disables the subdomain one.  If
                           enabled the `host` parameter to rules is used
                           instead of the `subdomain` one.
+    :param build_cache_size: the number of built URLs that are remembered
+                             by :meth:`MapAdapter.build`.  Set to `0` to
+                             disable the cache, for example if a custom
+                             converter does not always build the same URL
+                             for the same value.
 
     .. versionadded:: 0.5
         `sort_parameters` and `sort_key` was added.
 
     .. versionadded:: 0.7
         `encoding_errors` and `host_matching` was added.
+
+    .. versionadded:: 0.10
+        `build_cache_size` was added.
     """
 
     #: .. versionadded:: 0.6
@@ -1023,9 +1082,14 @@ class Map(object):
     def __init__(self, rules=None, default_subdomain='', charset='utf-8',
                  strict_slashes=True, redirect_defaults=True,
                  converters=None, sort_parameters=False, sort_key=None,
-                 encoding_errors='replace', host_matching=False):
+                 encoding_errors='replace', host_matching=False,
+                 build_cache_size=1024):
         self._rules = []
         self._rules_by_endpoint = {}
+        self._match_index = None
+        self._build_cache = OrderedDict()
+        # the map is shared by all request threads
+        self._build_cache_lock = Lock()
         self._remap = True
 
         self.default_subdomain = default_subdomain
@@ -1041,6 +1105,7 @@ class Map(object):
 
         self.sort_parameters = sort_parameters
         self.sort_key = sort_key
+        self.build_cache_size = build_cache_size
 
         for rulefactory in rules or ():
             self.add(rulefactory)
@@ -1214,13 +1279,67 @@ class Map(object):
             self._rules.sort(key=lambda x: x.match_compare_key())
             for rules in itervalues(self._rules_by_endpoint):
                 rules.sort(key=lambda x: x.build_compare_key())
+            self._match_index = self._build_match_index()
+            with self._build_cache_lock:
+                self._build_cache.clear()
             self._remap = False
 
+    def _build_match_index(self):
+        """Builds a trie of the static leading path segments of the
+        rules.  Each node is a ``(rules, children)`` tuple where `rules`
+        is a list of ``(position, rule)`` tuples for the rules whose
+        static segments end at that node.
+
+        :internal:
+        """
+        root = ([], {})
+        for pos, rule in enumerate(self._rules):
+            if rule.build_only:
+                continue
+            node = root
+            for segment in _static_segments(rule.rule):
+                node = node[1].setdefault(segment, ([], {}))
+            node[0].append((pos, rule))
+        return root
+
+    def _match_candidates(self, path_info):
+        """Returns the rules that can match the path in the order they
+        have to be tried.  This only walks the segments of the path
+        instead of trying every rule of the map.
+
+        :internal:
+        """
+        node = self._match_index
+        found = [node[0]] if node[0] else []
+        for segment in path_info.lstrip('/').split('/'):
+            node = node[1].get(segment)
+            if node is None:
+                break
+            if node[0]:
+                found.append(node[0])
+
+        if not found:
+            return ()
+        if len(found) == 1:
+            return [rule for pos, rule in found[0]]
+        return [rule for pos, rule in sorted(chain(*found))]
+
     def __repr__(self):
         rules = self.iter_rules()
         return '%s(%s)' % (self.__class__.__name__, pformat(list(rules)))
 
 
+def _build_cache_value(value):
+    """The part of a build cache key for a value.  Equal numbers such as
+    ``0.0`` and ``-0.0`` or ``Decimal('1')`` and ``Decimal('1.0')`` do
+    not always convert to the same URL, so those are keyed by their repr.
+    """
+    if isinstance(value, numbers.Number) and \
+       not isinstance(value, integer_types):
+        return type(value), repr(value)
+    return type(value), value
+
+
 class MapAdapter(object):
     """Returned by :meth:`Map.bind` or :meth:`Map.bind_to_environ` and does
     the URL matching and building based on runtime information.
@@ -1386,7 +1505,7 @@ class MapAdapter(object):
                             self.subdomain, path_info.lstrip('/'))
 
         have_match_for = set()
-        for rule in self.map._rules:
+        for rule in self.map._match_candidates(path_info):
             try:
                 rv = rule.match(path)
             except RequestSlash:
@@ -1615,6 +1734,29 @@ class MapAdapter(object):
         else:
             values = {}
 
+        cache = self.map._build_cache
+        lock = self.map._build_cache_lock
+        key = None
+        if self.map.build_cache_size:
+            # the type is part of the key as 1, 1.0 and True are equal
+            # but are not converted to the same url
+            try:
+                key = (endpoint, method, force_external, append_unknown,
+                       self.server_name, self.script_name, self.subdomain,
+                       self.url_scheme, self.default_method,
+                       frozenset((k, _build_cache_value(v))
+                                 for k, v in iteritems(values)))
+                hash(key)
+            except TypeError:
+                # unhashable values are not cached
+                key = None
+            else:
+                with lock:
+                    rv = cache.pop(key, None)
+                    if rv is not None:
+                        cache[key] = rv
+                        return rv
+
         rv = self._partial_build(endpoint, values, method, append_unknown)
         if rv is None:
             raise BuildError(endpoint, values, method)
@@ -1626,10 +1768,18 @@ class MapAdapter(object):
         if not force_external and (
             (self.map.host_matching and host == self.server_name) or
             (not self.map.host_matching and domain_part == self.subdomain)):
-            return str(urljoin(self.script_name, './' + path.lstrip('/')))
-        return str('%s://%s%s/%s' % (
-            self.url_scheme,
-            host,
-            self.script_name[:-1],
-            path.lstrip('/')
-        ))
+            rv = str(urljoin(self.script_name, './' + path.lstrip('/')))
+        else:
+            rv = str('%s://%s%s/%s' % (
+                self.url_scheme,
+                host,
+                self.script_name[:-1],
+                path.lstrip('/')
+            ))
+
+        if key is not None:
+            with lock:
+                cache[key] = rv
+                while len(cache) > self.map.build_cache_size:
+                    cache.popitem(last=False)
+        return rv
@@ -613,6 +613,34 @@ class HeadersTestCase(WerkzeugTestCase):
             ('X-Forwarded-For', '192.168.0.123')
         ])
 
+    def test_lookup_index(self):
+        h = self.storage_class([('X-Foo', 'a'), ('x-bar', 'b')])
+        self.assert_equal(h['x-foo'], 'a')
+        h.add('X-FOO', 'c')
+        h.add('X-Baz', 'd')
+        self.assert_equal(h['X-BAZ'], 'd')
+        self.assert_equal(h.getlist('x-foo'), ['a', 'c'])
+        h[0] = ('X-Other', 'e')
+        self.assert_equal(h['x-foo'], 'c')
+        h.remove('X-Foo')
+        self.assert_not_in('x-foo', h)
+        self.assert_equal(h.getlist('x-foo'), [])
+        h.set('x-bar', 'f')
+        self.assert_equal(h['X-Bar'], 'f')
+        del h[:2]
+        self.assert_equal(h['x-baz'], 'd')
+        self.assert_not_in('x-bar', h)
+        h.clear()
+        self.assert_not_in('x-baz', h)
+
+    def test_pickle(self):
+        h = self.storage_class([('X-Foo', 'a'), ('X-Bar', 'b')])
+        h['x-foo']
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            h2 = pickle.loads(pickle.dumps(h, protocol))
+            self.assert_equal(h2, h)
+            self.assert_equal(h2['x-bar'], 'b')
+
 
 class EnvironHeadersTestCase(WerkzeugTestCase):
     storage_class = datastructures.EnvironHeaders
@@ -11,6 +11,7 @@
 
 from __future__ import with_statement
 
+import codecs
 import unittest
 from os.path import join, dirname
 
@@ -144,6 +145,9 @@ class FormParserTestCase(WerkzeugTestCase):
                 i = iter(self.parse_lines(file, boundary, content_length))
                 one = next(i)
                 two = next(i)
+                # the file arrives in chunks of buffer_size
+                rest = b''.join(ell for ellt, ell in i if ellt == 'cont')
+                two = (two[0], two[1] + rest)
                 return self.cls(()), {'one': one, 'two': two}
         class StreamFDP(formparser.FormDataParser):
             def _sf_parse_multipart(self, stream, mimetype,
@@ -347,6 +351,67 @@ class MultiPartTestCase(WerkzeugTestCase):
         self.assert_raises(ValueError, formparser.parse_multipart_headers,
                            ['foo: bar\r\n', ' x test'])
 
+    def test_feed_parser(self):
+        data = (b'--foo\r\n'
+                b'Content-Disposition: form-data; name="text"\r\n\r\n'
+                b'line one\r\n--foo-not-a-boundary\r\n--foo  \r\n'
+                b'Content-Disposition: form-data; name="file"; '
+                b'filename="test.bin"\r\n\r\n' +
+                b'\x00\xff' * 1000 + b'\r\n'
+                b'--foo--\r\nepilogue')
+        expected = None
+        for size in 1, 2, 7, 64, len(data):
+            parser = formparser.MultiPartFeedParser(b'foo')
+            events = []
+            for pos in range(0, len(data), size):
+                events.extend(parser.feed(data[pos:pos + size]))
+            events.extend(parser.feed_eof())
+            self.assert_true(parser.finished)
+
+            parts = []
+            for event, value in events:
+                if event == 'begin_form':
+                    parts.append([value[1], b''])
+                elif event == 'begin_file':
+                    parts.append([value[1], b'', value[2]])
+                elif event == 'cont':
+                    parts[-1][1] += value
+            if expected is None:
+                expected = parts
+                self.assert_equal(parts, [
+                    ['text', b'line one\r\n--foo-not-a-boundary'],
+                    ['file', b'\x00\xff' * 1000, 'test.bin']])
+            self.assert_equal(parts, expected)
+
+        parser = formparser.MultiPartFeedParser(b'foo')
+        parser.feed(b'--foo\r\nContent-Disposition: form-data; name=x\r\n')
+        self.assert_raises(ValueError, parser.feed_eof)
+
+    def test_feed_parser_transfer_encoding(self):
+        contents = b'caf\xc3\xa9 = \x00\xff\t\r\n' * 200
+        for encoding, encoded in (
+                ('base64', codecs.encode(contents, 'base64_codec')),
+                ('quoted-printable', codecs.encode(contents, 'quopri_codec'))):
+            data = (b'--foo\r\n'
+                    b'Content-Disposition: form-data; name="file"; '
+                    b'filename="test.bin"\r\n'
+                    b'Content-Transfer-Encoding: ' +
+                    encoding.encode('ascii') + b'\r\n\r\n' +
+                    encoded + b'\r\n--foo--')
+            for size in 1, 7, 64, len(data):
+                parser = formparser.MultiPartFeedParser(b'foo')
+                chunks = []
+                for pos in range(0, len(data), size):
+                    chunks.extend(value for event, value in
+                                  parser.feed(data[pos:pos + size])
+                                  if event == 'cont')
+                # the part is decoded while it arrives
+                if size < len(data):
+                    self.assert_true(len(chunks) > 1)
+                chunks.extend(value for event, value in parser.feed_eof()
+                              if event == 'cont')
+                self.assert_equal(b''.join(chunks), contents)
+
     def test_bad_newline_bad_newline_assumption(self):
         class ISORequest(Request):
             charset = 'latin1'
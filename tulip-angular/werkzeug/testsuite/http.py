@@ -8,11 +8,13 @@
     :copyright: (c) 2013 by Armin Ronacher.
     :license: BSD, see LICENSE for more details.
 """
+import threading
 import unittest
 from datetime import datetime
 
 from werkzeug.testsuite import WerkzeugTestCase
 from werkzeug._compat import itervalues, wsgi_encoding_dance
+from werkzeug._internal import _missing
 
 from werkzeug import http, datastructures
 from werkzeug.test import create_environ
@@ -195,11 +197,74 @@ class HTTPUtilityTestCase(WerkzeugTestCase):
         self.assert_true(bool(etags))
         self.assert_true(etags.contains_raw('w/"foo"'))
 
+    def test_parsed_header_cache(self):
+        cache = http.ParsedHeaderCache(maxsize=2, max_value_length=20)
+        assert cache.get('accept', 'text/html') is _missing
+        cache.set('accept', 'text/html', 1)
+        cache.set('etags', 'text/html', 2)
+        assert cache.get('accept', 'text/html') == 1
+        cache.set('accept', 'text/plain', 3)
+        assert cache.get('etags', 'text/html') is _missing
+        assert cache.get('accept', 'text/html') == 1
+        cache.set('accept', 'x' * 21, 4)
+        assert cache.get('accept', 'x' * 21) is _missing
+        stats = cache.stats()
+        assert (stats['hits'], stats['misses'], stats['size']) == (2, 2, 2)
+        assert stats['hit_rate'] == 0.5
+        cache.clear()
+        assert cache.stats()['size'] == cache.stats()['hits'] == 0
+
+        hits = http.parsed_header_cache.hits
+        a = http.parse_accept_header('text/html;q=0.5, text/plain',
+                                     datastructures.MIMEAccept)
+        b = http.parse_accept_header('text/html;q=0.5, text/plain',
+                                     datastructures.MIMEAccept)
+        assert a is b
+        assert http.parsed_header_cache.hits == hits + 1
+        assert http.parse_accept_header('text/html;q=0.5, text/plain') == a
+        c = http.parse_cache_control_header('max-age=0', None,
+                                            datastructures.ResponseCacheControl)
+        c.max_age = 10
+        c = http.parse_cache_control_header('max-age=0')
+        assert c.max_age == 0
+        r = http.parse_range_header('bytes=0-99')
+        r.ranges.append((200, 300))
+        assert http.parse_range_header('bytes=0-99').ranges == [(0, 100)]
+
+    def test_parsed_header_cache_threads(self):
+        cache = http.ParsedHeaderCache(maxsize=16)
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(2000):
+                    value = 'text/x-%d' % ((i * 7 + n) % 40)
+                    if cache.get('accept', value) is _missing:
+                        cache.set('accept', value, i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,))
+                   for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assert_equal(errors, [])
+        stats = cache.stats()
+        self.assert_equal(stats['size'], 16)
+        self.assert_equal(stats['hits'] + stats['misses'], 8 * 2000)
+        cache.set('accept', 'text/html', 1)
+        self.assert_equal(cache.get('accept', 'text/html'), 1)
+
     def test_parse_date(self):
         assert http.parse_date('Sun, 06 Nov 1994 08:49:37 GMT    ') == datetime(1994, 11, 6, 8, 49, 37)
         assert http.parse_date('Sunday, 06-Nov-94 08:49:37 GMT') == datetime(1994, 11, 6, 8, 49, 37)
         assert http.parse_date(' Sun Nov  6 08:49:37 1994') == datetime(1994, 11, 6, 8, 49, 37)
         assert http.parse_date('foo') is None
+        assert http.parse_date('Sun, 06 Nov 0094 08:49:37 GMT') == datetime(1994, 11, 6, 8, 49, 37)
+        assert http.parse_date('Sun, 31 Nov 1994 08:49:37 GMT') is None
+        assert http.parse_date('Sun, 06 Nov 1994 08:49:37 +0100') == datetime(1994, 11, 6, 7, 49, 37)
 
     def test_parse_date_overflows(self):
         assert http.parse_date(' Sun 02 Feb 1343 08:49:37 GMT') == datetime(1343, 2, 2, 8, 49, 37)
@@ -279,6 +344,10 @@ class HTTPUtilityTestCase(WerkzeugTestCase):
         assert http.cookie_date(datetime(1970, 1, 1)) == 'Thu, 01-Jan-1970 00:00:00 GMT'
         assert http.http_date(0) == 'Thu, 01 Jan 1970 00:00:00 GMT'
         assert http.http_date(datetime(1970, 1, 1)) == 'Thu, 01 Jan 1970 00:00:00 GMT'
+        assert http.http_date(86400.9) == 'Fri, 02 Jan 1970 00:00:00 GMT'
+        assert http.http_date(86401) == 'Fri, 02 Jan 1970 00:00:01 GMT'
+        assert http.cookie_date(86401) == 'Fri, 02-Jan-1970 00:00:01 GMT'
+        assert http.parse_date(http.http_date()) is not None
 
     def test_cookies(self):
         self.assert_strict_equal(
@@ -298,6 +367,12 @@ class HTTPUtilityTestCase(WerkzeugTestCase):
         )
         self.assert_strict_equal(dict(http.parse_cookie('fo234{=bar; blub=Blah')),
                                  {'fo234{': u'bar', 'blub': u'Blah'})
+        self.assert_strict_equal(
+            dict(http.parse_cookie('=a; flag; b = c d ;path=/;=;e==f')),
+            {'a; flag; b': u'c d', ';e': u'=f'})
+        self.assert_equal(
+            http.dump_cookie('foo', 'bar', path=u'/\xe4 x'),
+            'foo=bar; Path=/%C3%A4%20x')
 
     def test_cookie_quoting(self):
         val = http.dump_cookie("foo", "?foo")
@@ -344,6 +419,42 @@ class HTTPUtilityTestCase(WerkzeugTestCase):
         val = http.dump_cookie('foo', 'bar', domain=u'.foo.com')
         self.assert_strict_equal(val, 'foo=bar; Domain=.foo.com; Path=/')
 
+    def test_byte_ranges(self):
+        rv = http.parse_range_header('bytes=0-99,100-199,500-599,2000-')
+        self.assert_equal(rv.ranges_for_length(1000), [(0, 200), (500, 600)])
+        rv = http.parse_range_header('bytes=0-99,900-949,-100')
+        self.assert_equal(rv.ranges_for_length(1000), [(0, 100), (900, 1000)])
+        rv = http.parse_range_header('bytes=500-,0-99,50-149,-600')
+        self.assert_equal(rv.ranges_for_length(1000), [(0, 150), (400, 1000)])
+        rv = http.parse_range_header('bytes=-5000')
+        self.assert_equal(rv.ranges_for_length(1000), [(0, 1000)])
+        rv = http.parse_range_header('bytes=2000-2999')
+        self.assert_equal(rv.ranges_for_length(1000), [])
+        rv = http.parse_range_header('items=0-1')
+        self.assert_true(rv.ranges_for_length(1000) is None)
+        self.assert_true(http.parse_range_header('bytes=a-b') is None)
+
+        last_modified = datetime(2013, 5, 1, 12, 30)
+        def get_ranges(**headers):
+            env = create_environ(headers=headers)
+            return http.get_byte_ranges(env, 1000, 'abc', last_modified)
+        self.assert_true(get_ranges() is None)
+        self.assert_equal(get_ranges(Range='bytes=0-9,20-29'),
+                          [(0, 10), (20, 30)])
+        self.assert_equal(get_ranges(Range='bytes=0-9', If_Range='"abc"'),
+                          [(0, 10)])
+        self.assert_true(get_ranges(Range='bytes=0-9',
+                                    If_Range='"xyz"') is None)
+        self.assert_true(get_ranges(Range='bytes=0-9',
+                                    If_Range='W/"abc"') is None)
+        self.assert_equal(get_ranges(Range='bytes=0-9',
+                                     If_Range=http.http_date(last_modified)),
+                          [(0, 10)])
+        self.assert_true(get_ranges(Range='bytes=0-9',
+                                    If_Range=http.http_date(0)) is None)
+        env = create_environ(method='POST', headers={'Range': 'bytes=0-9'})
+        self.assert_true(http.get_byte_ranges(env, 1000) is None)
+
 
 class RangeTestCase(WerkzeugTestCase):
 
@@ -8,6 +8,7 @@
     :copyright: (c) 2013 by Armin Ronacher.
     :license: BSD, see LICENSE for more details.
 """
+import threading
 import unittest
 
 from werkzeug.testsuite import WerkzeugTestCase
@@ -659,6 +660,95 @@ class RoutingTestCase(WerkzeugTestCase):
         self.assert_strict_equal(rv,
             "Map([<Rule '/woop' -> foobar>, <Rule '/wat' -> enter>])")
 
+    def test_match_index(self):
+        rules = [r.Rule('/page/%d' % i, endpoint='page%d' % i)
+                 for i in range(100)]
+        m = r.Map(rules + [
+            r.Rule('/', endpoint='index'),
+            r.Rule('/<name>', endpoint='name'),
+            r.Rule('/page/<int:num>', endpoint='page'),
+            r.Rule('/page/x<int:num>', endpoint='xpage'),
+            r.Rule('/page/<path:rest>', endpoint='rest'),
+            r.Rule('/folder/', endpoint='folder'),
+            r.Rule('/edit/<int:id>', endpoint='edit', methods=['POST']),
+            r.Rule('/edit/<int:id>', endpoint='view', methods=['GET']),
+            r.Rule('/build', endpoint='build', build_only=True),
+        ])
+        a = m.bind('example.org', '/')
+        self.assert_equal(a.match('/'), ('index', {}))
+        self.assert_equal(a.match('/page/42'), ('page42', {}))
+        self.assert_equal(a.match('/page/420'), ('page', {'num': 420}))
+        self.assert_equal(a.match('/page/x42'), ('xpage', {'num': 42}))
+        self.assert_equal(a.match('/page/a/b'), ('rest', {'rest': 'a/b'}))
+        self.assert_equal(a.match('/page'), ('name', {'name': 'page'}))
+        self.assert_equal(a.match('/build'), ('name', {'name': 'build'}))
+        self.assert_equal(a.match('/folder/'), ('folder', {}))
+        self.assert_equal(a.match('/edit/1', 'POST'), ('edit', {'id': 1}))
+        self.assert_equal(a.match('/edit/1', 'GET'), ('view', {'id': 1}))
+        self.assert_raises(r.RequestRedirect, a.match, '/folder')
+        self.assert_raises(r.MethodNotAllowed, a.match, '/edit/1', 'PUT')
+        self.assert_raises(r.NotFound, a.match, '/missing/page')
+
+        m.add(r.Rule('/missing/page', endpoint='added'))
+        self.assert_equal(a.match('/missing/page'), ('added', {}))
+
+    def test_build_cache(self):
+        m = r.Map([
+            r.Rule('/', endpoint='index'),
+            r.Rule('/user/<name>', endpoint='user'),
+            r.Rule('/page/<int:num>', endpoint='page'),
+        ], build_cache_size=2)
+        a = m.bind('example.org', '/')
+        self.assert_strict_equal(a.build('user', {'name': 'a b'}),
+                                 '/user/a%20b')
+        self.assert_strict_equal(a.build('user', {'name': 'a b'}),
+                                 '/user/a%20b')
+        self.assert_strict_equal(a.build('user', {'name': 'a b'},
+                                         force_external=True),
+                                 'http://example.org/user/a%20b')
+        self.assert_strict_equal(a.build('page', {'num': 1, 'q': ['x', 'y']}),
+                                 '/page/1?q=x&q=y')
+        self.assert_strict_equal(a.build('index', {'q': 1}), '/?q=1')
+        self.assert_strict_equal(a.build('index', {'q': True}), '/?q=True')
+        self.assert_equal(len(m._build_cache), 2)
+        self.assert_strict_equal(a.build('index', {'q': 0.0}), '/?q=0.0')
+        self.assert_strict_equal(a.build('index', {'q': -0.0}), '/?q=-0.0')
+
+        b = m.bind('example.org', '/app')
+        self.assert_strict_equal(b.build('index'), '/app/')
+
+        m.add(r.Rule('/user/<name>/', endpoint='user'))
+        self.assert_equal(a.build('index'), '/')
+        self.assert_equal(len(m._build_cache), 1)
+
+        m = r.Map([r.Rule('/', endpoint='index')], build_cache_size=0)
+        m.bind('example.org', '/').build('index')
+        self.assert_equal(len(m._build_cache), 0)
+
+    def test_build_cache_threads(self):
+        m = r.Map([r.Rule('/page/<int:num>', endpoint='page')],
+                  build_cache_size=16)
+        a = m.bind('example.org', '/')
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(2000):
+                    num = (i * 7 + n) % 40
+                    if a.build('page', {'num': num}) != '/page/%d' % num:
+                        errors.append(num)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,))
+                   for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assert_equal(errors, [])
+        self.assert_equal(len(m._build_cache), 16)
+
 
 def suite():
     suite = unittest.TestSuite()
@@ -12,7 +12,8 @@ import unittest
 
 from werkzeug.testsuite import WerkzeugTestCase
 
-from werkzeug.datastructures import OrderedMultiDict
+from werkzeug.datastructures import OrderedMultiDict, ImmutableMultiDict, \
+     LazyMultiDict
 from werkzeug import urls
 from werkzeug._compat import text_type, NativeStringIO, BytesIO
 
@@ -47,6 +48,35 @@ class URLsTestCase(WerkzeugTestCase):
         x = urls.url_decode(b'%C3%9Ch=H%C3%A4nsel', decode_keys=True)
         self.assert_strict_equal(x[u'Üh'], u'Hänsel')
 
+    def test_lazy_url_decoding(self):
+        x = urls.url_decode(b'foo=4%32&bar=a+b&foo=23&uni=H%C3%A4nsel',
+                            lazy=True)
+        self.assert_true(isinstance(x, LazyMultiDict))
+        self.assert_equal(len(x), 3)
+        self.assert_in('bar', x)
+        self.assert_strict_equal(dict.__getitem__(x, 'bar'), [b'a+b'])
+        self.assert_strict_equal(x['bar'], u'a b')
+        self.assert_strict_equal(dict.__getitem__(x, 'foo'), [b'4%32', b'23'])
+        self.assert_strict_equal(x.getlist('foo'), [u'42', u'23'])
+        x.add('uni', u'Hans')
+        self.assert_strict_equal(x.getlist('uni'), [u'Hänsel', u'Hans'])
+        self.assert_equal(x, urls.url_decode(
+            b'foo=42&bar=a+b&foo=23&uni=H%C3%A4nsel&uni=Hans'))
+
+        x = urls.url_decode(b'foo=4%32&bar=a+b', lazy=True,
+                            cls=ImmutableMultiDict)
+        self.assert_true(isinstance(x, ImmutableMultiDict))
+        self.assert_strict_equal(x.to_dict(), {'foo': u'42', 'bar': u'a b'})
+        self.assert_raises(TypeError, x.add, 'foo', u'23')
+
+        x = urls.url_decode(b'foo=4%32', lazy=True, cls=OrderedMultiDict)
+        self.assert_strict_equal(x['foo'], u'42')
+
+        x = urls.url_decode_stream(BytesIO(b'foo=4%32&bar=a+b'), lazy=True)
+        self.assert_true(isinstance(x, LazyMultiDict))
+        self.assert_strict_equal(sorted(x.items()),
+                                 [('bar', u'a b'), ('foo', u'42')])
+
     def test_url_bytes_decoding(self):
         x = urls.url_decode(b'foo=42&bar=23&uni=H%C3%A4nsel', charset=None)
         self.assert_strict_equal(x[b'foo'], b'42')
@@ -18,12 +18,13 @@ from werkzeug.testsuite import WerkzeugTestCase
 
 from werkzeug import wrappers
 from werkzeug.exceptions import SecurityError
-from werkzeug.wsgi import LimitedStream
+from werkzeug.wsgi import LimitedStream, FileWrapper
 from werkzeug.datastructures import MultiDict, ImmutableOrderedMultiDict, \
      ImmutableList, ImmutableTypeConversionDict, CharsetAccept, \
-     MIMEAccept, LanguageAccept, Accept, CombinedMultiDict
+     MIMEAccept, LanguageAccept, Accept, CombinedMultiDict, ImmutableMultiDict
 from werkzeug.test import Client, create_environ, run_wsgi_app
 from werkzeug._compat import implements_iterator, text_type
+from werkzeug.urls import url_decode
 
 
 class RequestTestResponse(wrappers.BaseResponse):
@@ -147,6 +148,22 @@ class WrappersTestCase(WerkzeugTestCase):
         req = wrappers.Request.from_values('/bar?foo=baz', 'https://example.com/test')
         self.assert_strict_equal(req.scheme, 'https')
 
+    def test_lazy_query_parsing(self):
+        query = '/?a=%41b&a=c+d&e=%C3%A9'
+        form = {'f': u'x y\xe9'}
+        req = wrappers.Request.from_values(query, data=form, method='POST')
+        eager = url_decode(b'a=%41b&a=c+d&e=%C3%A9', cls=ImmutableMultiDict)
+        self.assert_equal(dict(req.args), dict(eager))
+        self.assert_equal(dict(req.form),
+                          dict(ImmutableMultiDict(form)))
+
+        class LazyRequest(wrappers.Request):
+            lazy_query_parsing = True
+        req = LazyRequest.from_values(query, data=form, method='POST')
+        self.assert_equal(req.args.getlist('a'), [u'Ab', u'c d'])
+        self.assert_equal(req.args.to_dict(), {'a': u'Ab', 'e': u'\xe9'})
+        self.assert_equal(req.form['f'], u'x y\xe9')
+
     def test_url_request_descriptors_hosts(self):
         req = wrappers.Request.from_values('/bar?foo=baz', 'http://example.com/test')
         req.trusted_hosts = ['example.com']
@@ -337,7 +354,12 @@ class WrappersTestCase(WerkzeugTestCase):
              '(KHTML, like Gecko) Version/3.0 Mobile/1A543a Safari/419.3',
              'safari', 'iphone', '419.3', 'en'),
             ('Bot Googlebot/2.1 ( http://www.googlebot.com/bot.html)',
-             'google', None, '2.1', None)
+             'google', None, '2.1', None),
+            ('Mozilla/5.0 (X11; U; Linux i686; en-US; rv:1.9b5) '
+             'Gecko/2008041514 Firefox/3.0B5', 'firefox', 'linux', '3.0B5',
+             'en-US'),
+            ('Mozilla/5.0 (compatible; MSIE 9.0; Windows NT 6.1; Trident/5.0) '
+             'Chrome/28.0', 'chrome', 'windows', '28.0', None)
         ]
         for ua, browser, platform, version, lang in user_agents:
             request = wrappers.Request({'HTTP_USER_AGENT': ua})
@@ -408,6 +430,48 @@ class WrappersTestCase(WerkzeugTestCase):
         response.make_conditional(env)
         self.assert_equal(response.content_length, 999)
 
+    def test_etag_response_mixin_ranges(self):
+        env = create_environ(headers={'Range': 'bytes=6-'})
+        response = wrappers.Response('Hello World')
+        response.add_etag()
+        response.make_conditional(env, accept_ranges=True)
+        self.assert_equal(response.status_code, 206)
+        self.assert_equal(response.headers['Accept-Ranges'], 'bytes')
+        self.assert_equal(response.headers['Content-Range'], 'bytes 6-10/11')
+        self.assert_equal(response.content_length, 5)
+        resp = wrappers.Response.from_app(response, env)
+        self.assert_equal(resp.data, b'World')
+
+        env = create_environ(headers={'Range': 'bytes=0-0,-1'})
+        response = wrappers.Response(FileWrapper(BytesIO(b'abc')),
+                                     direct_passthrough=True)
+        response.content_length = 3
+        response.make_conditional(env, accept_ranges=True)
+        self.assert_equal(response.status_code, 206)
+        self.assert_equal(response.mimetype, 'multipart/byteranges')
+        data = wrappers.Response.from_app(response, env).data
+        self.assert_equal(len(data), response.content_length)
+        self.assert_in(b'Content-Range: bytes 2-2/3\r\n\r\nc\r\n', data)
+
+        env = create_environ(headers={'Range': 'bytes=20-'})
+        response = wrappers.Response('Hello World')
+        response.make_conditional(env, accept_ranges=True)
+        self.assert_equal(response.status_code, 416)
+        self.assert_equal(response.headers['Content-Range'], 'bytes */11')
+
+        # weak etags and streamed responses are sent completely
+        env = create_environ(headers={'Range': 'bytes=0-1',
+                                      'If-Range': 'W/"x"'})
+        response = wrappers.Response('Hello World')
+        response.set_etag('x', weak=True)
+        response.make_conditional(env, accept_ranges=True)
+        self.assert_equal(response.status_code, 200)
+        response = wrappers.Response(iter([b'Hello World']),
+                                     direct_passthrough=True)
+        response.make_conditional(env, accept_ranges=True)
+        self.assert_equal(response.status_code, 200)
+        self.assert_not_in('Accept-Ranges', response.headers)
+
     def test_etag_response_mixin_freezing(self):
         class WithFreeze(wrappers.ETagResponseMixin, wrappers.BaseResponse):
             pass
@@ -17,6 +17,7 @@ from werkzeug.testsuite import WerkzeugTestCase
 from werkzeug.wrappers import BaseResponse
 from werkzeug.exceptions import BadRequest, ClientDisconnected
 from werkzeug.test import Client, create_environ, run_wsgi_app
+from werkzeug.http import parse_options_header
 from werkzeug import wsgi
 from werkzeug._compat import StringIO, BytesIO, NativeStringIO
 
@@ -55,6 +56,210 @@ class WSGIUtilsTestCase(WerkzeugTestCase):
         self.assert_equal(status, '404 NOT FOUND')
         self.assert_equal(b''.join(app_iter).strip(), b'NOT FOUND')
 
+    def test_shared_data_static_file_index(self):
+        import os
+        import gzip
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        try:
+            os.mkdir(path.join(directory, 'css'))
+            filename = path.join(directory, 'css', 'style.css')
+            with open(filename, 'wb') as f:
+                f.write(b'body { color: red }')
+            with closing(gzip.open(filename + '.gz', 'wb')) as f:
+                f.write(b'body { color: red }')
+            os.utime(filename, (1000000000, 1000000000))
+
+            app = wsgi.SharedDataMiddleware(None, {'/static': directory},
+                                            check_interval=0)
+            index = wsgi.StaticFileIndex(directory)
+            self.assert_equal(len(index), 2)
+            static_file = index.get('css/style.css')
+            self.assert_equal(static_file.mimetype, 'text/css')
+            self.assert_equal(static_file.size, 19)
+            self.assert_equal(list(static_file.encodings), ['gzip'])
+            self.assert_true(index.get('css/../css/style.css') is None)
+            self.assert_true(index.get('missing.css') is None)
+            lazy = wsgi.StaticFileIndex(directory, None, scan=False)
+            self.assert_equal(len(lazy), 0)
+            self.assert_equal(lazy.get('css/style.css').etag,
+                              static_file.etag)
+            self.assert_equal(len(lazy), 1)
+
+            app_iter, status, headers = run_wsgi_app(
+                app, create_environ('/static/css/style.css'))
+            headers = dict(headers)
+            self.assert_equal(status, '200 OK')
+            with closing(app_iter) as app_iter:
+                self.assert_equal(b''.join(app_iter), b'body { color: red }')
+            self.assert_equal(headers['Etag'], '"%s"' % static_file.etag)
+            self.assert_equal(headers['Content-Type'], 'text/css')
+            self.assert_equal(headers['Vary'], 'Accept-Encoding')
+            self.assert_not_in('Content-Encoding', headers)
+
+            # the 304 is answered from the index
+            os.chmod(filename, 0)
+            try:
+                app_iter, status, headers = run_wsgi_app(
+                    app, create_environ('/static/css/style.css', headers={
+                        'If-None-Match': '"%s"' % static_file.etag}))
+            finally:
+                os.chmod(filename, 0o644)
+            self.assert_equal(status, '304 Not Modified')
+
+            app_iter, status, headers = run_wsgi_app(
+                app, create_environ('/static/css/style.css', headers={
+                    'Accept-Encoding': 'gzip, deflate'}))
+            headers = dict(headers)
+            with closing(app_iter) as app_iter:
+                data = b''.join(app_iter)
+            self.assert_equal(headers['Content-Encoding'], 'gzip')
+            self.assert_equal(headers['Content-Length'], str(len(data)))
+            self.assert_equal(headers['Etag'], '"%s"' %
+                              static_file.encodings['gzip'].etag)
+
+            # changed files are picked up, outdated variants are ignored
+            with open(filename, 'wb') as f:
+                f.write(b'body { color: blue }')
+            os.utime(filename, (2000000000, 2000000000))
+            app_iter, status, headers = run_wsgi_app(
+                app, create_environ('/static/css/style.css', headers={
+                    'Accept-Encoding': 'gzip',
+                    'If-None-Match': '"%s"' % static_file.etag}))
+            headers = dict(headers)
+            self.assert_equal(status, '200 OK')
+            with closing(app_iter) as app_iter:
+                self.assert_equal(b''.join(app_iter), b'body { color: blue }')
+            self.assert_not_in('Content-Encoding', headers)
+            self.assert_not_equal(headers['Etag'], '"%s"' % static_file.etag)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_shared_data_byte_ranges(self):
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        try:
+            with open(path.join(directory, 'video.mp4'), 'wb') as f:
+                f.write(b'0123456789' * 10)
+            app = wsgi.SharedDataMiddleware(None, {'/': directory})
+            etag = wsgi.StaticFileIndex(directory).get('video.mp4').etag
+
+            def get(**headers):
+                app_iter, status, headers = run_wsgi_app(
+                    app, create_environ('/video.mp4', headers=headers))
+                data = b''.join(app_iter)
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+                return status, dict(headers), data
+
+            status, headers, data = get()
+            self.assert_equal(status, '200 OK')
+            self.assert_equal(headers['Accept-Ranges'], 'bytes')
+            self.assert_equal(len(data), 100)
+
+            status, headers, data = get(Range='bytes=10-14')
+            self.assert_equal(status, '206 Partial Content')
+            self.assert_equal(data, b'01234')
+            self.assert_equal(headers['Content-Range'], 'bytes 10-14/100')
+            self.assert_equal(headers['Content-Length'], '5')
+            self.assert_equal(headers['Content-Type'], 'video/mp4')
+
+            status, headers, data = get(Range='bytes=-3', If_Range='"%s"'
+                                        % etag)
+            self.assert_equal(status, '206 Partial Content')
+            self.assert_equal(data, b'789')
+
+            status, headers, data = get(Range='bytes=0-1,50-52,98-')
+            self.assert_equal(status, '206 Partial Content')
+            content_type, options = parse_options_header(
+                headers['Content-Type'])
+            self.assert_equal(content_type, 'multipart/byteranges')
+            self.assert_equal(int(headers['Content-Length']), len(data))
+            boundary = options['boundary'].encode('ascii')
+            parts = data.split(b'--' + boundary)
+            self.assert_equal(parts[0], b'')
+            self.assert_equal(parts[-1], b'--\r\n')
+            self.assert_equal(parts[2], b'\r\nContent-Type: video/mp4\r\n'
+                              b'Content-Range: bytes 50-52/100\r\n\r\n'
+                              b'012\r\n')
+            self.assert_equal([p.split(b'\r\n\r\n')[1] for p in parts[1:4]],
+                              [b'01\r\n', b'012\r\n', b'89\r\n'])
+
+            status, headers, data = get(Range='bytes=0-9', If_Range='"x"')
+            self.assert_equal(status, '200 OK')
+            self.assert_equal(len(data), 100)
+
+            status, headers, data = get(Range='bytes=100-')
+            self.assert_equal(status, '416 Requested Range Not Satisfiable')
+            self.assert_equal(headers['Content-Range'], 'bytes */100')
+        finally:
+            shutil.rmtree(directory)
+
+    def test_wrap_file_ranges(self):
+        class ServerFileWrapper(object):
+            def __init__(self, file, buffer_size):
+                self.file = file
+            def __iter__(self):
+                return iter([self.file.read()])
+
+        app_iter, headers = wsgi.wrap_file_ranges(
+            {'wsgi.file_wrapper': ServerFileWrapper}, BytesIO(b'abcdefgh'),
+            [(2, 5)], 8, 'text/plain')
+        self.assert_true(isinstance(app_iter, ServerFileWrapper))
+        self.assert_equal(list(app_iter), [b'cde'])
+        self.assert_equal(dict(headers)['Content-Range'], 'bytes 2-4/8')
+
+        app_iter, headers = wsgi.wrap_file_ranges(
+            {}, BytesIO(b'abcdefgh'), [(0, 7)], 8, 'text/plain')
+        app_iter.buffer_size = 3
+        self.assert_true(isinstance(app_iter, wsgi.FileRangeWrapper))
+        self.assert_equal(list(app_iter), [b'abc', b'def', b'g'])
+        app_iter.close()
+        self.assert_true(app_iter.file.closed)
+
+        # ranges are sliced from a memory map if there is one
+        app_iter, headers = wsgi.wrap_file_ranges(
+            {'wsgi.file_wrapper': ServerFileWrapper}, BytesIO(),
+            [(1, 2), (5, 8)], 8, 'text/plain', map=b'abcdefgh')
+        self.assert_true(isinstance(app_iter, wsgi.FileRangeWrapper))
+        data = b''.join(app_iter)
+        self.assert_in(b'bytes 1-1/8\r\n\r\nb\r\n', data)
+        self.assert_in(b'bytes 5-7/8\r\n\r\nfgh\r\n', data)
+
+    def test_file_map_cache(self):
+        import shutil
+        import tempfile
+        directory = tempfile.mkdtemp()
+        try:
+            for name in 'a', 'b', 'empty':
+                with open(path.join(directory, name), 'wb') as f:
+                    f.write(name != 'empty' and name.encode('ascii') * 10
+                            or b'')
+            index = wsgi.StaticFileIndex(directory)
+            cache = wsgi.FileMapCache(maxsize=1)
+            map_a = cache.get(index.get('a'))
+            self.assert_equal(map_a[:3], b'aaa')
+            self.assert_true(cache.get(index.get('a')) is map_a)
+            self.assert_equal(cache.get(index.get('b'))[:3], b'bbb')
+            self.assert_equal(len(cache), 1)
+            self.assert_true(cache.get(index.get('a')) is not map_a)
+            self.assert_true(cache.get(index.get('empty')) is None)
+            cache.clear()
+            self.assert_equal(len(cache), 0)
+            self.assert_true(wsgi.FileMapCache().get(index.get('a')) is None)
+
+            # truncated files are never sliced past their end
+            map_b = cache.get(index.get('b'))
+            open(path.join(directory, 'b'), 'wb').close()
+            self.assert_true(cache.get(index.get('b')) is None)
+            wrapper = wsgi.FileRangeWrapper(BytesIO(), [(0, 5)], 10,
+                                            'text/plain', map=map_b)
+            self.assert_raises(IOError, list, wrapper)
+        finally:
+            shutil.rmtree(directory)
+
     def test_get_host(self):
         env = {'HTTP_X_FORWARDED_HOST': 'example.org',
                'SERVER_NAME': 'bullshit', 'HOST_NAME': 'ignore me dammit'}
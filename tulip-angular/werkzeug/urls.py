@@ -14,8 +14,10 @@ from werkzeug._compat import text_type, PY2, to_unicode, \
      normalize_string_tuple, make_literal_wrapper, \
      fix_tuple_repr
 from werkzeug._internal import _encode_idna, _decode_idna
-from werkzeug.datastructures import MultiDict, iter_multi_items
+from werkzeug.datastructures import MultiDict, ImmutableMultiDict, \
+     LazyMultiDict, ImmutableLazyMultiDict, iter_multi_items
 from collections import namedtuple
+from functools import partial
 
 
 # A regular expression for what a valid schema looks like
@@ -278,6 +280,8 @@ class BytesURL(_URLTuple, _URLMixin):
 def _unquote_to_bytes(string, unsafe=''):
     if isinstance(string, text_type):
         string = string.encode('utf-8')
+    if b'%' not in string:
+        return string
     if isinstance(unsafe, text_type):
         unsafe = unsafe.encode('utf-8')
     unsafe = frozenset(bytearray(unsafe))
@@ -459,8 +463,9 @@ def url_unquote_plus(s, charset='utf-8', errors='replace'):
     :param errors: The error handling for the `charset` decoding.
     """
     if isinstance(s, text_type):
-        s = s.replace(u'+', u' ')
-    else:
+        if u'+' in s:
+            s = s.replace(u'+', u' ')
+    elif b'+' in s:
         s = s.replace(b'+', b' ')
     return url_unquote(s, charset, errors)
 
@@ -549,7 +554,7 @@ def iri_to_uri(iri, charset='utf-8', errors='strict'):
 
 
 def url_decode(s, charset='utf-8', decode_keys=False, include_empty=True,
-               errors='replace', separator='&', cls=None):
+               errors='replace', separator='&', cls=None, lazy=False):
     """
     Parse a querystring and return it as :class:`MultiDict`.  There is a
     difference in key decoding on different Python versions.  On Python 3
@@ -574,6 +579,9 @@ def url_decode(s, charset='utf-8', decode_keys=False, include_empty=True,
 
        The `cls` parameter was added.
 
+    .. versionchanged:: 0.10
+       The `lazy` parameter was added.
+
     :param s: a string with the query string to decode.
     :param charset: the charset of the query string.  If set to `None`
                     no unicode decoding will take place.
@@ -587,20 +595,22 @@ def url_decode(s, charset='utf-8', decode_keys=False, include_empty=True,
     :param separator: the pair separator to be used, defaults to ``&``
     :param cls: an optional dict class to use.  If this is not specified
                        or `None` the default :class:`MultiDict` is used.
+    :param lazy: if set to `True` and `cls` is :class:`MultiDict` or
+                 :class:`ImmutableMultiDict` the values are only unquoted
+                 when they are accessed, see :class:`LazyMultiDict`.
     """
-    if cls is None:
-        cls = MultiDict
     if isinstance(s, text_type) and not isinstance(separator, text_type):
         separator = separator.decode(charset or 'ascii')
     elif isinstance(s, bytes) and not isinstance(separator, bytes):
         separator = separator.encode(charset or 'ascii')
-    return cls(_url_decode_impl(s.split(separator), charset, decode_keys,
-                                include_empty, errors))
+    return _url_decode_into(cls, lazy, s.split(separator), charset,
+                            decode_keys, include_empty, errors)
 
 
 def url_decode_stream(stream, charset='utf-8', decode_keys=False,
                       include_empty=True, errors='replace', separator='&',
-                      cls=None, limit=None, return_iterator=False):
+                      cls=None, limit=None, return_iterator=False,
+                      lazy=False):
     """Works like :func:`url_decode` but decodes a stream.  The behavior
     of stream and limit follows functions like
     :func:`~werkzeug.wsgi.make_line_iter`.  The generator of pairs is
@@ -627,18 +637,41 @@ def url_decode_stream(stream, charset='utf-8', decode_keys=False,
     :param return_iterator: if set to `True` the `cls` argument is ignored
                             and an iterator over all decoded pairs is
                             returned
+    :param lazy: if set to `True` the values are unquoted on access, see
+                 :func:`url_decode`.
     """
     from werkzeug.wsgi import make_chunk_iter
+    pair_iter = make_chunk_iter(stream, separator, limit)
     if return_iterator:
-        cls = lambda x: x
-    elif cls is None:
+        return _url_decode_impl(pair_iter, charset, decode_keys,
+                                include_empty, errors)
+    return _url_decode_into(cls, lazy, pair_iter, charset, decode_keys,
+                            include_empty, errors)
+
+
+_lazy_dict_classes = {
+    None:                   LazyMultiDict,
+    MultiDict:              LazyMultiDict,
+    ImmutableMultiDict:     ImmutableLazyMultiDict
+}
+
+
+def _url_decode_into(cls, lazy, pair_iter, charset, decode_keys,
+                     include_empty, errors):
+    lazy_cls = lazy and _lazy_dict_classes.get(cls)
+    if lazy_cls:
+        return lazy_cls(_url_decode_impl(pair_iter, charset, decode_keys,
+                                         include_empty, errors, False),
+                        partial(url_unquote_plus, charset=charset,
+                                errors=errors))
+    if cls is None:
         cls = MultiDict
-    pair_iter = make_chunk_iter(stream, separator, limit)
     return cls(_url_decode_impl(pair_iter, charset, decode_keys,
                                 include_empty, errors))
 
 
-def _url_decode_impl(pair_iter, charset, decode_keys, include_empty, errors):
+def _url_decode_impl(pair_iter, charset, decode_keys, include_empty, errors,
+                     decode_values=True):
     for pair in pair_iter:
         if not pair:
             continue
@@ -654,7 +687,9 @@ def _url_decode_impl(pair_iter, charset, decode_keys, include_empty, errors):
         key = url_unquote_plus(key, charset, errors)
         if charset is not None and PY2 and not decode_keys:
             key = try_coerce_native(key)
-        yield key, url_unquote_plus(value, charset, errors)
+        if decode_values:
+            value = url_unquote_plus(value, charset, errors)
+        yield key, value
 
 
 def url_encode(obj, charset='utf-8', encode_keys=False, sort=False, key=None,
@@ -13,9 +13,17 @@
 """
 import re
 
+from werkzeug._internal import _missing
+from werkzeug.http import parsed_header_cache
+
 
 class UserAgentParser(object):
-    """A simple user agent parser.  Used by the `UserAgent`."""
+    """A simple user agent parser.  Used by the `UserAgent`.
+
+    The rules are tried in order and the first one that matches wins.
+    They are matched against the lowercased user agent so the regular
+    expressions should be written in lowercase.
+    """
 
     platforms = (
         ('iphone|ios', 'iphone'),
@@ -56,28 +64,35 @@ class UserAgentParser(object):
         ('seamonkey|mozilla', 'seamonkey')
     )
 
-    _browser_version_re = r'(?:%s)[/\sa-z(]*(\d+[.\da-z]+)?(?i)'
+    _browser_version_re = r'(?:%s)[/\sa-z(]*(\d+[.\da-z]+)?'
     _language_re = re.compile(
         r'(?:;\s*|\s+)(\b\w{2}\b(?:-\b\w{2}\b)?)\s*;|'
         r'(?:\(|\[|;)\s*(\b\w{2}\b(?:-\b\w{2}\b)?)\s*(?:\]|\)|;)'
     )
 
     def __init__(self):
-        self.platforms = [(b, re.compile(a, re.I)) for a, b in self.platforms]
+        # case sensitive searches for a literal are a lot faster than
+        # case insensitive ones, the user agent is lowercased instead
+        self.platforms = [(b, re.compile(a)) for a, b in self.platforms]
         self.browsers = [(b, re.compile(self._browser_version_re % a))
                          for a, b in self.browsers]
 
     def __call__(self, user_agent):
+        lowered = user_agent.lower()
         for platform, regex in self.platforms:
-            match = regex.search(user_agent)
+            match = regex.search(lowered)
             if match is not None:
                 break
         else:
             platform = None
         for browser, regex in self.browsers:
-            match = regex.search(user_agent)
+            match = regex.search(lowered)
             if match is not None:
                 version = match.group(1)
+                # keep the case of the version if lowercasing did not
+                # change the offsets
+                if version is not None and len(lowered) == len(user_agent):
+                    version = user_agent[match.start(1):match.end(1)]
                 break
         else:
             browser = version = None
@@ -160,8 +175,11 @@ class UserAgent(object):
         if isinstance(environ_or_string, dict):
             environ_or_string = environ_or_string.get('HTTP_USER_AGENT', '')
         self.string = environ_or_string
-        self.platform, self.browser, self.version, self.language = \
-            self._parser(environ_or_string)
+        rv = parsed_header_cache.get(self._parser, environ_or_string)
+        if rv is _missing:
+            rv = self._parser(environ_or_string)
+            parsed_header_cache.set(self._parser, environ_or_string, rv)
+        self.platform, self.browser, self.version, self.language = rv
 
     def to_header(self):
         return self.string
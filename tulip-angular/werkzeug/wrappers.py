@@ -30,13 +30,15 @@ from werkzeug.http import HTTP_STATUS_CODES, \
      parse_www_authenticate_header, remove_entity_headers, \
      parse_options_header, dump_options_header, http_date, \
      parse_if_range_header, parse_cookie, dump_cookie, \
-     parse_range_header, parse_content_range_header, dump_header
+     parse_range_header, parse_content_range_header, dump_header, \
+     get_byte_ranges
 from werkzeug.urls import url_decode, iri_to_uri, url_join
 from werkzeug.formparser import FormDataParser, default_stream_factory
 from werkzeug.utils import cached_property, environ_property, \
      header_property, get_content_type
 from werkzeug.wsgi import get_current_url, get_host, \
-     ClosingIterator, get_input_stream, get_content_length
+     ClosingIterator, get_input_stream, get_content_length, FileWrapper, \
+     FileRangeWrapper, wrap_file_ranges
 from werkzeug.datastructures import MultiDict, CombinedMultiDict, Headers, \
      EnvironHeaders, ImmutableMultiDict, ImmutableTypeConversionDict, \
      ImmutableList, MIMEAccept, CharsetAccept, LanguageAccept, \
@@ -45,7 +47,7 @@ from werkzeug.datastructures import MultiDict, CombinedMultiDict, Headers, \
 from werkzeug._internal import _get_environ
 from werkzeug._compat import to_bytes, string_types, text_type, \
      integer_types, wsgi_decoding_dance, wsgi_get_bytes, \
-     to_unicode, to_native
+     to_unicode, to_native, BytesIO
 
 
 def _run_wsgi_app(*args):
@@ -188,6 +190,15 @@ class BaseRequest(object):
     #: the form date parsing.
     form_data_parser_class = FormDataParser
 
+    #: If set to `True` the values of :attr:`args` and of url encoded
+    #: :attr:`form` data are unquoted when they are first accessed, see
+    #: :class:`~werkzeug.datastructures.LazyMultiDict`.  Code that copies
+    #: these with the C level dict API (``dict(request.args)``) then sees
+    #: undecoded values, which is why this is disabled by default.
+    #:
+    #: .. versionadded:: 0.10
+    lazy_query_parsing = False
+
     #: Optionally a list of hosts that is trusted by this request.  By default
     #: all hosts are trusted which means that whatever the client sends the
     #: host is will be accepted.  This is the recommended setup as a webserver
@@ -329,7 +340,8 @@ class BaseRequest(object):
                                            self.encoding_errors,
                                            self.max_form_memory_size,
                                            self.max_content_length,
-                                           self.parameter_storage_class)
+                                           self.parameter_storage_class,
+                                           lazy=self.lazy_query_parsing)
 
     def _load_form_data(self):
         """Method used internally to retrieve submitted data.  After calling
@@ -405,10 +417,14 @@ class BaseRequest(object):
         is returned from this function.  This can be changed by setting
         :attr:`parameter_storage_class` to a different type.  This might
         be necessary if the order of the form data is important.
+
+        If :attr:`lazy_query_parsing` is enabled values are unquoted when
+        they are first accessed.
         """
         return url_decode(wsgi_get_bytes(self.environ.get('QUERY_STRING', '')),
                           self.url_charset, errors=self.encoding_errors,
-                          cls=self.parameter_storage_class)
+                          cls=self.parameter_storage_class,
+                          lazy=self.lazy_query_parsing)
 
     @cached_property
     def data(self):
@@ -1305,7 +1321,7 @@ class ETagResponseMixin(object):
                                           on_update,
                                           ResponseCacheControl)
 
-    def make_conditional(self, request_or_environ):
+    def make_conditional(self, request_or_environ, accept_ranges=False):
         """Make the response conditional to the request.  This method works
         best if an etag was defined for the response already.  The `add_etag`
         method can be used to do that.  If called without etag just the date
@@ -1320,9 +1336,17 @@ class ETagResponseMixin(object):
         Returns self so that you can do ``return resp.make_conditional(req)``
         but modifies the object in-place.
 
+        .. versionchanged:: 0.10
+           The `accept_ranges` parameter was added.
+
         :param request_or_environ: a request object or WSGI environment to be
                                    used to make the response conditional
                                    against.
+        :param accept_ranges: set to `True` to answer byte range requests.
+                              This works for buffered responses and for
+                              responses that wrap a file with a
+                              :class:`~werkzeug.wsgi.FileWrapper` and have a
+                              content length.
         """
         environ = _get_environ(request_or_environ)
         if environ['REQUEST_METHOD'] in ('GET', 'HEAD'):
@@ -1339,8 +1363,49 @@ class ETagResponseMixin(object):
             if not is_resource_modified(environ, self.headers.get('etag'), None,
                                         self.headers.get('last-modified')):
                 self.status_code = 304
+            elif accept_ranges and self.status_code == 200:
+                self._make_range_response(environ)
         return self
 
+    def _make_range_response(self, environ):
+        if self.is_sequence:
+            file = BytesIO(self.data)
+        elif isinstance(self.response, FileWrapper):
+            file = self.response.file
+        else:
+            return
+        length = self.headers.get('content-length', type=int)
+        if length is None:
+            return
+        self.headers['Accept-Ranges'] = 'bytes'
+
+        etag, weak = self.get_etag()
+        ranges = get_byte_ranges(environ, length, not weak and etag or None,
+                                 self.headers.get('last-modified'))
+        if ranges is None:
+            return
+        if not ranges:
+            self.close()
+            self.response = []
+            self.status_code = 416
+            self.headers['Content-Range'] = 'bytes */%d' % length
+            self.headers['Content-Length'] = 0
+            return
+
+        content_type = self.headers.get('content-type',
+                                        self.default_mimetype)
+        if self.is_sequence:
+            self.response = FileRangeWrapper(file, ranges, length,
+                                             content_type)
+            headers = self.response.headers
+        else:
+            self.response, headers = wrap_file_ranges(
+                environ, file, ranges, length, content_type)
+        for key, value in headers:
+            self.headers[key] = value
+        self.status_code = 206
+        self.direct_passthrough = True
+
     def add_etag(self, overwrite=False, weak=False):
         """Add an etag for the current response if there is none yet."""
         if overwrite or 'etag' not in self.headers:
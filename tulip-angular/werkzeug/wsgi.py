@@ -11,19 +11,26 @@
 import re
 import os
 import sys
+import mmap
+import stat
 import posixpath
 import mimetypes
 from itertools import chain
+from collections import OrderedDict
+from threading import Lock
+from hashlib import md5
+from random import getrandbits
 from zlib import adler32
 from time import time, mktime
 from datetime import datetime
 from functools import partial, update_wrapper
 
-from werkzeug._compat import iteritems, text_type, string_types, \
-     implements_iterator, make_literal_wrapper, to_unicode, to_bytes, \
+from werkzeug._compat import iteritems, itervalues, text_type, \
+     string_types, implements_iterator, make_literal_wrapper, to_unicode, to_bytes, \
      wsgi_get_bytes, try_coerce_native
 from werkzeug._internal import _empty_stream, _encode_idna
-from werkzeug.http import is_resource_modified, http_date
+from werkzeug.http import is_resource_modified, http_date, \
+     parse_accept_header, get_byte_ranges
 from werkzeug.urls import uri_to_iri, url_quote, url_parse, url_join
 
 
@@ -413,6 +420,254 @@ def extract_path_info(environ_or_baseurl, path_or_url, charset='utf-8',
     return u'/' + cur_path[len(base_path):].lstrip(u'/')
 
 
+class StaticFile(object):
+    """A file in a :class:`StaticFileIndex`.  Calling it opens the file
+    and returns the ``(file, mtime, size)`` tuple that the file loaders of
+    the :class:`SharedDataMiddleware` return.
+
+    .. versionadded:: 0.10
+    """
+
+    __slots__ = ('filename', 'size', 'mtime', 'last_modified', 'etag',
+                 'mimetype', 'encodings', 'checked')
+
+    def __init__(self, filename, st, etag, mimetype, encodings=None):
+        #: the path of the file on the file system.
+        self.filename = filename
+        #: the size of the file in bytes.
+        self.size = st.st_size
+        #: the modification time as integer timestamp.
+        self.mtime = int(st.st_mtime)
+        #: the modification time as UTC datetime.
+        self.last_modified = datetime.utcfromtimestamp(self.mtime)
+        #: the md5 hexdigest of the contents.
+        self.etag = etag
+        #: the guessed mimetype.
+        self.mimetype = mimetype
+        #: a dict of precompressed variants of the file, the keys are
+        #: content encodings and the values :class:`StaticFile` objects.
+        self.encodings = encodings or {}
+        self.checked = time()
+
+    def is_current(self, st):
+        """Check if a stat result still describes this file."""
+        return st.st_size == self.size and int(st.st_mtime) == self.mtime
+
+    def __call__(self):
+        return open(self.filename, 'rb'), self.last_modified, self.size
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.filename)
+
+
+class StaticFileIndex(object):
+    """Keeps the size, modification time, a hash of the contents, the
+    mimetype and the precompressed variants of all the files below a
+    directory in memory so that static files can be served and
+    conditional requests answered without touching the file system.
+
+    The directory is scanned when the index is created unless `scan` is
+    `False`, then files are indexed when they are looked up.  Afterwards
+    :meth:`get` checks an entry with a single :func:`os.stat` call if it
+    was not checked for `check_interval` seconds and updates it if the
+    file changed.  Files that are not in the index are looked up on the
+    file system.  If `check_interval` is `None` the file system is never
+    checked again, which is what you want if the files do not change
+    while the application runs.
+
+    A file ``style.css.gz`` next to ``style.css`` that is not older than
+    it is recorded as the ``gzip`` encoded variant of ``style.css``.
+
+    .. versionadded:: 0.10
+
+    :param directory: the directory to index.
+    :param check_interval: the number of seconds an entry is trusted
+                           before it is checked again or `None`.
+    :param fallback_mimetype: the mimetype for files the :mod:`mimetypes`
+                              module does not know.
+    :param scan: set to `False` to index files only when they are looked
+                 up for the first time instead of scanning the directory.
+    """
+
+    #: the content encodings of precompressed variants and the file
+    #: suffixes they are looked up with.
+    encodings = [('gzip', '.gz')]
+
+    def __init__(self, directory, check_interval=1,
+                 fallback_mimetype='text/plain', scan=True):
+        self.directory = os.path.abspath(directory)
+        self.check_interval = check_interval
+        self.fallback_mimetype = fallback_mimetype
+        self._entries = {}
+        self._lazy = not scan
+        if scan:
+            self.scan()
+
+    def scan(self):
+        """Index all the files below the directory."""
+        entries = {}
+        for dirpath, dirnames, filenames in os.walk(self.directory):
+            prefix = os.path.relpath(dirpath, self.directory)
+            if prefix == os.curdir:
+                prefix = ''
+            else:
+                prefix = '/'.join(prefix.split(os.sep)) + '/'
+            for filename in filenames:
+                entry = self._load(prefix + filename)
+                if entry is not None:
+                    entries[prefix + filename] = entry
+        self._entries = entries
+
+    def _hash(self, filename):
+        h = md5()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(65536), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    def _load(self, path):
+        filename = os.path.join(self.directory, *path.split('/'))
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        encodings = {}
+        for encoding, suffix in self.encodings:
+            try:
+                variant_st = os.stat(filename + suffix)
+            except OSError:
+                continue
+            if stat.S_ISREG(variant_st.st_mode) and \
+               variant_st.st_mtime >= st.st_mtime:
+                encodings[encoding] = StaticFile(
+                    filename + suffix, variant_st,
+                    self._hash(filename + suffix), None)
+        mimetype = mimetypes.guess_type(filename)[0] or \
+            self.fallback_mimetype
+        return StaticFile(filename, st, self._hash(filename), mimetype,
+                          encodings)
+
+    def get(self, path):
+        """Return the :class:`StaticFile` for a path relative to the
+        directory with ``/`` as separator or `None` if there is no such
+        file.
+        """
+        entry = self._entries.get(path)
+        if self.check_interval is None and (entry is not None or
+                                            not self._lazy):
+            return entry
+        now = time()
+        if entry is not None:
+            if now - entry.checked < self.check_interval:
+                return entry
+            if self._is_current(entry):
+                entry.checked = now
+                return entry
+        elif not self._is_safe_path(path):
+            return None
+        entry = self._load(path)
+        if entry is None:
+            self._entries.pop(path, None)
+        else:
+            self._entries[path] = entry
+        return entry
+
+    def _is_current(self, entry):
+        for static_file in chain((entry,), itervalues(entry.encodings)):
+            try:
+                st = os.stat(static_file.filename)
+            except OSError:
+                return False
+            if not static_file.is_current(st):
+                return False
+        return True
+
+    def _is_safe_path(self, path):
+        for sep in os.sep, os.altsep:
+            if sep and sep != '/' and sep in path:
+                return False
+        return not any(part in ('', '.', '..') for part in path.split('/'))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path):
+        return self.get(path) is not None
+
+    def __repr__(self):
+        return '<%s %r: %d files>' % (self.__class__.__name__,
+                                      self.directory, len(self._entries))
+
+
+class FileMapCache(object):
+    """Keeps read only memory maps of the `maxsize` most recently used
+    :class:`StaticFile` objects.  Slicing a map that stays open is
+    considerably cheaper than reading from the file or mapping it for
+    every request because the pages stay mapped.  Maps that are dropped
+    are closed by the garbage collector once no response uses them
+    anymore.  Each map holds a file descriptor.
+
+    Touching the pages of a map beyond the end of a file that was
+    truncated kills the process with `SIGBUS`.  The size of a mapped file
+    is checked before a map is handed out and before every block is
+    sliced from it, but a file that is rewritten in place at the wrong
+    moment can still crash the process.  This is why the cache is
+    disabled by default.  Only enable it by setting
+    :attr:`maxsize` if the files are replaced (written to a new file that
+    is renamed) instead of being rewritten.
+
+    The process wide instance is :data:`file_map_cache`.
+
+    .. versionadded:: 0.10
+
+    :param maxsize: the maximum number of maps, `0` disables the cache.
+    """
+
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self._maps = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, static_file):
+        """Return a memory map of a :class:`StaticFile` or `None` if the
+        file cannot be mapped.
+        """
+        key = (static_file.filename, static_file.size, static_file.mtime)
+        with self._lock:
+            rv = self._maps.pop(key, None)
+        if rv is None:
+            if not self.maxsize or not static_file.size:
+                return None
+            try:
+                with open(static_file.filename, 'rb') as f:
+                    rv = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (EnvironmentError, ValueError):
+                return None
+        # the size of a map is the current size of the file on disk
+        if rv.size() != static_file.size or len(rv) != static_file.size:
+            return None
+        maps = self._maps
+        with self._lock:
+            maps[key] = rv
+            while len(maps) > self.maxsize:
+                maps.popitem(last=False)
+        return rv
+
+    def clear(self):
+        """Drop all maps."""
+        with self._lock:
+            self._maps.clear()
+
+    def __len__(self):
+        return len(self._maps)
+
+
+#: The :class:`FileMapCache` used for static files.
+file_map_cache = FileMapCache()
+
+
 class SharedDataMiddleware(object):
     """A WSGI middleware that provides static content for development
     environments or simple server setups. Usage is quite simple::
@@ -460,6 +715,12 @@ class SharedDataMiddleware(object):
     .. versionadded:: 0.6
        The `fallback_mimetype` parameter was added.
 
+    .. versionchanged:: 0.10
+       Exported folders are kept in a :class:`StaticFileIndex`, the etag
+       is the md5 hash of the file and precompressed ``.gz`` variants are
+       sent to clients that accept them.  The `check_interval` parameter
+       was added.
+
     :param app: the application to wrap.  If you don't want to wrap an
                 application you can pass it :exc:`NotFound`.
     :param exports: a dict of exported files and folders.
@@ -467,14 +728,20 @@ class SharedDataMiddleware(object):
     :param fallback_mimetype: the fallback mimetype for unknown files.
     :param cache: enable or disable caching headers.
     :Param cache_timeout: the cache timeout in seconds for the headers.
+    :param check_interval: the number of seconds the index of an exported
+                           folder trusts an entry before it checks the
+                           file again, `None` to never check.
     """
 
     def __init__(self, app, exports, disallow=None, cache=True,
-                 cache_timeout=60 * 60 * 12, fallback_mimetype='text/plain'):
+                 cache_timeout=60 * 60 * 12, fallback_mimetype='text/plain',
+                 check_interval=1):
         self.app = app
         self.exports = {}
         self.cache = cache
         self.cache_timeout = cache_timeout
+        self.fallback_mimetype = fallback_mimetype
+        self.check_interval = check_interval
         for key, value in iteritems(exports):
             if isinstance(value, tuple):
                 loader = self.get_package_loader(*value)
@@ -489,7 +756,6 @@ class SharedDataMiddleware(object):
         if disallow is not None:
             from fnmatch import fnmatch
             self.is_allowed = lambda x: not fnmatch(x, disallow)
-        self.fallback_mimetype = fallback_mimetype
 
     def is_allowed(self, filename):
         """Subclasses can override this method to disallow the access to
@@ -533,13 +799,13 @@ class SharedDataMiddleware(object):
         return loader
 
     def get_directory_loader(self, directory):
+        index = StaticFileIndex(directory, self.check_interval,
+                                self.fallback_mimetype)
         def loader(path):
             if path is not None:
-                path = os.path.join(directory, path)
-            else:
-                path = directory
-            if os.path.isfile(path):
-                return os.path.basename(path), self._opener(path)
+                static_file = index.get(path)
+                if static_file is not None:
+                    return posixpath.basename(path), static_file
             return None, None
         return loader
 
@@ -572,6 +838,9 @@ class SharedDataMiddleware(object):
                     break
         if file_loader is None or not self.is_allowed(real_filename):
             return self.app(environ, start_response)
+        if isinstance(file_loader, StaticFile):
+            return self.send_static_file(environ, start_response,
+                                         file_loader)
 
         guessed_type = mimetypes.guess_type(real_filename)
         mime_type = guessed_type[0] or self.fallback_mimetype
@@ -601,6 +870,63 @@ class SharedDataMiddleware(object):
         start_response('200 OK', headers)
         return wrap_file(environ, f)
 
+    def send_static_file(self, environ, start_response, static_file):
+        """Send a file from a :class:`StaticFileIndex`.  Conditional
+        requests are answered from the index, the file is only opened
+        if its contents are sent.  Byte range requests are answered with
+        :func:`wrap_file_ranges`.
+        """
+        variant = static_file
+        headers = [('Date', http_date()), ('Accept-Ranges', 'bytes')]
+        if static_file.encodings:
+            headers.append(('Vary', 'Accept-Encoding'))
+            accept = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+            for encoding, encoded in iteritems(static_file.encodings):
+                if accept[encoding]:
+                    variant = encoded
+                    headers.append(('Content-Encoding', encoding))
+                    break
+
+        if self.cache:
+            timeout = self.cache_timeout
+            headers += [
+                ('Etag', '"%s"' % variant.etag),
+                ('Cache-Control', 'max-age=%d, public' % timeout)
+            ]
+            if not is_resource_modified(environ, variant.etag,
+                                        last_modified=variant.last_modified):
+                start_response('304 Not Modified', headers)
+                return []
+            headers.append(('Expires', http_date(time() + timeout)))
+        else:
+            headers.append(('Cache-Control', 'public'))
+
+        headers.append(('Last-Modified', http_date(variant.mtime)))
+        ranges = get_byte_ranges(environ, variant.size, variant.etag,
+                                 variant.last_modified)
+        if ranges == []:
+            headers.extend((
+                ('Content-Range', 'bytes */%d' % variant.size),
+                ('Content-Length', '0')
+            ))
+            start_response('416 Requested Range Not Satisfiable', headers)
+            return []
+
+        f = open(variant.filename, 'rb')
+        if ranges:
+            app_iter, range_headers = wrap_file_ranges(
+                environ, f, ranges, variant.size, static_file.mimetype,
+                map=file_map_cache.get(variant))
+            start_response('206 Partial Content', headers + range_headers)
+            return app_iter
+
+        headers.extend((
+            ('Content-Type', static_file.mimetype),
+            ('Content-Length', str(variant.size))
+        ))
+        start_response('200 OK', headers)
+        return wrap_file(environ, f)
+
 
 class DispatcherMiddleware(object):
     """Allows one to mount middlewares or applications in a WSGI application.
@@ -737,6 +1063,150 @@ class FileWrapper(object):
         raise StopIteration()
 
 
+def wrap_file_ranges(environ, file, ranges, length, content_type,
+                     buffer_size=65536, map=None):
+    """Wraps byte ranges of a file for a ``206 Partial Content`` response
+    and returns an ``(app_iter, headers)`` tuple.  The headers are the
+    `Content-Type`, the `Content-Length` and, for a single range, the
+    `Content-Range` header of the response.  Multiple ranges are sent as
+    ``multipart/byteranges``.
+
+    If a memory map of the file is given, for example from the
+    :data:`file_map_cache`, the ranges are sliced from it.  Otherwise a
+    single range is passed to the WSGI server's file wrapper if it is
+    available, with the file positioned at the start of the range so that
+    servers that send files with `sendfile` still can do so.
+
+    .. versionadded:: 0.10
+
+    :param file: a :class:`file` object opened in binary mode.
+    :param ranges: a list of sorted ``(start, stop)`` tuples as returned by
+                   :func:`~werkzeug.http.get_byte_ranges`.
+    :param length: the length of the file.
+    :param content_type: the content type of the file.
+    :param buffer_size: the maximum number of bytes for one iteration.
+    :param map: an optional read only memory map of the file.
+    """
+    rv = FileRangeWrapper(file, ranges, length, content_type, buffer_size,
+                          map)
+    file_wrapper = environ.get('wsgi.file_wrapper')
+    if map is None and file_wrapper is not None and len(ranges) == 1:
+        start, stop = ranges[0]
+        return file_wrapper(_FileSlice(file, start, stop),
+                            buffer_size), rv.headers
+    return rv, rv.headers
+
+
+class _FileSlice(object):
+    """A file-like object that reads a range of a file.  The file is
+    positioned at the start of the range.
+    """
+
+    def __init__(self, file, start, stop):
+        file.seek(start)
+        self.file = file
+        self.remaining = stop - start
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        if hasattr(self.file, 'close'):
+            self.file.close()
+
+
+class FileRangeWrapper(object):
+    """Iterates over byte ranges of a file.  If a memory map of the file
+    is given the ranges are sliced from it, which needs neither a seek nor
+    a read call per block, otherwise they are read from the file.
+
+    You should not use this class directly but rather use the
+    :func:`wrap_file_ranges` function which computes the headers of the
+    response as well.
+
+    .. versionadded:: 0.10
+
+    :param file: a :class:`file` object opened in binary mode.
+    :param ranges: a list of sorted ``(start, stop)`` tuples.
+    :param length: the length of the file.
+    :param content_type: the content type of the file.
+    :param buffer_size: the maximum number of bytes for one iteration.
+    :param map: an optional read only memory map of the file.
+    """
+
+    def __init__(self, file, ranges, length, content_type,
+                 buffer_size=65536, map=None):
+        self.file = file
+        self.buffer_size = buffer_size
+        self.map = map
+        if len(ranges) == 1:
+            start, stop = ranges[0]
+            self.parts = [(b'', start, stop)]
+            self.trailer = b''
+            self.headers = [
+                ('Content-Type', content_type),
+                ('Content-Length', str(stop - start)),
+                ('Content-Range', 'bytes %d-%d/%d' % (start, stop - 1,
+                                                      length))
+            ]
+            return
+
+        boundary = '%032x' % getrandbits(128)
+        self.parts = []
+        for idx, (start, stop) in enumerate(ranges):
+            head = '%s--%s\r\nContent-Type: %s\r\n' \
+                   'Content-Range: bytes %d-%d/%d\r\n\r\n' % (
+                idx and '\r\n' or '', boundary, content_type,
+                start, stop - 1, length)
+            self.parts.append((head.encode('latin1'), start, stop))
+        self.trailer = ('\r\n--%s--\r\n' % boundary).encode('ascii')
+        content_length = len(self.trailer)
+        for head, start, stop in self.parts:
+            content_length += len(head) + stop - start
+        self.headers = [
+            ('Content-Type', 'multipart/byteranges; boundary=' + boundary),
+            ('Content-Length', str(content_length))
+        ]
+
+    def close(self):
+        # the map may be shared with other responses, it is closed when
+        # the last reference is gone.
+        self.map = None
+        if hasattr(self.file, 'close'):
+            self.file.close()
+
+    def __iter__(self):
+        map = self.map
+        if map is not None:
+            def read(start, stop):
+                # slicing past the end of a truncated file raises SIGBUS
+                if stop > getattr(map, 'size', map.__len__)():
+                    raise IOError('file was truncated while it was sent')
+                return map[start:stop]
+        else:
+            file = self.file
+            def read(start, stop):
+                file.seek(start)
+                return file.read(stop - start)
+        buffer_size = self.buffer_size
+        for head, start, stop in self.parts:
+            if head:
+                yield head
+            while start < stop:
+                end = min(start + buffer_size, stop)
+                yield read(start, end)
+                start = end
+        if self.trailer:
+            yield self.trailer
+
+
 def _make_chunk_iter(stream, limit, buffer_size):
     """Helper for the line and chunk iter functions."""
     if isinstance(stream, (bytes, bytearray, text_type)):